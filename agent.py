@@ -1,27 +1,85 @@
 # agent.py
 
+import io
 import xml.etree.ElementTree as ET
 
-def parse_alteryx_workflow(xml_string):
-    root = ET.fromstring(xml_string)
-    tools = []
+from canonical_xml import canonical_element
+from prompt_batching import estimate_tokens
+from prompts import PromptTooLargeError
+from workflow_ir import GenericTool
+
+# Version of build_prompt's output. Part of main.py's result cache keys and ETags, so bump it
+# whenever the same workflow would produce a different prompt.
+CONVERTER_VERSION = "1.1"
+
+def iter_alteryx_tools(source):
+    """
+    Streams tool records out of an Alteryx workflow without building the whole tree.
+    Each record is yielded as soon as its </Node> closes, after which the node is detached
+    and cleared, so peak memory depends on the largest single tool rather than the file size.
+    Nodes nested in tool containers are yielded before the container that holds them.
+    Args:
+        source: A file path or a binary file object containing the .yxmd XML.
+    Yields:
+        GenericTool records carrying the tool's Configuration in canonical form (see canonical_xml), which
+        drops indentation and layout so prompts do not pay for them. tool_name is the node's Tool attribute,
+        or the short name of its GuiSettings plugin in .yxmd files.
+    """
+    stack = []
+    node_depth = 0
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == "Node":
+                node_depth += 1
+            continue
 
-    for node in root.findall(".//Node"):
-        tool_id = node.get("ToolID")
-        tool_name = node.get("Tool")
-        config = node.find("Properties/Configuration")
-        if config is not None:
-            config_text = ET.tostring(config, encoding="unicode", method="xml")
-        else:
-            config_text = "No config"
-        tools.append(f"Tool {tool_id}: {tool_name}\n{config_text.strip()}")
+        stack.pop()
+        if elem.tag == "Node":
+            node_depth -= 1
+            config = elem.find("Properties/Configuration")
+            gui_settings = elem.find("GuiSettings")
+            plugin = gui_settings.get("Plugin") if gui_settings is not None else None
+            yield GenericTool(
+                tool_id=elem.get("ToolID"),
+                tool_name=elem.get("Tool") or (plugin.rsplit(".", 1)[-1] if plugin else None),
+                config_xml=canonical_element(config) if config is not None else None,
+            )
+        elif node_depth:
+            continue  # Still part of an open Node; it is released when that Node closes
 
+        # Detach the finished subtree from its parent so it can be garbage collected
+        if stack:
+            stack[-1].remove(elem)
+        elem.clear()
+
+def _format_tools(records):
+    tools = []
+    for record in records:
+        config_text = record.config_xml if record.config_xml is not None else "No config"
+        tools.append(f"Tool {record.tool_id}: {record.tool_name}\n{config_text.strip()}")
     return "\n\n".join(tools)
 
-def build_prompt(parsed_tools):
-    return f"""You are a data engineer. Given the following Alteryx tool descriptions, convert them to an equivalent BigQuery SQL query:
+def parse_alteryx_workflow(xml_string):
+    return _format_tools(iter_alteryx_tools(io.BytesIO(xml_string.encode("utf-8"))))
+
+def parse_alteryx_workflow_file(path):
+    """Same as parse_alteryx_workflow, but streams the workflow straight from disk."""
+    return _format_tools(iter_alteryx_tools(path))
+
+def build_prompt(parsed_tools, token_budget=0):
+    """
+    Builds the single prompt converting a whole workflow from parse_alteryx_workflow's output.
+    Raises PromptTooLargeError when the prompt is estimated at more than token_budget tokens (0 disables the check).
+    """
+    prompt = f"""You are a data engineer. Given the following Alteryx tool descriptions, convert them to an equivalent BigQuery SQL query:
 
 {parsed_tools}
 
 Return only the SQL code.
 """
+    tokens = estimate_tokens(prompt)
+    if token_budget > 0 and tokens > token_budget:
+        raise PromptTooLargeError(f"The workflow needs a prompt of about {tokens} tokens, more than the per-call budget of {token_budget}.")
+    return prompt
@@ -3,189 +3,766 @@
 import os
 import json
 import logging
+import queue
 import re
-from typing import Dict, Any, Tuple
-
-from vertexai.preview.generative_models import GenerativeModel, Part
-import vertexai
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+
+from canonical_xml import snippet_fingerprint, workflow_fingerprint
+from circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from model_router import ModelRouter, validate_snippet
+from model_scheduler import CallContext, ModelCallScheduler, QueueFullError
+from resilience import ResilientCaller, RetryPolicy, is_retryable
+from singleflight import SingleFlight
+from sql_cache import SnippetCache
+from prompt_batching import build_batch_prompt, estimate_tokens, pack_batches, parse_batch_response
+from prompts import PromptTooLargeError, build_tool_prompt, tool_batch_section
+from schema import DEFAULT_SOURCE_SCHEMA, Schema, SchemaCatalog, propagate_schema
+from sql_rules import quote_identifier, translate_select
+from alteryx_expr import UnsupportedExpressionError, transpile_expression
+from workflow_parser import parse_workflow
+from workflow_graph import WorkflowCycleError, WorkflowGraph
+from workflow_ir import Connection, InputTool, Tool
+
+# Version of the conversion logic (prompts, rule engine, SQL assembly). Part of every result cache
+# key and ETag, so bump it whenever the same workflow would convert to different SQL.
+CONVERTER_VERSION = "2.4"
+
+# How tools are translated: 'llm' always asks Gemini, 'rules' never does, and 'hybrid'
+# uses the deterministic generators where possible and Gemini for everything else.
+TRANSLATION_MODES = ('llm', 'hybrid', 'rules')
+
+# Leading WHERE keyword of a generated filter clause
+_WHERE_PREFIX = re.compile(r"^\s*WHERE\s+", re.IGNORECASE)
+
+# Characters not allowed in an unquoted BigQuery CTE name
+_CTE_NAME_UNSAFE = re.compile(r"[^A-Za-z0-9_]")
+
+# Output tokens budgeted per model call when generation_config sets no max_output_tokens
+_EXPECTED_OUTPUT_TOKENS = 256
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+def _source_table_name(source: Optional[InputTool]) -> str:
+    """
+    Name of the placeholder table standing in for a workflow input: the stem of the Input tool's file or table
+    (C:\\data\\orders.csv -> orders), else input_<ToolID>. Tools without an Input tool read your_initial_table.
+    """
+    if source is None:
+        return "your_initial_table"
+    if source.table:
+        stem = os.path.splitext(re.split(r"[\\/]", source.table.split("|")[0])[-1])[0]
+        name = _CTE_NAME_UNSAFE.sub("_", stem).strip("_")
+        if name:
+            return name
+    return "input_" + _CTE_NAME_UNSAFE.sub("_", source.tool_id)
+
+def _cte_name(tool_id: str) -> str:
+    """
+    Name of the CTE holding a tool's output. Derived from the ToolID rather than the tool's position, so adding a
+    tool elsewhere in the workflow renames nothing, and stored or cached snippets that name their input stay valid.
+    """
+    return "cte_" + _CTE_NAME_UNSAFE.sub("_", tool_id)
+
 class AlteryxToBigQueryAgent:
-    def __init__(self, project_id: str, location: str, model_name: str = 'gemini-1.0-pro'):
+    def __init__(self, project_id: str, location: str, model_name: str = 'gemini-1.0-pro', max_concurrency: int = 8,
+                 generation_config: Optional[Dict[str, Any]] = None, cache: Optional[SnippetCache] = None,
+                 translation_mode: str = 'hybrid', schema_catalog: Optional[SchemaCatalog] = None,
+                 batch_token_budget: int = 0, max_batch_size: int = 20, scheduler: Optional[ModelCallScheduler] = None,
+                 retry_policy: Optional[RetryPolicy] = None, circuit_breaker: Optional[CircuitBreaker] = None,
+                 result_cache: Optional[SnippetCache] = None, conversion_store: Optional[SnippetCache] = None,
+                 prompt_token_budget: Optional[int] = None, router: Optional[ModelRouter] = None):
         """
         Initializes the Alteryx to BigQuery Agent.
         Args:
             project_id: Your GCP project ID.
             location: The GCP region for Vertex AI (e.g., 'us-central1').
-            model_name: The Gemini model to use (e.g., 'gemini-1.0-pro', 'gemini-1.5-flash').
-        """
-        logging.info(f"Initializing Vertex AI with project={project_id}, location={location}")
-        vertexai.init(project=project_id, location=location)
-        self.model = GenerativeModel(model_name=model_name)
-        logging.info(f"Using Gemini model: {model_name}")
-
-    def _parse_alteryx_xml(self, xml_string: str) -> Tuple[list, str]:
-        """
-        Parses a simplified Alteryx XML string to extract tool configurations.
-        This is a basic regex-based parser for demonstration.
-        For a robust production system, consider a dedicated XML parsing library.
-        """
-        tools = []
-        message = "XML parsed successfully. Beginning conversion..."
-
-        workflow_regex = r"<AlteryxWorkflow>(.*?)</AlteryxWorkflow>"
-        workflow_content_match = re.search(workflow_regex, xml_string, re.DOTALL)
-
-        if not workflow_content_match or not workflow_content_match.group(1):
-            return [], "Error: Invalid Alteryx Workflow XML structure. Please ensure it's wrapped in <AlteryxWorkflow> tags."
-
-        inner_xml = workflow_content_match.group(1)
-
-        # Regex to find select nodes and extract attributes
-        select_regex = r"<Node ToolID=\"(\d+)\" Type=\"Select\">(.*?)</Node>"
-        for match in re.finditer(select_regex, inner_xml, re.DOTALL):
-            tool_id = match.group(1)
-            config_xml = match.group(2)
-            fields = []
-            field_regex = r"<Field Name=\"([^\"]+)\" Selected=\"([^\"]+)\"(?: Rename=\"([^\"]+)\")? />"
-            for field_match in re.finditer(field_regex, config_xml):
-                fields.append({
-                    'name': field_match.group(1),
-                    'selected': field_match.group(2) == 'True',
-                    'rename': field_match.group(3) if field_match.group(3) else None
-                })
-            tools.append({'type': 'Select', 'toolId': tool_id, 'fields': fields, 'xml_snippet': match.group(0)})
-
-        # Regex to find filter nodes and extract attributes
-        filter_regex = r"<Node ToolID=\"(\d+)\" Type=\"Filter\">(.*?)</Node>"
-        for match in re.finditer(filter_regex, inner_xml, re.DOTALL):
-            tool_id = match.group(1)
-            config_xml = match.group(2)
-            expression_match = re.search(r"<Expression>(.*?)</Expression>", config_xml, re.DOTALL)
-            expression = expression_match.group(1) if expression_match else None
-            tools.append({'type': 'Filter', 'toolId': tool_id, 'expression': expression, 'xml_snippet': match.group(0)})
-
-        # Sort tools by ToolID to maintain workflow order
-        tools.sort(key=lambda x: int(x['toolId']))
+            model_name: The Gemini model to use (e.g., 'gemini-1.0-pro', 'gemini-1.5-flash'). With routing, the strong tier.
+            max_concurrency: Maximum number of per-tool Gemini calls sent at the same time.
+            generation_config: Optional Gemini generation settings (temperature, max_output_tokens, ...).
+            cache: Cache for generated snippets. Defaults to one configured from SQL_CACHE_* env vars.
+            result_cache: Cache of complete conversion results, keyed by result_key(). Defaults to an in-memory
+                cache of RESULT_CACHE_MAX_ENTRIES results, persisted to RESULT_CACHE_PATH if set.
+            conversion_store: Last conversion of each workflow_id and of each cached result (per-tool fingerprints, input schemas and SQL),
+                used to re-translate only what changed. Defaults to an in-memory store of CONVERSION_STORE_MAX_ENTRIES
+                workflows, persisted to CONVERSION_STORE_PATH if set.
+            translation_mode: One of TRANSLATION_MODES; 'hybrid' only calls Gemini for tools the rule engine cannot handle.
+            schema_catalog: Known input schemas by file/table name. Defaults to the JSON file at SCHEMA_CATALOG_PATH.
+            batch_token_budget: When > 0, tools needing the model are packed into shared requests of at most
+                this many (estimated) input tokens. 0 sends one request per tool.
+            max_batch_size: Upper bound on the number of tools in one batched request.
+            prompt_token_budget: Maximum estimated input tokens of one per-tool prompt; a tool whose compacted prompt
+                is larger fails to convert instead of being sent. Defaults to GEMINI_PROMPT_TOKEN_BUDGET (8000); 0 disables it.
+            router: Sends simple tools to a fast model and the rest to model_name. Defaults to one configured from
+                GEMINI_FAST_MODEL and GEMINI_ROUTING_THRESHOLD; without a fast model every tool uses model_name.
+            scheduler: Rate limiter every model call goes through. Defaults to one configured from VERTEX_* env vars;
+                share one instance between agents that use the same project quota.
+            retry_policy: Retries, deadlines and hedging of model calls. Defaults to one configured from GEMINI_* env vars.
+            circuit_breaker: Fails model calls fast while Vertex AI is degraded. Defaults to one configured from
+                VERTEX_BREAKER_* env vars.
+        """
+        if translation_mode not in TRANSLATION_MODES:
+            raise ValueError(f"translation_mode must be one of {TRANSLATION_MODES}, got '{translation_mode}'")
+        self.project_id = project_id
+        self.location = location
+        self.model_name = model_name
+        # Built on first use (see _get_model): importing the Vertex AI SDK dominates cold start
+        self._models: Dict[str, Any] = {}
+        self._model_lock = threading.Lock()
+        self._vertexai_initialized = False
+        self.router = router if router is not None else ModelRouter.from_env(model_name)
+        self.max_concurrency = max(1, max_concurrency)
+        self.generation_config = generation_config
+        self.cache = cache if cache is not None else SnippetCache.from_env()
+        self.result_cache = result_cache if result_cache is not None else SnippetCache(
+            max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 1024)), disk_path=os.environ.get('RESULT_CACHE_PATH') or None)
+        self.conversion_store = conversion_store if conversion_store is not None else SnippetCache(
+            max_entries=int(os.environ.get('CONVERSION_STORE_MAX_ENTRIES', 1024)), disk_path=os.environ.get('CONVERSION_STORE_PATH') or None)
+        # Identical conversions and prompts that are already in flight are joined rather than repeated
+        self._conversions_in_flight = SingleFlight()
+        self._prompts_in_flight = SingleFlight()
+        self.translation_mode = translation_mode
+        self.batch_token_budget = batch_token_budget
+        self.max_batch_size = max(1, max_batch_size)
+        self.prompt_token_budget = prompt_token_budget if prompt_token_budget is not None else int(os.environ.get('GEMINI_PROMPT_TOKEN_BUDGET', 8000))
+        self.schema_catalog = schema_catalog if schema_catalog is not None else SchemaCatalog.load(os.environ.get('SCHEMA_CATALOG_PATH'))
+        self.scheduler = scheduler if scheduler is not None else ModelCallScheduler.from_env()
+        self.resilience = ResilientCaller(retry_policy if retry_policy is not None else RetryPolicy.from_env())
+        self.breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker.from_env()
+        max_output_tokens = generation_config.get('max_output_tokens') if isinstance(generation_config, dict) else None
+        self.expected_output_tokens = max_output_tokens or _EXPECTED_OUTPUT_TOKENS
+
+    @property
+    def model(self):
+        """The Gemini model named by model_name (the strong tier when routing)."""
+        return self._get_model(self.model_name)
+
+    def _get_model(self, model_name: str):
+        """Returns a Gemini model. The SDK is imported and Vertex AI initialized on first use, once, even under concurrent use."""
+        model = self._models.get(model_name)
+        if model is None:
+            with self._model_lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    started = time.monotonic()
+                    import vertexai
+                    from vertexai.preview.generative_models import GenerativeModel
+                    if not self._vertexai_initialized:
+                        logging.info(f"Initializing Vertex AI with project={self.project_id}, location={self.location}")
+                        vertexai.init(project=self.project_id, location=self.location)
+                        self._vertexai_initialized = True
+                    model = GenerativeModel(model_name=model_name)
+                    self._models[model_name] = model
+                    logging.info(f"Using Gemini model: {model_name} (ready in {time.monotonic() - started:.2f}s)")
+        return model
+
+    @property
+    def model_loaded(self) -> bool:
+        return self.model_name in self._models
+
+    def warm_up(self) -> threading.Thread:
+        """Loads the models of every routing tier on a background thread, so the first conversion does not pay for it."""
+        def load():
+            try:
+                for model_name in self.router.models():
+                    self._get_model(model_name)
+            except Exception as e:
+                logging.error(f"Model warm-up failed; it will be retried on first use: {e}")
 
-        if not tools:
-            message = "No recognizable 'Select' or 'Filter' tools found in the provided XML. I can only process these for now."
+        thread = threading.Thread(target=load, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
 
-        return tools, message
+    def _parse_alteryx_xml(self, xml_string: str) -> Tuple[List[Tool], List[Connection], str]:
+        """
+        Parses an Alteryx workflow XML string to extract tool configurations.
+        A single structural pass dispatches each Node to the extractor registered for its type
+        (see workflow_parser.register_tool_extractor).
+        """
+        return parse_workflow(xml_string)
 
-    def _generate_sql_snippet(self, prompt: str) -> str:
-        """Calls the Gemini model to generate a SQL snippet."""
+    def _generate_sql_snippet(self, prompt: str, context: Optional[CallContext] = None,
+                              on_text: Optional[Callable[[str], None]] = None, model_name: Optional[str] = None) -> str:
+        """
+        Calls a Gemini model (model_name by default) to generate a SQL snippet, answering repeated prompts from the cache.
+        on_text, if given, receives the answer's text chunks as Gemini streams them. It is not called
+        for cached answers or when an identical prompt already in flight is joined.
+        """
+        model_name = model_name or self.model_name
+        cache_key = SnippetCache.make_key(model_name, prompt, self.generation_config)
+        cached_snippet = self.cache.get(cache_key)
+        if cached_snippet is not None:
+            return cached_snippet
+
+        return self._prompts_in_flight.do(cache_key, self._call_model_and_cache, prompt, cache_key, context, on_text, model_name)
+
+    def _call_model_and_cache(self, prompt: str, cache_key: str, context: Optional[CallContext],
+                              on_text: Optional[Callable[[str], None]] = None, model_name: Optional[str] = None) -> str:
+        snippet = self._call_model(prompt, context, on_text, model_name)
+        self.cache.set(cache_key, snippet)
+        return snippet
+
+    def _generate_tool_sql(self, step: dict, context: Optional[CallContext] = None,
+                           on_text: Optional[Callable[[str], None]] = None) -> str:
+        """Generates one step's snippet with the model the router picked for it (see _escalate_if_invalid)."""
+        snippet = self._generate_sql_snippet(step['prompt'], context, on_text, step['model_name'])
+        return self._escalate_if_invalid(step, snippet, context)
+
+    def _escalate_if_invalid(self, step: dict, snippet: str, context: Optional[CallContext] = None) -> str:
+        """
+        Returns the snippet if it came from the strong tier or passes validation; otherwise asks the strong model,
+        whose answer is used as is. The escalated answer is not streamed: the tool event that follows carries it.
+        """
+        if step['model_name'] == self.router.strong_model:
+            return snippet
+        problem = validate_snippet(step['tool'], snippet, step['output_schema'])
+        if problem is None:
+            return snippet
+        self.router.record_escalation()
+        logging.info(f"Escalating ToolID {step['tool'].tool_id} from {step['model_name']} to {self.router.strong_model}: {problem}")
+        return self._generate_sql_snippet(step['prompt'], context, None, self.router.strong_model)
+
+    def _call_model(self, prompt: str, context: Optional[CallContext] = None,
+                    on_text: Optional[Callable[[str], None]] = None, model_name: Optional[str] = None) -> str:
+        """
+        Sends one prompt to Gemini and returns the stripped response text.
+        Every attempt waits in the scheduler until the request and token quotas allow it; transient
+        failures are retried with backoff, and slow attempts may be hedged (see resilience.RetryPolicy).
+        Raises CircuitOpenError without queueing anything while the circuit breaker is open.
+        With on_text the answer is streamed and never hedged. An attempt that timed out keeps running in the
+        background, so only the latest attempt's chunks are passed on; a retry streams its answer from the start.
+        """
+        estimated_tokens = estimate_tokens(prompt) + self.expected_output_tokens
+        gate = threading.Lock()
+        latest_attempt = [0]
+
+        def forward_if_latest(attempt: int, chunk: str) -> None:
+            with gate:
+                if latest_attempt[0] == attempt:
+                    on_text(chunk)
+
+        def start_attempt():
+            self.breaker.check()
+            attempt_on_text = None
+            if on_text is not None:
+                with gate:
+                    latest_attempt[0] += 1
+                    attempt_on_text = lambda chunk, attempt=latest_attempt[0]: forward_if_latest(attempt, chunk)
+            return self.scheduler.submit(lambda: self._send_prompt(prompt, attempt_on_text, model_name), estimated_tokens, context)
+
+        return self.resilience.call(start_attempt, hedge=on_text is None)
+
+    def _send_prompt(self, prompt: str, on_text: Optional[Callable[[str], None]] = None, model_name: Optional[str] = None) -> str:
+        self.breaker.before_call() # The breaker may have opened while this call was queued
         logging.info(f"Sending prompt to Gemini: {prompt[:100]}...")
+        started = time.monotonic()
         try:
-            response = self.model.generate_content([Part.from_text(prompt)])
-            return response.text.strip()
+            model = self._get_model(model_name or self.model_name)
+            from vertexai.preview.generative_models import Part # Already imported by self.model, so this is a lookup
+            kwargs = {'generation_config': self.generation_config} if self.generation_config else {}
+            if on_text is None:
+                snippet = model.generate_content([Part.from_text(prompt)], **kwargs).text.strip()
+            else:
+                parts = []
+                for chunk in model.generate_content([Part.from_text(prompt)], stream=True, **kwargs):
+                    parts.append(chunk.text)
+                    on_text(chunk.text)
+                snippet = "".join(parts).strip()
         except Exception as e:
+            # Only upstream trouble counts against the breaker, not e.g. a blocked response or a quota error,
+            # which reflects our own request rate rather than Vertex AI's health
+            self.breaker.record(failed=is_retryable(e), latency=time.monotonic() - started)
             logging.error(f"Error generating content from Gemini: {e}")
             raise
+        self.breaker.record(failed=False, latency=time.monotonic() - started)
+        return snippet
+
+    def _generate_sql_batch(self, steps: List[dict], context: Optional[CallContext] = None) -> Dict[str, str]:
+        """
+        Translates several tools with one Gemini request that answers in JSON keyed by ToolID.
+        Cached tools are left out of the request, and tools missing from the answer are re-asked one by one.
+        All steps must be routed to the same model; answers from the fast tier are validated like single ones.
+        Returns the SQL snippet for every step, keyed by ToolID.
+        """
+        model_name = steps[0]['model_name']
+        results = {}
+        remaining = []
+        for step in steps:
+            cached_snippet = self.cache.get(SnippetCache.make_key(model_name, step['prompt'], self.generation_config))
+            if cached_snippet is not None:
+                results[step['tool'].tool_id] = cached_snippet
+            else:
+                remaining.append(step)
+
+        if len(remaining) > 1:
+            tool_ids = [step['tool'].tool_id for step in remaining]
+            try:
+                answers = parse_batch_response(self._call_model(build_batch_prompt([step['batch_section'] for step in remaining]), context,
+                                                                model_name=model_name), tool_ids)
+            except Exception as e:
+                logging.warning(f"Batched request for ToolIDs {', '.join(tool_ids)} failed, retrying individually: {e}")
+                answers = {}
+            for step in remaining:
+                snippet = answers.get(step['tool'].tool_id)
+                if snippet is not None:
+                    results[step['tool'].tool_id] = snippet
+                    self.cache.set(SnippetCache.make_key(model_name, step['prompt'], self.generation_config), snippet)
+
+        # Re-ask only for the tools the batch did not answer
+        for step in remaining:
+            if step['tool'].tool_id not in results:
+                results[step['tool'].tool_id] = self._generate_sql_snippet(step['prompt'], context, model_name=model_name)
+        for step in steps:
+            results[step['tool'].tool_id] = self._escalate_if_invalid(step, results[step['tool'].tool_id], context)
+        return results
+
+    def _submit_generation(self, executor: ThreadPoolExecutor, steps: List[dict], context: Optional[CallContext] = None,
+                           on_text: Optional[Callable[[Tool, str], None]] = None) -> list:
+        """
+        Submits model work for every step with a prompt, i.e. without rule-based or reused SQL. Returns one entry per step:
+        None (rule-based or reused), a future of the snippet, or a future of a ToolID -> snippet dict (batched).
+        on_text(tool, chunk) receives streamed chunks of individually generated snippets; batched answers are JSON and not streamed.
+        """
+        futures = [None] * len(steps)
+        llm_indexes = [i for i, step in enumerate(steps) if step['prompt'] is not None]
+        if self.batch_token_budget > 0 and len(llm_indexes) > 1:
+            # A request goes to one model, so each routing tier is packed separately
+            indexes_by_model: Dict[str, List[int]] = {}
+            for i in llm_indexes:
+                indexes_by_model.setdefault(steps[i]['model_name'], []).append(i)
+            for indexes in indexes_by_model.values():
+                sections = [steps[i]['batch_section'] for i in indexes]
+                for batch in pack_batches(sections, self.batch_token_budget, self.max_batch_size):
+                    batch_steps = [steps[indexes[j]] for j in batch]
+                    batch_future = executor.submit(self._generate_sql_batch, batch_steps, context)
+                    for j in batch:
+                        futures[indexes[j]] = batch_future
+        else:
+            for i in llm_indexes:
+                tool_on_text = None if on_text is None else (lambda chunk, tool=steps[i]['tool']: on_text(tool, chunk))
+                futures[i] = executor.submit(self._generate_tool_sql, steps[i], context, tool_on_text)
+        return futures
+
+    @staticmethod
+    def _tool_event(tool: Tool, future) -> Dict[str, Any]:
+        """Progress event for a finished model future (a snippet, or a ToolID -> snippet dict when batched)."""
+        event = {"event": "tool", "tool_id": tool.tool_id, "kind": tool.kind, "source": "model"}
+        if future.cancelled():
+            return {**event, "status": "cancelled"}
+        if future.exception() is not None:
+            return {**event, "status": "failed", "error": str(future.exception())}
+        snippet = future.result()
+        return {**event, "status": "done", "sql": snippet[tool.tool_id] if isinstance(snippet, dict) else snippet}
+
+    def _build_prompt(self, tool: Tool, input_cte: str, input_schema: Schema) -> str:
+        """Builds the Gemini prompt translating one tool that reads from `input_cte` (see prompts.build_tool_prompt)."""
+        return build_tool_prompt(tool, input_cte, input_schema, self.prompt_token_budget)
+
+    def _translate_with_rules(self, tool: Tool, input_schema: Schema) -> Optional[str]:
+        """Returns deterministic SQL for the tool, or None if the rule engine cannot handle it."""
+        if tool.kind == 'Select':
+            return translate_select(tool.fields, input_schema)
+        if tool.kind == 'Filter' and tool.expression:
+            try:
+                return "WHERE " + transpile_expression(tool.expression, input_schema)
+            except UnsupportedExpressionError as e:
+                logging.info(f"Filter ToolID {tool.tool_id} needs the model: {e}")
+        return None
 
-    def convert_alteryx_to_sql(self, alteryx_xml: str) -> Dict[str, Any]:
+    def _resolve_source_schema(self, source: Optional[InputTool], input_schema: Optional[Schema]) -> Tuple[Schema, str]:
+        """
+        Picks the schema of a workflow input: the request's payload first, then the Input tool's
+        saved metadata, then the local catalog, and finally the built-in example schema.
+        Returns the schema and a short description of where it came from.
+        """
+        if input_schema is not None:
+            return input_schema, "the request"
+        if source is not None and source.fields:
+            return Schema.from_mapping(dict(source.fields)), f"Input ToolID {source.tool_id} metadata"
+        if source is not None:
+            catalog_schema = self.schema_catalog.lookup(source.table)
+            if catalog_schema is not None:
+                return catalog_schema, f"the schema catalog entry for '{source.table}'"
+        return DEFAULT_SOURCE_SCHEMA, "the default example schema"
+
+    def convert_alteryx_to_sql(self, alteryx_xml: str, input_schema: Optional[Dict[str, str]] = None,
+                               context: Optional[CallContext] = None, workflow_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Converts Alteryx XML to BigQuery SQL view code.
+        Successful results are cached under result_key(), and concurrent requests for the same workflow
+        share a single conversion.
         Args:
             alteryx_xml: The Alteryx XML code as a string.
+            input_schema: Optional column name -> type mapping of the workflow's input data.
+            context: Priority and caller identity used to schedule the model calls. Defaults to an interactive call.
+            workflow_id: Stable identity of the workflow across edits (e.g. its path). When given, tools that are
+                unchanged since this workflow's last conversion, and fed the same schema, reuse their SQL; only
+                changed tools and the tools downstream of them are translated again.
         Returns:
-            A dictionary containing the generated SQL and a message from the agent.
+            A dictionary containing the generated SQL and a message from the agent. "degraded" is set
+            when the model was unavailable and the rule engine stood in for it; such results are not cached.
+        Raises:
+            QueueFullError: The model call queue is full; the caller should retry later.
+            CircuitOpenError: A tool needs the model while Vertex AI is unavailable; see its retry_after.
+        """
+        key = self.result_key(alteryx_xml, input_schema)
+        cached_result = self.result_cache.get(key)
+        if cached_result is not None:
+            self._remember_conversion(workflow_id, key)
+            return json.loads(cached_result)
+        # Only callers that would run the same conversion share it: the leader records its workflow_id for
+        # incremental reuse, and schedules the model calls at its own priority
+        flight_key = (key, workflow_id, (context or CallContext()).priority)
+        result = self._conversions_in_flight.do(flight_key, self._convert_and_cache, key, alteryx_xml, input_schema, context, workflow_id)
+        return dict(result) # Each caller gets its own copy of the shared result
+
+    def result_key(self, alteryx_xml: str, input_schema: Optional[Dict[str, str]] = None) -> str:
+        """
+        Identifies the result of converting this workflow with this converter: the fingerprint of the
+        canonical workflow and input schema, the converter version, the model and the translation settings.
+        Computing it costs one XML parse; nothing is converted.
+        """
+        return SnippetCache.make_key(self.model_name, workflow_fingerprint(alteryx_xml, input_schema), self._converter_settings())
+
+    def _converter_settings(self) -> Dict[str, Any]:
+        settings = {"converter_version": CONVERTER_VERSION, "translation_mode": self.translation_mode,
+                    "generation_config": self.generation_config}
+        if self.router.enabled:
+            settings["routing"] = self.router.settings()
+        return settings
+
+    @staticmethod
+    def is_cacheable(result: Dict[str, Any]) -> bool:
+        """Whether a result may be served again for the same result_key (and advertised with an ETag)."""
+        return bool(result.get("sql")) and not result.get("degraded")
+
+    def _convert_and_cache(self, key: str, alteryx_xml: str, input_schema: Optional[Dict[str, str]],
+                           context: Optional[CallContext], workflow_id: Optional[str]) -> Dict[str, Any]:
+        result = self._convert(alteryx_xml, input_schema, context, workflow_id=workflow_id, result_key=key)
+        # Failed conversions are not cached: they may be caused by a transient model error
+        if self.is_cacheable(result):
+            self.result_cache.set(key, json.dumps(result))
+        return result
+
+    def convert_alteryx_to_sql_events(self, alteryx_xml: str, input_schema: Optional[Dict[str, str]] = None,
+                                      context: Optional[CallContext] = None, workflow_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Converts Alteryx XML like convert_alteryx_to_sql, yielding progress events as they happen:
+            {"event": "message", "message": ...}                  an agent message
+            {"event": "tool_delta", "tool_id", "kind", "text"}     a chunk of a snippet Gemini is still generating
+            {"event": "tool", "tool_id", "kind", "source", "status", "sql" or "error"}
+                                                                  one tool's snippet, as soon as it is ready; its
+                                                                  "sql" supersedes the tool's deltas (e.g. after a retry).
+                                                                  source is "rules", "model" or "previous" (reused)
+            {"event": "result", "sql", "message"}                 the final view (always the last event on success)
+            {"event": "error", "message", "retry_after"}          the conversion could not run (overload or outage)
+        A cached result is sent as the only event. Streamed conversions are not coalesced with identical
+        in-flight ones; their prompts still are.
+        If the consumer stops early, the conversion still finishes in the background and fills the cache.
         """
-        tools, parse_message = self._parse_alteryx_xml(alteryx_xml)
+        key = self.result_key(alteryx_xml, input_schema)
+        cached_result = self.result_cache.get(key)
+        if cached_result is not None:
+            self._remember_conversion(workflow_id, key)
+            yield {"event": "result", **json.loads(cached_result)}
+            return
+        events: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+
+        def run():
+            try:
+                result = self._convert(alteryx_xml, input_schema, context, events.put, workflow_id=workflow_id, result_key=key)
+                if self.is_cacheable(result):
+                    self.result_cache.set(key, json.dumps(result))
+                events.put({"event": "result", **result})
+            except Exception as e:
+                logging.error(f"Streaming conversion failed: {e}")
+                events.put({"event": "error", "message": str(e), "retry_after": getattr(e, 'retry_after', None)})
+            finally:
+                events.put(None)
+
+        threading.Thread(target=run, name="conversion-stream", daemon=True).start()
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+
+    def coalescing_stats(self) -> Dict[str, Dict[str, int]]:
+        """Counters of conversions and prompts that were joined instead of executed."""
+        return {"conversions": self._conversions_in_flight.stats(), "prompts": self._prompts_in_flight.stats()}
+
+    def convert_parsed_workflow(self, parsed: Tuple[List[Tool], List[Connection], str], input_schema: Optional[Dict[str, str]] = None,
+                                context: Optional[CallContext] = None, workflow_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Converts a workflow already parsed by workflow_parser.parse_workflow, e.g. in a worker process.
+        Takes the same workflow_id as convert_alteryx_to_sql and returns the same dictionary.
+        """
+        return self._convert(None, input_schema, context, parsed=parsed, workflow_id=workflow_id)
 
-        if not tools:
-            return {"sql": "", "message": parse_message}
+    def _conversion_store_key(self, workflow_id: str) -> str:
+        # Settings are part of the key, so a new converter version or model never reuses older SQL
+        return SnippetCache.make_key(self.model_name, f"workflow:{workflow_id}", self._converter_settings())
 
-        current_schema = {
-            "OrderID": "STRING",
-            "CustomerName": "STRING",
-            "ProductCategory": "STRING",
-            "SalesAmount": "FLOAT"
+    @staticmethod
+    def _result_records_key(result_key: str) -> str:
+        # Tool records of the conversion cached under result_key, whichever workflow_id (if any) it ran for
+        return SnippetCache.make_key("", f"result:{result_key}")
+
+    def _remember_conversion(self, workflow_id: Optional[str], result_key: str) -> None:
+        """
+        Records a cached result as workflow_id's last conversion, as if it had just been converted, so
+        the next edit of the workflow still reuses its unchanged tools.
+        """
+        if workflow_id is None:
+            return
+        records = self.conversion_store.get(self._result_records_key(result_key))
+        if records is not None:
+            self.conversion_store.set(self._conversion_store_key(workflow_id), records)
+
+    def _previous_tool_records(self, workflow_id: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        """ToolID -> record of the workflow's last successful conversion (see _tool_record), if any."""
+        if workflow_id is None:
+            return {}
+        stored = self.conversion_store.get(self._conversion_store_key(workflow_id))
+        return json.loads(stored) if stored is not None else {}
+
+    @staticmethod
+    def _tool_record(tool: Tool, origin: Optional[str], origin_anchor: Optional[str], input_cte: str,
+                     input_schema: Schema) -> Dict[str, Any]:
+        """
+        Everything a tool's snippet depends on: its canonical configuration, where its input comes from,
+        the CTE the prompt names as that input, and the input's schema.
+        """
+        return {
+            "fingerprint": snippet_fingerprint(tool.xml_snippet) if tool.span is not None else None,
+            "input": [origin, origin_anchor],
+            "input_cte": input_cte,
+            "input_schema": [list(column) for column in input_schema.items()],
         }
 
-        sql_steps = []
-        current_cte_name = "source_data"
-        agent_messages = [parse_message]
-        final_output_schema = current_schema.copy() # Track schema evolution
-
-        for i, tool in enumerate(tools):
-            prompt = ''
-            step_output_schema = current_schema.copy() # Schema for this specific step's output
-
-            if tool['type'] == 'Select':
-                select_fields = [f for f in tool['fields'] if f['selected']]
-                # Update step_output_schema based on selected and renamed fields
-                step_output_schema = {} # Reset to only selected fields
-                for f in select_fields:
-                    output_name = f['rename'] if f['rename'] else f['name']
-                    step_output_schema[output_name] = current_schema.get(f['name'], 'UNKNOWN') # Preserve type
-
-                prompt = f"""
-You are an expert Alteryx to BigQuery SQL converter.
-Translate the following Alteryx Select tool logic into a BigQuery SQL SELECT statement.
-The input data comes from a CTE named `{current_cte_name}` with the following schema:
-{json.dumps(current_schema, indent=2)}
-
-Alteryx Select Tool Configuration (XML snippet):
-{tool['xml_snippet']}
-
-Generate only the BigQuery SQL SELECT statement. Do not include any explanations or extra text.
-Ensure all selected columns are present in the output.
-"""
-                agent_messages.append(f"Agent: Processing Select Tool (ID: {tool['toolId']})...")
+    def _convert(self, alteryx_xml: Optional[str], input_schema: Optional[Dict[str, str]], context: Optional[CallContext],
+                 on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 parsed: Optional[Tuple[List[Tool], List[Connection], str]] = None,
+                 workflow_id: Optional[str] = None, result_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Runs one conversion of alteryx_xml, or of the already parsed (tools, connections, message).
+        on_event, if given, receives the progress events described in convert_alteryx_to_sql_events.
+        With a workflow_id, SQL of unchanged tools is taken from the workflow's previous conversion.
+        The tool records of a successful conversion are stored for workflow_id and, for later cache hits, for result_key.
+        """
+        emit = on_event or (lambda event: None)
+        tools, connections, parse_message = parsed if parsed is not None else self._parse_alteryx_xml(alteryx_xml)
+        emit({"event": "message", "message": parse_message})
+
+        if not tools:
+            return {"sql": "", "message": parse_message}
 
-            elif tool['type'] == 'Filter':
-                # Filter tool doesn't change schema, so step_output_schema remains current_schema
-                prompt = f"""
-You are an expert Alteryx to BigQuery SQL converter.
-Translate the following Alteryx Filter tool logic into a BigQuery SQL WHERE clause.
-The input data comes from a CTE named `{current_cte_name}` with the following schema:
-{json.dumps(current_schema, indent=2)}
+        tools_by_id = {tool.tool_id: tool for tool in tools}
+        try:
+            # Without <Connections> (e.g. hand-written snippets) the tools form a chain in ToolID order
+            graph = WorkflowGraph(tools_by_id, connections) if connections else WorkflowGraph.linear_chain(list(tools_by_id))
+            tool_order = graph.topological_order()
+        except WorkflowCycleError as e:
+            return {"sql": "", "message": f"Agent: {e}"}
+
+        request_schema = Schema.from_mapping(input_schema) if input_schema else None
+        # While Vertex AI is failing, translate whatever the rule engine can even in 'llm' mode
+        use_rules = self.translation_mode != 'llm' or self.breaker.state == OPEN
+        source_descriptions = set()
+        source_tables: Dict[Optional[str], str] = {}  # Input file/table, or ToolID (None: no Input tool) -> placeholder table
+        previous_records = self._previous_tool_records(workflow_id)
+
+        # Pass 1: walk the DAG in topological order, computing each step's input/output schema and prompt.
+        # None of the prompts depend on earlier model output, so they can all be sent at once.
+        steps = []
+        steps_by_id = {}
+        agent_messages = [parse_message]
 
-Alteryx Filter Tool Configuration (XML snippet):
-{tool['xml_snippet']}
+        def note(message: str) -> None:
+            agent_messages.append(message)
+            emit({"event": "message", "message": message})
 
-Generate only the BigQuery SQL WHERE clause, including the 'WHERE' keyword. Do not include any explanations or extra text.
-"""
-                agent_messages.append(f"Agent: Processing Filter Tool (ID: {tool['toolId']})...")
+        for tool_id in tool_order:
+            tool = tools_by_id.get(tool_id)
+            if tool is None or tool.kind == 'Input':
+                continue # Inputs and tools we don't convert (e.g. Output) are handled via their consumers
 
-            else:
+            input_cte, input_from, step_input_schema, source = "source_data", None, None, None
+            origin, origin_anchor = None, None
+            incoming = graph.incoming[tool_id]
+            if len(incoming) > 1:
                 return {
                     "sql": "",
-                    "message": f"Agent: I'm sorry, I don't recognize or support the Alteryx tool type: '{tool['type']}' (ToolID: {tool['toolId']}) yet. I can only convert 'Select' and 'Filter' tools."
+                    "message": f"Agent: ToolID {tool_id} has {len(incoming)} inputs. I can only convert single-input 'Select' and 'Filter' tools."
                 }
-
-            try:
-                generated_sql_snippet = self._generate_sql_snippet(prompt)
-            except Exception as e:
+            if incoming:
+                origin, origin_anchor, _ = incoming[0]
+                if origin in steps_by_id:
+                    upstream = steps_by_id[origin]
+                    step_input_schema = upstream['output_schema']
+                    input_cte = upstream['output_cte']
+                    if upstream['tool'].kind == 'Filter' and origin_anchor == 'False':
+                        upstream['emit_false'] = True
+                        input_cte = f"{upstream['output_cte']}_false"
+                    input_from = input_cte
+                elif isinstance(tools_by_id.get(origin), InputTool):
+                    source = tools_by_id[origin]
+                elif graph.incoming[origin]:
+                    # Fed by a tool that itself has inputs, i.e. a transformation we can't translate
+                    return {
+                        "sql": "",
+                        "message": f"Agent: I'm sorry, I don't recognize or support the Alteryx tool (ToolID: {origin}) feeding ToolID {tool_id} yet. I can only convert 'Select' and 'Filter' tools."
+                    }
+
+            if step_input_schema is None:
+                step_input_schema, description = self._resolve_source_schema(source, request_schema)
+                source_descriptions.add(description)
+                # Every distinct workflow input reads its own placeholder table; prompts still call it source_data
+                source_key = None if source is None else (source.table or f"ToolID {source.tool_id}")
+                if source_key not in source_tables:
+                    name = _source_table_name(source)
+                    if name in source_tables.values():
+                        name = f"{name}_{_CTE_NAME_UNSAFE.sub('_', source.tool_id) if source is not None else 'default'}"
+                    source_tables[source_key] = name
+                input_from = f"`your_project.your_dataset.{source_tables[source_key]}`"
+
+            if tool.kind not in ('Select', 'Filter'):
                 return {
                     "sql": "",
-                    "message": f"Agent: Failed to generate SQL for ToolID {tool['toolId']}. Error: {str(e)}"
+                    "message": f"Agent: I'm sorry, I don't recognize or support the Alteryx tool type: '{tool.kind}' (ToolID: {tool_id}) yet. I can only convert 'Select' and 'Filter' tools."
                 }
-
-            prev_cte_for_step = current_cte_name
-            next_cte_name = f"cte_{i + 1}"
-
-            if tool['type'] == 'Select':
-                sql_steps.append(f"WITH {next_cte_name} AS (\n{generated_sql_snippet}\nFROM {prev_cte_for_step}\n)")
-            elif tool['type'] == 'Filter':
-                cols_to_select = ", ".join(step_output_schema.keys()) # Use keys from the schema *before* this filter
-                sql_steps.append(f"WITH {next_cte_name} AS (\nSELECT\n    {cols_to_select}\nFROM {prev_cte_for_step}\n{generated_sql_snippet}\n)")
-
-            current_cte_name = next_cte_name
-            current_schema = step_output_schema # Update current schema for the next iteration
-            final_output_schema = current_schema # Keep track of the final schema
+            output_schema = propagate_schema(tool, step_input_schema)
+            note(f"Agent: Processing {tool.kind} Tool (ID: {tool_id})...")
+
+            # A tool is dirty if it, its input or its input's schema changed, or if a tool upstream of it is being re-translated
+            record = self._tool_record(tool, origin, origin_anchor, input_cte, step_input_schema)
+            previous = previous_records.get(tool_id)
+            upstream_dirty = origin in steps_by_id and steps_by_id[origin]['reused_sql'] is None
+            reused_sql = None
+            if previous is not None and record["fingerprint"] is not None and not upstream_dirty \
+                    and all(previous.get(name) == value for name, value in record.items()):
+                reused_sql = previous["sql"]
+
+            rule_sql = None
+            if use_rules and reused_sql is None:
+                rule_sql = self._translate_with_rules(tool, step_input_schema)
+                if rule_sql is None and self.translation_mode == 'rules':
+                    return {
+                        "sql": "",
+                        "message": f"Agent: ToolID {tool_id} ({tool.kind}) cannot be translated without the model, and translation mode is 'rules'."
+                    }
+
+            needs_model = rule_sql is None and reused_sql is None
+            try:
+                prompt = self._build_prompt(tool, input_cte, step_input_schema) if needs_model else None
+            except PromptTooLargeError as e:
+                return {"sql": "", "message": f"Agent: {e}"}
+            step = {
+                'tool': tool,
+                'prompt': prompt,
+                'batch_section': tool_batch_section(tool, input_cte, step_input_schema) if needs_model and self.batch_token_budget > 0 else None,
+                'rule_sql': rule_sql,
+                'reused_sql': reused_sql,
+                'model_name': self.router.route(tool) if needs_model else None,
+                'record': record,
+                'input_cte': input_cte,
+                'input_from': input_from,
+                'output_cte': _cte_name(tool_id),
+                'output_schema': output_schema,
+                'emit_false': False,
+            }
+            steps.append(step)
+            steps_by_id[tool_id] = step
+            if reused_sql is not None:
+                emit({"event": "tool", "tool_id": tool_id, "kind": tool.kind, "source": "previous", "status": "done", "sql": reused_sql})
+            elif rule_sql is not None:
+                emit({"event": "tool", "tool_id": tool_id, "kind": tool.kind, "source": "rules", "status": "done", "sql": rule_sql})
+
+        if not steps:
+            return {"sql": "", "message": "Agent: I processed the XML but couldn't generate any SQL steps. Please check your XML content."}
+        schema_message = f"Agent: Input schema taken from {', '.join(sorted(source_descriptions))}."
+        agent_messages.insert(1, schema_message)
+        emit({"event": "message", "message": schema_message})
+        if len(source_tables) > 1:
+            note(f"Agent: The workflow reads {len(source_tables)} inputs, each from its own placeholder table: "
+                 f"{', '.join(sorted(source_tables.values()))}.")
+        if self.translation_mode == 'llm' and use_rules:
+            note("Agent: Gemini is currently unavailable, so tools were translated by the rule engine where possible.")
+        reused_count = sum(1 for step in steps if step['reused_sql'] is not None)
+        if previous_records:
+            note(f"Agent: Reused the SQL of {reused_count} unchanged tool(s) from this workflow's previous conversion; "
+                 f"{len(steps) - reused_count} tool(s) translated again.")
+
+        # Pass 2: fan the remaining prompts out to Gemini, at most max_concurrency in flight
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(steps)))
+        try:
+            stream_text = None
+            if on_event is not None:
+                stream_text = lambda tool, chunk: emit({"event": "tool_delta", "tool_id": tool.tool_id, "kind": tool.kind, "text": chunk})
+            futures = self._submit_generation(executor, steps, context, stream_text)
+            if on_event is not None:
+                # Report each model-generated snippet the moment it arrives, in completion order
+                for step, future in zip(steps, futures):
+                    if future is not None:
+                        future.add_done_callback(lambda f, tool=step['tool']: emit(self._tool_event(tool, f)))
+
+            # Pass 3: emit one CTE per tool output in topological order; shared inputs are referenced, not copied.
+            # Reused snippets are spliced in exactly like freshly generated ones.
+            ctes = []
+            tool_records = {}
+            for step, future in zip(steps, futures):
+                tool = step['tool']
+                try:
+                    if future is None:
+                        generated_sql_snippet = step['reused_sql'] if step['reused_sql'] is not None else step['rule_sql']
+                    else:
+                        generated_sql_snippet = future.result()
+                    if isinstance(generated_sql_snippet, dict): # Batched request, keyed by ToolID
+                        generated_sql_snippet = generated_sql_snippet[tool.tool_id]
+                    tool_records[tool.tool_id] = {**step['record'], "sql": generated_sql_snippet}
+                except Exception as e:
+                    if isinstance(e, (QueueFullError, CircuitOpenError)):
+                        raise # Overload and outages are the caller's to handle (e.g. HTTP 503), not conversion failures
+                    return {
+                        "sql": "",
+                        "message": f"Agent: Failed to generate SQL for ToolID {tool.tool_id}. Error: {str(e)}"
+                    }
+
+                if tool.kind == 'Select':
+                    ctes.append(f"{step['output_cte']} AS (\n{generated_sql_snippet}\nFROM {step['input_from']}\n)")
+                elif tool.kind == 'Filter':
+                    cols_to_select = ", ".join(quote_identifier(name) for name in step['output_schema']) # Filter output columns match its input
+                    ctes.append(f"{step['output_cte']} AS (\nSELECT\n    {cols_to_select}\nFROM {step['input_from']}\n{generated_sql_snippet}\n)")
+                    if step['emit_false']:
+                        condition = _WHERE_PREFIX.sub("", generated_sql_snippet, count=1)
+                        if condition == generated_sql_snippet:
+                            return {
+                                "sql": "",
+                                "message": f"Agent: Could not derive the False output of Filter ToolID {tool.tool_id} from: {generated_sql_snippet}"
+                            }
+                        # Alteryx routes rows whose condition is NULL to the False output
+                        ctes.append(f"{step['output_cte']}_false AS (\nSELECT\n    {cols_to_select}\nFROM {step['input_from']}\nWHERE ({condition}) IS NOT TRUE\n)")
+        finally:
+            # Drop queued work and don't wait for calls already running: after a failure nobody needs their
+            # answers (they still reach the snippet cache), and on success every future is already done
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # The view selects from the last terminal tool; other terminal branches are reported
+        terminal_steps = [step for step in steps
+                          if not any(destination in steps_by_id for _, destination, _ in graph.outgoing[step['tool'].tool_id])]
+        final_step = terminal_steps[-1]
+        if len(terminal_steps) > 1:
+            other_ids = ", ".join(step['tool'].tool_id for step in terminal_steps[:-1])
+            note(f"Agent: The workflow has {len(terminal_steps)} output branches; the view selects from ToolID {final_step['tool'].tool_id}. Branches ending at ToolID {other_ids} are available as CTEs.")
 
         # Assemble the final BigQuery View SQL
         final_sql = ''
-        if sql_steps:
-            final_sql = "\n\n".join(sql_steps) # Add double newline for readability between CTEs
-            final_select_cols = ", ".join(final_output_schema.keys())
-
-            # Replace the initial source_data reference with a placeholder for the actual table
-            final_sql = final_sql.replace("FROM source_data", "FROM `your_project.your_dataset.your_initial_table`")
+        if ctes:
+            final_sql = "WITH " + ",\n\n".join(ctes) # Add double newline for readability between CTEs
+            final_select_cols = ", ".join(quote_identifier(name) for name in final_step['output_schema'])
 
             final_sql = f"""
 CREATE OR REPLACE VIEW `your_project.your_dataset.your_view_name` AS
@@ -194,13 +771,23 @@ CREATE OR REPLACE VIEW `your_project.your_dataset.your_view_name` AS
 SELECT
     {final_select_cols}
 FROM
-    {current_cte_name};
+    {final_step['output_cte']};
 """
-            agent_messages.append("Agent: Conversion completed successfully! Please review the generated SQL.")
+            note("Agent: Conversion completed successfully! Please review the generated SQL.")
         else:
-            agent_messages.append("Agent: I processed the XML but couldn't generate any SQL steps. Please check your XML content.")
-
-        return {"sql": final_sql, "message": "\n".join(agent_messages)}
+            note("Agent: I processed the XML but couldn't generate any SQL steps. Please check your XML content.")
+
+        result = {"sql": final_sql, "message": "\n".join(agent_messages)}
+        if self.translation_mode == 'llm' and use_rules:
+            result["degraded"] = True
+        elif final_sql:
+            # Rule-engine stand-ins for the model (degraded results) are never reused
+            records = json.dumps(tool_records)
+            if workflow_id is not None:
+                self.conversion_store.set(self._conversion_store_key(workflow_id), records)
+            if result_key is not None:
+                self.conversion_store.set(self._result_records_key(result_key), records)
+        return result
 
 # Example of how to use this class as a standalone script
 if __name__ == "__main__":
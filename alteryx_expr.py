@@ -0,0 +1,529 @@
+# alteryx_expr.py - Alteryx formula language to BigQuery SQL transpiler
+#
+# Tokenizes and parses Alteryx expressions (as found in Filter and Formula tools) into a
+# small immutable AST, then emits the equivalent BigQuery Standard SQL. Anything outside
+# the supported subset raises UnsupportedExpressionError so callers can fall back to the model.
+
+import functools
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from sql_rules import quote_identifier
+
+class UnsupportedExpressionError(ValueError):
+    """Raised when an expression uses syntax or functions the transpiler cannot translate."""
+
+# --- Tokenizer ---------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Token:
+    kind: str  # FIELD, STRING, NUMBER, IDENT, OP, EOF
+    value: str
+    pos: int
+
+_TOKEN_REGEX = re.compile(r"""
+    (?P<SPACE>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<FIELD>\[[^\[\]]+\])
+  | (?P<STRING>'[^']*'|"[^"]*")
+  | (?P<NUMBER>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<IDENT>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<OP>==|!=|<>|<=|>=|&&|\|\||[=<>+\-*/%!(),])
+""", re.VERBOSE | re.DOTALL)
+
+def tokenize(expression: str) -> List[Token]:
+    tokens = []
+    pos = 0
+    while pos < len(expression):
+        match = _TOKEN_REGEX.match(expression, pos)
+        if not match:
+            raise UnsupportedExpressionError(f"Unexpected character {expression[pos]!r} at position {pos}")
+        kind = match.lastgroup
+        if kind != 'SPACE':
+            tokens.append(Token(kind, match.group(), pos))
+        pos = match.end()
+    tokens.append(Token('EOF', '', pos))
+    return tokens
+
+# --- AST ---------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Literal:
+    value: object
+    kind: str  # 'string', 'number', 'bool' or 'null'
+
+@dataclass(frozen=True)
+class FieldRef:
+    name: str
+
+@dataclass(frozen=True)
+class Unary:
+    op: str  # 'NOT' or '-'
+    operand: object
+
+@dataclass(frozen=True)
+class Binary:
+    op: str  # AND, OR, =, !=, <, <=, >, >=, +, -, *, /, %
+    left: object
+    right: object
+
+@dataclass(frozen=True)
+class InList:
+    operand: object
+    items: Tuple[object, ...]
+    negated: bool
+
+@dataclass(frozen=True)
+class Call:
+    name: str  # Lower-cased function name
+    args: Tuple[object, ...]
+
+@dataclass(frozen=True)
+class Conditional:
+    branches: Tuple[Tuple[object, object], ...]  # (condition, result) pairs
+    default: Optional[object]
+
+# --- Parser ------------------------------------------------------------------
+
+_COMPARISON_OPS = {'=': '=', '==': '=', '!=': '!=', '<>': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+_KEYWORDS = {'AND', 'OR', 'NOT', 'IN', 'IF', 'THEN', 'ELSEIF', 'ELSE', 'ENDIF', 'TRUE', 'FALSE'}
+
+class _Parser:
+    """Recursive-descent parser. Precedence, loosest first: OR, AND, NOT, comparison/IN, +/-, * / %, unary minus."""
+
+    def __init__(self, expression: str):
+        self.tokens = tokenize(expression)
+        self.index = 0
+
+    def peek(self) -> Token:
+        return self.tokens[self.index]
+
+    def advance(self) -> Token:
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def at_keyword(self, *words: str) -> bool:
+        token = self.peek()
+        return token.kind == 'IDENT' and token.value.upper() in words
+
+    def at_op(self, *ops: str) -> bool:
+        token = self.peek()
+        return token.kind == 'OP' and token.value in ops
+
+    def expect_op(self, op: str) -> None:
+        if not self.at_op(op):
+            raise UnsupportedExpressionError(f"Expected '{op}' at position {self.peek().pos}")
+        self.advance()
+
+    def expect_keyword(self, word: str) -> None:
+        if not self.at_keyword(word):
+            raise UnsupportedExpressionError(f"Expected '{word}' at position {self.peek().pos}")
+        self.advance()
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek().kind != 'EOF':
+            raise UnsupportedExpressionError(f"Unexpected '{self.peek().value}' at position {self.peek().pos}")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.at_keyword('OR') or self.at_op('||'):
+            self.advance()
+            node = Binary('OR', node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.at_keyword('AND') or self.at_op('&&'):
+            self.advance()
+            node = Binary('AND', node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.at_keyword('NOT') or self.at_op('!'):
+            self.advance()
+            return Unary('NOT', self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        node = self.parse_additive()
+        while True:
+            if self.peek().kind == 'OP' and self.peek().value in _COMPARISON_OPS:
+                op = _COMPARISON_OPS[self.advance().value]
+                node = Binary(op, node, self.parse_additive())
+            elif self.at_keyword('IN') or (self.at_keyword('NOT') and self._next_is_in()):
+                negated = self.at_keyword('NOT')
+                if negated:
+                    self.advance()
+                self.advance()
+                node = InList(node, self.parse_argument_list(), negated)
+            else:
+                return node
+
+    def _next_is_in(self) -> bool:
+        token = self.tokens[self.index + 1]
+        return token.kind == 'IDENT' and token.value.upper() == 'IN'
+
+    def parse_additive(self):
+        node = self.parse_multiplicative()
+        while self.at_op('+', '-'):
+            op = self.advance().value
+            node = Binary(op, node, self.parse_multiplicative())
+        return node
+
+    def parse_multiplicative(self):
+        node = self.parse_unary()
+        while self.at_op('*', '/', '%'):
+            op = self.advance().value
+            node = Binary(op, node, self.parse_unary())
+        return node
+
+    def parse_unary(self):
+        if self.at_op('-'):
+            self.advance()
+            return Unary('-', self.parse_unary())
+        if self.at_op('+'):
+            self.advance()
+            return self.parse_unary()
+        return self.parse_primary()
+
+    def parse_argument_list(self) -> Tuple[object, ...]:
+        self.expect_op('(')
+        args = []
+        if not self.at_op(')'):
+            args.append(self.parse_or())
+            while self.at_op(','):
+                self.advance()
+                args.append(self.parse_or())
+        self.expect_op(')')
+        return tuple(args)
+
+    def parse_primary(self):
+        token = self.peek()
+        if token.kind == 'FIELD':
+            self.advance()
+            name = token.value[1:-1]
+            if ':' in name:
+                raise UnsupportedExpressionError(f"Multi-row or qualified field reference {token.value} is not supported")
+            return FieldRef(name)
+        if token.kind == 'STRING':
+            self.advance()
+            return Literal(token.value[1:-1], 'string')
+        if token.kind == 'NUMBER':
+            self.advance()
+            return Literal(token.value, 'number')
+        if self.at_op('('):
+            self.advance()
+            node = self.parse_or()
+            self.expect_op(')')
+            return node
+        if token.kind == 'IDENT':
+            word = token.value.upper()
+            if word in ('TRUE', 'FALSE'):
+                self.advance()
+                return Literal(word == 'TRUE', 'bool')
+            if word == 'IF':
+                return self.parse_if()
+            if word not in _KEYWORDS:
+                self.advance()
+                return Call(token.value.lower(), self.parse_argument_list())
+        raise UnsupportedExpressionError(f"Unexpected '{token.value or 'end of expression'}' at position {token.pos}")
+
+    def parse_if(self):
+        self.expect_keyword('IF')
+        branches = []
+        condition = self.parse_or()
+        self.expect_keyword('THEN')
+        branches.append((condition, self.parse_or()))
+        while self.at_keyword('ELSEIF'):
+            self.advance()
+            condition = self.parse_or()
+            self.expect_keyword('THEN')
+            branches.append((condition, self.parse_or()))
+        default = None
+        if self.at_keyword('ELSE'):
+            self.advance()
+            default = self.parse_or()
+        self.expect_keyword('ENDIF')
+        return Conditional(tuple(branches), default)
+
+@functools.lru_cache(maxsize=4096)
+def parse_expression(expression: str):
+    """Parses an Alteryx expression into an AST. Results are cached, so nodes are immutable."""
+    try:
+        return _Parser(expression).parse()
+    except RecursionError:
+        raise UnsupportedExpressionError("Expression is nested too deeply") from None
+
+def _children(node) -> list:
+    if isinstance(node, Unary):
+        return [node.operand]
+    if isinstance(node, Binary):
+        return [node.left, node.right]
+    if isinstance(node, InList):
+        return [node.operand, *node.items]
+    if isinstance(node, Call):
+        return list(node.args)
+    if isinstance(node, Conditional):
+        children = [part for branch in node.branches for part in branch]
+        return children + [node.default] if node.default is not None else children
+    return []
+
+def iter_nodes(node):
+    """Yields every node of the AST, depth first. Iterative, so long AND/OR chains cannot exhaust the stack."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(_children(node)))
+
+def referenced_fields(expression: str) -> List[str]:
+    """Returns the distinct field names an expression reads, in order of first use."""
+    names = []
+    for node in iter_nodes(parse_expression(expression)):
+        if isinstance(node, FieldRef) and node.name not in names:
+            names.append(node.name)
+    return names
+
+# --- BigQuery emitter --------------------------------------------------------
+
+_STRING_TYPES = {'STRING', 'V_STRING', 'V_WSTRING', 'WSTRING'}
+_DATETIME_TYPES = {'DATE', 'DATETIME', 'TIMESTAMP'}
+
+_DATE_UNITS = {
+    'year': 'YEAR', 'years': 'YEAR', 'month': 'MONTH', 'months': 'MONTH', 'week': 'WEEK', 'weeks': 'WEEK',
+    'day': 'DAY', 'days': 'DAY', 'hour': 'HOUR', 'hours': 'HOUR', 'minute': 'MINUTE', 'minutes': 'MINUTE',
+    'second': 'SECOND', 'seconds': 'SECOND',
+}
+
+# Functions that map one-to-one onto a BigQuery function: name -> (sql_name, allowed arg counts)
+_DIRECT_FUNCTIONS = {
+    'length': ('LENGTH', (1,)), 'uppercase': ('UPPER', (1,)), 'lowercase': ('LOWER', (1,)),
+    'titlecase': ('INITCAP', (1,)), 'left': ('LEFT', (2,)), 'right': ('RIGHT', (2,)),
+    'trim': ('TRIM', (1, 2)), 'trimleft': ('LTRIM', (1, 2)), 'trimright': ('RTRIM', (1, 2)),
+    'replace': ('REPLACE', (3,)), 'padleft': ('LPAD', (3,)), 'padright': ('RPAD', (3,)),
+    'reversestring': ('REVERSE', (1,)), 'abs': ('ABS', (1,)), 'ceil': ('CEIL', (1,)), 'floor': ('FLOOR', (1,)),
+    'sqrt': ('SQRT', (1,)), 'pow': ('POW', (2,)), 'mod': ('MOD', (2,)), 'exp': ('EXP', (1,)), 'log': ('LN', (1,)),
+    'log10': ('LOG10', (1,)), 'min': ('LEAST', None), 'max': ('GREATEST', None), 'coalesce': ('COALESCE', None),
+}
+
+def _string_literal(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+class _BigQueryEmitter:
+    def __init__(self, schema):
+        self.schema = schema if schema is not None else {}
+
+    def infer_type(self, node) -> Optional[str]:
+        """Best-effort static type: 'string', 'number', 'bool', 'datetime' or None if unknown."""
+        if isinstance(node, Literal):
+            return None if node.kind == 'null' else node.kind
+        if isinstance(node, FieldRef):
+            field_type = (self.schema.get(node.name) or '').upper()
+            if field_type in _STRING_TYPES:
+                return 'string'
+            if field_type in _DATETIME_TYPES:
+                return 'datetime'
+            if field_type and field_type != 'UNKNOWN':
+                return 'bool' if field_type in ('BOOL', 'BOOLEAN') else 'number'
+            return None
+        if isinstance(node, InList):
+            return 'bool'
+        if isinstance(node, Unary):
+            return 'bool' if node.op == 'NOT' else 'number'
+        if isinstance(node, Binary):
+            if node.op in ('AND', 'OR') or node.op in _COMPARISON_OPS.values():
+                return 'bool'
+            if node.op == '+' and 'string' in (self.infer_type(node.left), self.infer_type(node.right)):
+                return 'string'
+            return 'number'
+        if isinstance(node, Call):
+            if node.name in ('tostring', 'uppercase', 'lowercase', 'titlecase', 'left', 'right', 'substring',
+                             'trim', 'trimleft', 'trimright', 'replace', 'padleft', 'padright', 'reversestring'):
+                return 'string'
+            if node.name in ('contains', 'startswith', 'endswith', 'isnull', 'isempty', 'regex_match'):
+                return 'bool'
+            if node.name in ('datetimenow', 'datetimetoday', 'datetimeadd'):
+                return 'datetime'
+        return None
+
+    def emit(self, node, parent_precedence: int = 0) -> str:
+        if isinstance(node, Literal):
+            if node.kind == 'string':
+                return _string_literal(node.value)
+            if node.kind == 'bool':
+                return 'TRUE' if node.value else 'FALSE'
+            if node.kind == 'null':
+                return 'NULL'
+            return node.value
+        if isinstance(node, FieldRef):
+            return quote_identifier(node.name)
+        if isinstance(node, Unary):
+            if node.op == 'NOT':
+                return self._wrap(f"NOT {self.emit(node.operand, 3)}", 3, parent_precedence)
+            if isinstance(node.operand, (FieldRef, Call)) or (isinstance(node.operand, Literal) and node.operand.kind == 'number'):
+                return f"-{self.emit(node.operand)}"
+            return f"-({self.emit(node.operand)})"  # Avoid emitting '--', which starts a SQL comment
+        if isinstance(node, InList):
+            items = ", ".join(self.emit(item) for item in node.items)
+            keyword = "NOT IN" if node.negated else "IN"
+            return self._wrap(f"{self.emit(node.operand, 5)} {keyword} ({items})", 4, parent_precedence)
+        if isinstance(node, Binary):
+            return self.emit_binary(node, parent_precedence)
+        if isinstance(node, Call):
+            return self.emit_call(node)
+        if isinstance(node, Conditional):
+            whens = " ".join(f"WHEN {self.emit(c)} THEN {self.emit(r)}" for c, r in node.branches)
+            default = f" ELSE {self.emit(node.default)}" if node.default is not None else ""
+            return f"CASE {whens}{default} END"
+        raise UnsupportedExpressionError(f"Unsupported node {type(node).__name__}")
+
+    @staticmethod
+    def _wrap(sql: str, precedence: int, parent_precedence: int) -> str:
+        return f"({sql})" if precedence < parent_precedence else sql
+
+    def emit_binary(self, node: Binary, parent_precedence: int) -> str:
+        if node.op in ('AND', 'OR'):
+            precedence = 1 if node.op == 'OR' else 2
+            sql = f"{self.emit(node.left, precedence)} {node.op} {self.emit(node.right, precedence + 1)}"
+            return self._wrap(sql, precedence, parent_precedence)
+
+        if node.op in ('=', '!='):
+            # Alteryx compares against Null() with = / !=; SQL needs IS [NOT] NULL
+            for value, other in ((node.left, node.right), (node.right, node.left)):
+                if _is_null(other):
+                    keyword = "IS NULL" if node.op == '=' else "IS NOT NULL"
+                    return self._wrap(f"{self.emit(value, 5)} {keyword}", 4, parent_precedence)
+
+        if node.op in _COMPARISON_OPS.values():
+            sql = f"{self.emit(node.left, 5)} {node.op} {self.emit(node.right, 5)}"
+            return self._wrap(sql, 4, parent_precedence)
+
+        if node.op == '+' and self.infer_type(node) == 'string':
+            return f"CONCAT({self._concat_args(node)})"
+        if node.op == '%':
+            return f"MOD({self.emit(node.left)}, {self.emit(node.right)})"
+        precedence = 5 if node.op in ('+', '-') else 6
+        sql = f"{self.emit(node.left, precedence)} {node.op} {self.emit(node.right, precedence + 1)}"
+        return self._wrap(sql, precedence, parent_precedence)
+
+    def _concat_args(self, node) -> str:
+        # Flatten a chain of string '+' into a single CONCAT(...)
+        if isinstance(node, Binary) and node.op == '+' and self.infer_type(node) == 'string':
+            return f"{self._concat_args(node.left)}, {self._concat_args(node.right)}"
+        return self.emit(node)
+
+    def emit_call(self, node: Call) -> str:
+        name, args = node.name, node.args
+        sql_args = [self.emit(arg) for arg in args]
+
+        if name in _DIRECT_FUNCTIONS:
+            sql_name, arities = _DIRECT_FUNCTIONS[name]
+            if arities is not None and len(args) not in arities:
+                raise UnsupportedExpressionError(f"{name}() called with {len(args)} arguments")
+            return f"{sql_name}({', '.join(sql_args)})"
+
+        if name == 'null' and not args:
+            return 'NULL'
+        if name == 'iif' and len(args) == 3:
+            return f"IF({sql_args[0]}, {sql_args[1]}, {sql_args[2]})"
+        if name == 'switch' and len(args) >= 2 and len(args) % 2 == 0:
+            value, default = sql_args[0], sql_args[1]
+            whens = " ".join(f"WHEN {sql_args[i]} THEN {sql_args[i + 1]}" for i in range(2, len(args), 2))
+            return f"CASE {value} {whens} ELSE {default} END" if whens else default
+        if name == 'isnull' and len(args) == 1:
+            return f"({sql_args[0]} IS NULL)"
+        if name == 'isempty' and len(args) == 1:
+            value = sql_args[0] if self.infer_type(args[0]) == 'string' else f"CAST({sql_args[0]} AS STRING)"
+            return f"({sql_args[0]} IS NULL OR {value} = '')"
+        if name in ('contains', 'startswith', 'endswith') and len(args) in (2, 3):
+            # Alteryx string matching is case-insensitive unless the third argument is 0
+            case_insensitive = len(args) == 2 or not _is_zero(args[2])
+            haystack, needle = sql_args[0], sql_args[1]
+            if case_insensitive:
+                haystack = f"LOWER({haystack})"
+                is_literal = isinstance(args[1], Literal) and args[1].kind == 'string'
+                needle = _string_literal(args[1].value.lower()) if is_literal else f"LOWER({needle})"
+            if name == 'contains':
+                return f"STRPOS({haystack}, {needle}) > 0"
+            return f"{'STARTS_WITH' if name == 'startswith' else 'ENDS_WITH'}({haystack}, {needle})"
+        if name == 'findstring' and len(args) == 2:
+            return f"(STRPOS({sql_args[0]}, {sql_args[1]}) - 1)"  # Alteryx is 0-based, -1 when absent
+        if name == 'substring' and len(args) in (2, 3):
+            start = f"({sql_args[1]}) + 1"  # Alteryx offsets are 0-based
+            if isinstance(args[1], Literal) and args[1].kind == 'number' and args[1].value.isdigit():
+                start = str(int(args[1].value) + 1)
+            return f"SUBSTR({sql_args[0]}, {', '.join([start] + sql_args[2:])})"
+        if name == 'regex_match' and len(args) in (2, 3):
+            if not (isinstance(args[1], Literal) and args[1].kind == 'string'):
+                raise UnsupportedExpressionError("REGEX_Match() requires a literal pattern")
+            flags = "" if len(args) == 3 and _is_zero(args[2]) else "(?i)"
+            pattern = f"{flags}^(?:{args[1].value})$"  # Alteryx matches the whole string
+            return f"REGEXP_CONTAINS({sql_args[0]}, {_string_literal(pattern)})"
+        if name == 'tonumber' and len(args) == 1:
+            return f"SAFE_CAST({sql_args[0]} AS FLOAT64)"
+        if name == 'tostring' and len(args) == 1:
+            return f"CAST({sql_args[0]} AS STRING)"
+        if name == 'tostring' and len(args) == 2 and isinstance(args[1], Literal) and args[1].kind == 'number' and args[1].value.isdigit():
+            return f"FORMAT('%.{args[1].value}f', {sql_args[0]})"
+        if name == 'round' and len(args) == 2:
+            # Alteryx Round(x, mult) rounds to the nearest multiple of mult
+            return f"(ROUND(({sql_args[0]}) / ({sql_args[1]})) * ({sql_args[1]}))"
+        if name == 'datetimenow' and not args:
+            return "CURRENT_DATETIME()"
+        if name == 'datetimetoday' and not args:
+            return "DATETIME(CURRENT_DATE())"
+        if name in ('datetimeyear', 'datetimemonth', 'datetimeday', 'datetimehour', 'datetimeminutes',
+                    'datetimeseconds') and len(args) == 1:
+            part = {'datetimeyear': 'YEAR', 'datetimemonth': 'MONTH', 'datetimeday': 'DAY', 'datetimehour': 'HOUR',
+                    'datetimeminutes': 'MINUTE', 'datetimeseconds': 'SECOND'}[name]
+            return f"EXTRACT({part} FROM {self._as_datetime(args[0], sql_args[0])})"
+        if name == 'datetimeadd' and len(args) == 3:
+            unit = _date_unit(args[2])
+            return f"DATETIME_ADD({self._as_datetime(args[0], sql_args[0])}, INTERVAL {sql_args[1]} {unit})"
+        if name == 'datetimediff' and len(args) == 3:
+            unit = _date_unit(args[2])
+            return (f"DATETIME_DIFF({self._as_datetime(args[0], sql_args[0])}, "
+                    f"{self._as_datetime(args[1], sql_args[1])}, {unit})")
+
+        raise UnsupportedExpressionError(f"Function {name}() with {len(args)} arguments is not supported")
+
+    def _as_datetime(self, node, sql: str) -> str:
+        if isinstance(node, FieldRef) and (self.schema.get(node.name) or '').upper() == 'DATETIME':
+            return sql
+        if isinstance(node, Call) and node.name in ('datetimenow', 'datetimetoday', 'datetimeadd'):
+            return sql
+        return f"CAST({sql} AS DATETIME)"
+
+def _is_null(node) -> bool:
+    return (isinstance(node, Call) and node.name == 'null' and not node.args) or \
+        (isinstance(node, Literal) and node.kind == 'null')
+
+def _is_zero(node) -> bool:
+    return isinstance(node, Literal) and node.kind in ('number', 'bool') and node.value in ('0', False)
+
+def _date_unit(node) -> str:
+    if not (isinstance(node, Literal) and node.kind == 'string' and node.value.lower() in _DATE_UNITS):
+        raise UnsupportedExpressionError("Date arithmetic requires a literal unit such as 'days'")
+    return _DATE_UNITS[node.value.lower()]
+
+def transpile_expression(expression: str, schema=None) -> str:
+    """
+    Translates an Alteryx expression to a BigQuery SQL expression.
+    Args:
+        expression: The Alteryx formula text.
+        schema: Optional column name -> type mapping (dict or Schema), used to pick string vs numeric operators.
+    Returns:
+        The BigQuery SQL expression.
+    Raises:
+        UnsupportedExpressionError: If the expression uses unsupported syntax or functions.
+    """
+    if not expression or not expression.strip():
+        raise UnsupportedExpressionError("Empty expression")
+    ast = parse_expression(expression)
+    try:
+        return _BigQueryEmitter(schema).emit(ast)
+    except RecursionError:
+        raise UnsupportedExpressionError("Expression is nested too deeply") from None
@@ -0,0 +1,80 @@
+# bench_prompt_size.py - Estimated input tokens of per-tool prompts: compact builder vs the previous prompts
+#
+# The previous prompts embedded each tool's whole <Node> XML (layout, annotation, output metadata) and
+# the full input schema as indented JSON. Workflows are synthetic .yxmd-style Select -> Filter chains.
+#
+# Usage: python benchmarks/bench_prompt_size.py [--columns 10,50,200]
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from prompt_batching import estimate_tokens
+from prompts import build_tool_prompt
+from schema import Schema, propagate_schema
+from workflow_parser import parse_workflow
+
+def synthetic_workflow(column_count):
+    record_info = "".join(f'<Field name="col_{i}" type="V_String" size="254"/>' for i in range(column_count))
+    select_fields = "".join(f'<SelectField field="col_{i}" selected="{i % 3 != 0}" />' for i in range(0, column_count, 2))
+    return f"""<AlteryxDocument yxmdVer="2022.1">
+  <Nodes>
+    <Node ToolID="1">
+      <GuiSettings Plugin="AlteryxBasePluginsGui.AlteryxSelect.AlteryxSelect"><Position x="162" y="66" /></GuiSettings>
+      <Properties>
+        <Configuration><OrderChanged value="False" /><CommaDecimal value="False" />
+          <SelectFields>{select_fields}<SelectField field="*Unknown" selected="True" /></SelectFields>
+        </Configuration>
+        <Annotation DisplayMode="0"><Name /><DefaultAnnotationText /><Left value="False" /></Annotation>
+        <MetaInfo connection="Output"><RecordInfo>{record_info}</RecordInfo></MetaInfo>
+      </Properties>
+      <EngineSettings EngineDll="AlteryxBasePluginsEngine.dll" EngineDllEntryPoint="AlteryxSelect" />
+    </Node>
+    <Node ToolID="2">
+      <GuiSettings Plugin="AlteryxBasePluginsGui.Filter.Filter"><Position x="258" y="66" /></GuiSettings>
+      <Properties>
+        <Configuration><Mode>Custom</Mode><Expression>[col_1] = "A" AND !IsNull([col_5])</Expression></Configuration>
+        <Annotation DisplayMode="0"><Name /><DefaultAnnotationText>[col_1] = "A"</DefaultAnnotationText><Left value="False" /></Annotation>
+        <MetaInfo connection="True"><RecordInfo>{record_info}</RecordInfo></MetaInfo>
+      </Properties>
+      <EngineSettings EngineDll="AlteryxBasePluginsEngine.dll" EngineDllEntryPoint="AlteryxFilter" />
+    </Node>
+  </Nodes>
+  <Connections><Connection><Origin ToolID="1" Connection="Output" /><Destination ToolID="2" Connection="Input" /></Connection></Connections>
+</AlteryxDocument>"""
+
+def legacy_prompt(tool, input_cte, input_schema):
+    # Same layout as the previous AlteryxToBigQueryAgent._build_prompt, kept for comparison
+    return f"""
+You are an expert Alteryx to BigQuery SQL converter.
+Translate the following Alteryx {tool.kind} tool logic into BigQuery SQL.
+The input data comes from a CTE named `{input_cte}` with the following schema:
+{json.dumps(input_schema.to_dict(), indent=2)}
+
+Alteryx {tool.kind} Tool Configuration (XML snippet):
+{tool.xml_snippet}
+
+Generate only the BigQuery SQL. Do not include any explanations or extra text.
+"""
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Compare per-tool prompt sizes")
+    parser.add_argument("--columns", default="10,50,200", help="Comma-separated input column counts")
+    args = parser.parse_args()
+
+    print(f"{'columns':>8} {'tool':>7} {'legacy tokens':>14} {'compact tokens':>15} {'saved':>7}")
+    for column_count in (int(c) for c in args.columns.split(",")):
+        tools, _, _ = parse_workflow(synthetic_workflow(column_count))
+        schema = Schema([(f"col_{i}", "STRING") for i in range(column_count)])
+        input_cte = "source_data"
+        for tool in tools:
+            legacy = estimate_tokens(legacy_prompt(tool, input_cte, schema))
+            compact = estimate_tokens(build_tool_prompt(tool, input_cte, schema))
+            print(f"{column_count:>8} {tool.kind:>7} {legacy:>14} {compact:>15} {1 - compact / legacy:>6.0%}")
+            schema, input_cte = propagate_schema(tool, schema), "cte_1"
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,78 @@
+# bench_startup.py - Cold-start cost of the two web servers
+#
+# Each measurement runs in a fresh interpreter, like a new Cloud Run instance: the time to
+# import the server module, and the time until its health endpoint has answered once. The
+# Vertex AI SDK import, which the servers now defer to the first conversion, is measured
+# separately for reference.
+#
+# Usage: python benchmarks/bench_startup.py [--repeat 5]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Child programs print "<import seconds> <first response seconds>"
+_CHILD_PROGRAMS = {
+    "main.py (FastAPI)": """
+import time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+assert TestClient(main.app).get("/healthz").status_code == 200
+print(imported - started, time.perf_counter() - started)
+""",
+    "main2.py (Flask)": """
+import time
+started = time.perf_counter()
+import main2
+imported = time.perf_counter()
+assert main2.app.test_client().get("/healthz").status_code == 200
+print(imported - started, time.perf_counter() - started)
+""",
+    "vertexai SDK (deferred)": """
+import time
+started = time.perf_counter()
+import vertexai
+from vertexai.preview.generative_models import GenerativeModel
+from vertexai.preview.language_models import ChatModel
+print(time.perf_counter() - started, float("nan"))
+""",
+}
+
+def run_child(program):
+    completed = subprocess.run([sys.executable, "-c", program], cwd=REPO_ROOT, capture_output=True, text=True,
+                               env={**os.environ, "PYTHONPATH": REPO_ROOT})
+    if completed.returncode != 0:
+        last_line = (completed.stderr.strip().splitlines() or ["failed"])[-1]
+        return None, last_line
+    imported, first_response = completed.stdout.split()[-2:]
+    return (float(imported), float(first_response)), None
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Measure server import time and time to first response")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per measurement (median is reported)")
+    args = parser.parse_args()
+
+    print(f"{'target':<26} {'import ms':>10} {'first response ms':>18}")
+    for name, program in _CHILD_PROGRAMS.items():
+        samples = []
+        error = None
+        for _ in range(args.repeat):
+            sample, error = run_child(program)
+            if sample is None:
+                break
+            samples.append(sample)
+        if error is not None:
+            print(f"{name:<26} {'-':>10} {'-':>18}  ({error})")
+            continue
+        imported = statistics.median(s[0] for s in samples) * 1000
+        first_response = statistics.median(s[1] for s in samples) * 1000
+        print(f"{name:<26} {imported:>10.1f} {first_response:>18.1f}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,81 @@
+# bench_streaming_parser.py - Peak RSS and wall time: tree parser vs streaming iterparse parser
+#
+# Generates a synthetic workflow of roughly --size-mb megabytes (many tools, each carrying
+# an embedded data blob like a Text Input tool), then parses it in a fresh subprocess per
+# parser so each peak RSS measurement starts from a clean interpreter.
+#
+# Usage: python benchmarks/bench_streaming_parser.py [--size-mb 50]
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_ROOT)
+
+def write_synthetic_workflow(path, size_mb):
+    row = "<r><c>" + "x" * 64 + "</c><c>12345</c></r>"
+    rows_per_tool = 200
+    tool_bytes = len(row) * rows_per_tool
+    tool_count = max(1, (size_mb * 1024 * 1024) // tool_bytes)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0"?>\n<AlteryxDocument yxmdVer="2020.1">\n<Nodes>\n')
+        for tool_id in range(1, tool_count + 1):
+            f.write(f'<Node ToolID="{tool_id}" Tool="TextInput"><GuiSettings><Position x="{tool_id}" y="0" /></GuiSettings>')
+            f.write('<Properties><Configuration><Data>')
+            f.write(row * rows_per_tool)
+            f.write('</Data></Configuration></Properties></Node>\n')
+        f.write('</Nodes>\n<Connections />\n</AlteryxDocument>\n')
+    return tool_count
+
+def _parse_with_tree(path):
+    # The previous implementation: whole-document ElementTree plus a string copy per config
+    import xml.etree.ElementTree as ET
+    with open(path, encoding="utf-8") as f:
+        root = ET.fromstring(f.read())
+    count = 0
+    for node in root.findall(".//Node"):
+        config = node.find("Properties/Configuration")
+        if config is not None:
+            ET.tostring(config, encoding="unicode", method="xml")
+        count += 1
+    return count
+
+def _parse_streaming(path):
+    from agent import iter_alteryx_tools
+    return sum(1 for _ in iter_alteryx_tools(path))
+
+def _run_child(parser_name, path):
+    started = time.perf_counter()
+    count = {"tree": _parse_with_tree, "streaming": _parse_streaming}[parser_name](path)
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Kilobytes on Linux
+    print(f"{count} {elapsed:.3f} {peak_kb}")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Compare tree vs streaming workflow parsing")
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--child", nargs=2, metavar=("PARSER", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.yxmd")
+        tool_count = write_synthetic_workflow(path, args.size_mb)
+        print(f"Synthetic workflow: {os.path.getsize(path) / 1024 / 1024:.1f} MB, {tool_count} tools")
+        print(f"{'parser':>10} {'tools':>8} {'seconds':>9} {'peak RSS MB':>12}")
+        for parser_name in ("tree", "streaming"):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", parser_name, path],
+                                    check=True, capture_output=True, text=True).stdout.split()
+            count, elapsed, peak_kb = int(output[0]), float(output[1]), int(output[2])
+            print(f"{parser_name:>10} {count:>8} {elapsed:>9.2f} {peak_kb / 1024:>12.1f}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,75 @@
+# bench_workflow_parser.py - Single-pass structural parser vs the legacy per-tool-type regex scans
+#
+# Usage: python benchmarks/bench_workflow_parser.py [--repeat 20]
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from workflow_parser import parse_workflow
+
+def legacy_regex_parse(xml_string):
+    # Copy of the previous AlteryxToBigQueryAgent._parse_alteryx_xml, kept for comparison
+    tools = []
+    workflow_content_match = re.search(r"<AlteryxWorkflow>(.*?)</AlteryxWorkflow>", xml_string, re.DOTALL)
+    if not workflow_content_match or not workflow_content_match.group(1):
+        return []
+    inner_xml = workflow_content_match.group(1)
+
+    for match in re.finditer(r"<Node ToolID=\"(\d+)\" Type=\"Select\">(.*?)</Node>", inner_xml, re.DOTALL):
+        fields = []
+        field_regex = r"<Field Name=\"([^\"]+)\" Selected=\"([^\"]+)\"(?: Rename=\"([^\"]+)\")? />"
+        for field_match in re.finditer(field_regex, match.group(2)):
+            fields.append({'name': field_match.group(1), 'selected': field_match.group(2) == 'True',
+                           'rename': field_match.group(3) if field_match.group(3) else None})
+        tools.append({'type': 'Select', 'toolId': match.group(1), 'fields': fields, 'xml_snippet': match.group(0)})
+
+    for match in re.finditer(r"<Node ToolID=\"(\d+)\" Type=\"Filter\">(.*?)</Node>", inner_xml, re.DOTALL):
+        expression_match = re.search(r"<Expression>(.*?)</Expression>", match.group(2), re.DOTALL)
+        tools.append({'type': 'Filter', 'toolId': match.group(1),
+                      'expression': expression_match.group(1) if expression_match else None,
+                      'xml_snippet': match.group(0)})
+
+    tools.sort(key=lambda x: int(x['toolId']))
+    return tools
+
+def synthetic_workflow(node_count, fields_per_select=20):
+    parts = ["<AlteryxWorkflow>"]
+    for tool_id in range(1, node_count + 1):
+        if tool_id % 2:
+            fields = "".join(f'\n        <Field Name="col_{n}" Selected="True" Rename="renamed_{n}" />'
+                             for n in range(fields_per_select))
+            parts.append(f'\n  <Node ToolID="{tool_id}" Type="Select">\n    <Name>Select {tool_id}</Name>\n'
+                         f'    <Configuration>\n      <Fields>{fields}\n      </Fields>\n    </Configuration>\n  </Node>')
+        else:
+            parts.append(f'\n  <Node ToolID="{tool_id}" Type="Filter">\n    <Name>Filter {tool_id}</Name>\n'
+                         f'    <Configuration>\n      <Expression>[renamed_1] &gt; {tool_id}</Expression>\n'
+                         f'    </Configuration>\n  </Node>')
+    parts.append("\n</AlteryxWorkflow>")
+    return "".join(parts)
+
+def _time(func, xml_string, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(xml_string)
+    return (time.perf_counter() - started) / repeat * 1000
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Compare workflow parsers")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>6} {'regex ms':>10} {'single-pass ms':>15} {'speedup':>8}")
+    for node_count in (10, 100, 1000):
+        xml_string = synthetic_workflow(node_count)
+        assert len(legacy_regex_parse(xml_string)) == len(parse_workflow(xml_string)[0]) == node_count
+        regex_ms = _time(legacy_regex_parse, xml_string, args.repeat)
+        single_pass_ms = _time(parse_workflow, xml_string, args.repeat)
+        print(f"{node_count:>6} {regex_ms:>10.2f} {single_pass_ms:>15.2f} {regex_ms / single_pass_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main_cli()
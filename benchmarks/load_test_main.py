@@ -0,0 +1,72 @@
+# load_test_main.py - Load test for main.convert_workflow against a stubbed chat model
+#
+# Replaces the Vertex AI chat model with a stub that sleeps for a fixed latency, then
+# fires batches of conversions at increasing concurrency levels. With the async path the
+# throughput should scale roughly linearly until MAX_CONCURRENT_CONVERSIONS is reached.
+#
+# Usage: python benchmarks/load_test_main.py [--latency 0.2] [--requests 64]
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+EXAMPLE_XML = """<AlteryxDocument>
+  <Nodes>
+    <Node ToolID="1">
+      <GuiSettings Plugin="AlteryxBasePluginsGui.Filter.Filter" />
+      <Properties><Configuration><Expression>[SalesAmount] &gt; 1000</Expression></Configuration></Properties>
+    </Node>
+  </Nodes>
+</AlteryxDocument>"""
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+class _StubChat:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def send_message(self, prompt):
+        time.sleep(self.latency)  # Simulates a blocking SDK round-trip
+        return _StubResponse("SELECT 1")
+
+class _StubChatModel:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def start_chat(self):
+        return _StubChat(self.latency)
+
+async def _run_level(main, concurrency, total_requests):
+    main._conversion_slots = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(main.convert_workflow(EXAMPLE_XML) for _ in range(total_requests)))
+    elapsed = time.perf_counter() - started
+    return elapsed, total_requests / elapsed
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Load test main.convert_workflow against a stubbed model")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stubbed model latency in seconds")
+    parser.add_argument("--requests", type=int, default=64, help="Conversions per concurrency level")
+    parser.add_argument("--levels", default="1,4,16,32", help="Comma-separated concurrency caps")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    os.environ["MAX_CONCURRENT_CONVERSIONS"] = str(max(levels))
+    import main
+
+    # main.py builds the model lazily; presetting it means the SDK is never imported
+    main._chat_model = _StubChatModel(args.latency)
+
+    print(f"{'concurrency':>12} {'seconds':>10} {'req/s':>10}")
+    for concurrency in levels:
+        elapsed, throughput = asyncio.run(_run_level(main, concurrency, args.requests))
+        print(f"{concurrency:>12} {elapsed:>10.2f} {throughput:>10.1f}")
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,223 @@
+# bulk_convert.py - Convert a whole directory tree of Alteryx workflows to BigQuery SQL files
+#
+# Usage: python bulk_convert.py WORKFLOW_DIR --output-dir sql_out [--workers 4] [--concurrency 8]
+#
+# Workflows are read, hashed and parsed in a process pool. Conversions then run on threads that
+# share one agent, so every model call goes through the same rate-limited scheduler. A manifest
+# of workflow fingerprints in the output directory makes reruns skip inputs that were already
+# converted, including ones that were only rearranged or re-annotated in Designer since.
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from canonical_xml import workflow_fingerprint
+from model_router import ModelRouter
+from model_scheduler import CallContext, PRIORITY_BATCH
+from sql_cache import SnippetCache
+from workflow_parser import parse_workflow
+
+MANIFEST_NAME = "manifest.json"
+REPORT_NAME = "report.csv"
+# Per-tool SQL of each workflow's last conversion, so a rerun only re-translates the tools that changed
+CONVERSION_STORE_NAME = "conversions.sqlite"
+
+# How often (in finished workflows) the manifest is saved while a run is in progress
+_MANIFEST_SAVE_INTERVAL = 25
+
+def iter_workflow_files(root: str, extensions: Tuple[str, ...]) -> Iterator[str]:
+    """Yields workflow paths under root, relative to it, in a stable order."""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.lower().endswith(extensions):
+                yield os.path.relpath(os.path.join(directory, name), root)
+
+def read_and_parse(root: str, relative_path: str, known_fingerprint: Optional[str]) -> Dict[str, Any]:
+    """
+    Runs in a worker process: fingerprints the workflow and parses it unless the fingerprint equals known_fingerprint.
+    Returns a picklable dict with the fingerprint and, when parsed, the IR (tools, connections, message).
+    """
+    fingerprint = None
+    try:
+        with open(os.path.join(root, relative_path), "rb") as f:
+            data = f.read()
+        text = data.decode("utf-8-sig")
+        fingerprint = workflow_fingerprint(text)
+        if fingerprint == known_fingerprint:
+            return {"path": relative_path, "fingerprint": fingerprint, "parsed": None}
+        parsed = parse_workflow(text)
+    except Exception as e:
+        # One unreadable workflow is a failed row in the report, not the end of the migration
+        return {"path": relative_path, "fingerprint": fingerprint, "parsed": None, "error": f"Could not read workflow: {e}"}
+    return {"path": relative_path, "fingerprint": fingerprint, "parsed": parsed}
+
+class Manifest:
+    """Per-input record of the last conversion, keyed by path relative to the input directory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f).get("workflows", {})
+
+    def converted_fingerprint(self, relative_path: str, settings: Dict[str, Any]) -> Optional[str]:
+        """Fingerprint of the input as last converted successfully with the same settings, if any."""
+        entry = self.entries.get(relative_path)
+        if entry is None or entry.get("status") != "converted" or entry.get("settings") != settings:
+            return None
+        return entry.get("fingerprint")
+
+    def record(self, relative_path: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.entries[relative_path] = entry
+
+    def save(self) -> None:
+        with self._lock:
+            payload = json.dumps({"workflows": self.entries}, indent=1, sort_keys=True)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(temporary_path, self.path)  # Never leave a half-written manifest behind
+
+def sql_path_for(output_dir: str, relative_path: str) -> str:
+    return os.path.join(output_dir, os.path.splitext(relative_path)[0] + ".sql")
+
+def convert_one(agent, parsed_file: Dict[str, Any], output_dir: str) -> Dict[str, Any]:
+    """Converts one parsed workflow and writes its SQL file. Returns the manifest entry (without settings)."""
+    relative_path = parsed_file["path"]
+    started = time.monotonic()
+    entry = {"fingerprint": parsed_file["fingerprint"], "sql_file": None}
+    try:
+        if parsed_file.get("error"):
+            raise ValueError(parsed_file["error"])
+        result = agent.convert_parsed_workflow(parsed_file["parsed"], context=CallContext(PRIORITY_BATCH, "bulk_convert"),
+                                               workflow_id=relative_path)
+        if result["sql"]:
+            sql_path = sql_path_for(output_dir, relative_path)
+            os.makedirs(os.path.dirname(sql_path), exist_ok=True)
+            with open(sql_path, "w", encoding="utf-8") as f:
+                f.write(result["sql"].strip() + "\n")
+            entry.update(status="converted", sql_file=os.path.relpath(sql_path, output_dir), message=result["message"])
+        else:
+            entry.update(status="failed", message=result["message"])
+    except Exception as e:
+        entry.update(status="failed", message=str(e))
+    entry["seconds"] = round(time.monotonic() - started, 3)
+    return entry
+
+def write_report(path: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["workflow", "status", "seconds", "sql_file", "message"])
+        for relative_path, entry in rows:
+            # The last agent message is the most specific one (success, or why the conversion stopped)
+            message = (entry.get("message") or "").strip().splitlines()
+            writer.writerow([relative_path, entry["status"], entry.get("seconds", ""), entry.get("sql_file") or "", message[-1] if message else ""])
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Convert a directory tree of Alteryx workflows to BigQuery SQL files")
+    parser.add_argument("input_dir", help="Directory searched recursively for workflows")
+    parser.add_argument("--output-dir", default="converted_sql", help="Where SQL files, the manifest and the report are written")
+    parser.add_argument("--extensions", default=".yxmd,.yxmc,.yxwz", help="Comma-separated workflow file extensions")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Processes used to read and parse workflows")
+    parser.add_argument("--concurrency", type=int, default=8, help="Workflows converted at the same time")
+    parser.add_argument("--translation-mode", default="hybrid", choices=("llm", "hybrid", "rules"))
+    parser.add_argument("--model", default="gemini-1.0-pro")
+    parser.add_argument("--fast-model", default=os.environ.get('GEMINI_FAST_MODEL'),
+                        help="Model for simple tools; --model then handles complex tools and escalations")
+    parser.add_argument("--batch-token-budget", type=int, default=int(os.environ.get('GEMINI_BATCH_TOKEN_BUDGET', 0)))
+    parser.add_argument("--force", action="store_true", help="Convert every workflow, ignoring the manifest")
+    parser.add_argument("--project", default=os.environ.get('GCP_PROJECT', 'your-gcp-project-id'))
+    parser.add_argument("--location", default=os.environ.get('GCP_REGION', 'us-central1'))
+    args = parser.parse_args()
+
+    # Imported here so --help works without the Vertex AI SDK installed
+    from agent2 import CONVERTER_VERSION, AlteryxToBigQueryAgent
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(args.output_dir, MANIFEST_NAME))
+    settings = {"converter_version": CONVERTER_VERSION, "model": args.model, "translation_mode": args.translation_mode}
+    if args.fast_model:
+        settings["fast_model"] = args.fast_model
+    extensions = tuple(extension.strip().lower() for extension in args.extensions.split(",") if extension.strip())
+    paths = list(iter_workflow_files(args.input_dir, extensions))
+    logging.info(f"Found {len(paths)} workflow(s) under {args.input_dir}")
+
+    # Model calls from all conversion threads share this agent's scheduler, cache and circuit breaker
+    agent = AlteryxToBigQueryAgent(args.project, args.location, model_name=args.model,
+                                   translation_mode=args.translation_mode, batch_token_budget=args.batch_token_budget,
+                                   router=ModelRouter(args.model, args.fast_model,
+                                                      int(os.environ.get('GEMINI_ROUTING_THRESHOLD', 12))),
+                                   conversion_store=SnippetCache(max_entries=256, ttl_seconds=None, max_disk_entries=None,
+                                                                 disk_path=os.path.join(args.output_dir, CONVERSION_STORE_NAME)))
+
+    rows: List[Tuple[str, Dict[str, Any]]] = []
+    skipped = 0
+    finished = 0
+    started = time.monotonic()
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as parse_pool, \
+                ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as convert_pool:
+            parse_futures = {parse_pool.submit(read_and_parse, args.input_dir, path,
+                                               None if args.force else manifest.converted_fingerprint(path, settings)): path
+                             for path in paths}
+            convert_futures = {}
+            # Conversions start as soon as each workflow is parsed
+            for future in as_completed(parse_futures):
+                try:
+                    parsed_file = future.result()
+                except Exception as e:
+                    # The worker itself failed, e.g. its result could not be sent back
+                    parsed_file = {"path": parse_futures[future], "fingerprint": None, "parsed": None,
+                                   "error": f"Could not read workflow: {e}"}
+                if parsed_file["parsed"] is None and not parsed_file.get("error"):
+                    skipped += 1  # Unchanged since its last successful conversion
+                    rows.append((parsed_file["path"], {**manifest.entries[parsed_file["path"]], "status": "unchanged", "seconds": 0}))
+                    continue
+                convert_futures[convert_pool.submit(convert_one, agent, parsed_file, args.output_dir)] = parsed_file["path"]
+
+            for future in as_completed(convert_futures):
+                relative_path = convert_futures[future]
+                entry = {**future.result(), "settings": settings}
+                manifest.record(relative_path, entry)
+                rows.append((relative_path, entry))
+                finished += 1
+                if entry["status"] != "converted":
+                    lines = (entry.get("message") or "").strip().splitlines()
+                    logging.warning(f"{relative_path}: {lines[-1] if lines else 'failed'}")
+                if finished % _MANIFEST_SAVE_INTERVAL == 0:
+                    manifest.save()
+                    logging.info(f"{finished}/{len(convert_futures)} workflow(s) converted")
+    finally:
+        # Also reached on Ctrl-C, so an interrupted run resumes where it stopped
+        manifest.save()
+
+    rows.sort()
+    report_path = os.path.join(args.output_dir, REPORT_NAME)
+    write_report(report_path, rows)
+
+    converted = sum(1 for _, entry in rows if entry["status"] == "converted")
+    failed = sum(1 for _, entry in rows if entry["status"] == "failed")
+    elapsed = time.monotonic() - started
+    print(f"{'workflows found':<22}{len(paths):>8}")
+    print(f"{'skipped (unchanged)':<22}{skipped:>8}")
+    print(f"{'converted':<22}{converted:>8}")
+    print(f"{'failed':<22}{failed:>8}")
+    print(f"{'elapsed (s)':<22}{elapsed:>8.1f}")
+    print(f"{'model calls':<22}{agent.scheduler.stats()['dispatched']:>8}")
+    print(f"\nReport: {report_path}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main_cli()
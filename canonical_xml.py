@@ -0,0 +1,102 @@
+# canonical_xml.py - Canonical form and fingerprints of Alteryx workflow XML
+#
+# Designer rewrites a lot of a workflow that has no bearing on the SQL it converts to: canvas
+# positions, annotations and labels, attribute order, indentation. Cache keys are built on the
+# canonical form instead of the raw text, so those edits no longer miss the caches.
+
+import functools
+import hashlib
+import json
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+# Elements dropped wherever they appear: canvas layout and the text shown next to a tool
+PRESENTATION_TAGS = frozenset({"Position", "Annotation"})
+
+# Parents whose <Name> child is only a label: a tool's caption, or the workflow's display name
+_LABELLED_TAGS = frozenset({"Node", "MetaInfo"})
+
+# Whitespace between tags, which never changes what a workflow means
+_INTER_TAG_WHITESPACE = re.compile(r">\s+<")
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _write(element: ET.Element, out: list, omit_attributes: frozenset = frozenset()) -> None:
+    tag = element.tag
+    if tag == "GuiSettings":
+        # Only the plugin matters: it is how .yxmd files name the tool type
+        plugin = element.get("Plugin")
+        out.append(f"<GuiSettings Plugin={quoteattr(plugin)}/>" if plugin is not None else "<GuiSettings/>")
+        return
+
+    out.append("<" + tag)
+    for name in sorted(element.attrib):
+        if name not in omit_attributes:
+            out.append(f" {name}={quoteattr(element.attrib[name])}")
+
+    children = [child for child in element
+                if child.tag not in PRESENTATION_TAGS and not (child.tag == "Name" and tag in _LABELLED_TAGS)]
+    text = element.text or ""
+    if children and not text.strip():
+        text = ""  # Indentation before the first child
+    if not children and not text:
+        out.append("/>")
+        return
+    out.append(">" + escape(text))
+    # Text after a child element (its tail) is indentation in every format Designer writes, so it is skipped
+    for child in children:
+        _write(child, out)
+    out.append(f"</{tag}>")
+
+def canonical_element(element: ET.Element, omit_attributes: frozenset = frozenset()) -> str:
+    """
+    Serializes an element canonically: presentation-only elements removed, GuiSettings reduced to its
+    Plugin, attributes sorted, and indentation between elements dropped. Text inside elements is kept
+    verbatim, since whitespace in a value (a delimiter, a string literal) can be significant.
+    Args:
+        element: The element to serialize.
+        omit_attributes: Attributes of the element itself (not its descendants) to leave out.
+    """
+    out = []
+    _write(element, out, omit_attributes)
+    return "".join(out)
+
+# Small: the cache keeps the workflow text alive, and a request is only keyed a few times in a row
+@functools.lru_cache(maxsize=16)
+def _document_fingerprint(xml_string: str) -> str:
+    """
+    Fingerprints a workflow's canonical form. XML that does not parse is fingerprinted on its text with
+    indentation removed.
+    """
+    try:
+        root = ET.fromstring(xml_string.strip())
+    except ET.ParseError:
+        return _sha256(_INTER_TAG_WHITESPACE.sub("><", xml_string.strip()))
+    return _sha256(canonical_element(root))
+
+def workflow_fingerprint(xml_string: str, input_schema: Optional[Dict[str, str]] = None) -> str:
+    """Fingerprint of a workflow (and, if given, the schema of its input) that ignores presentation-only changes."""
+    fingerprint = _document_fingerprint(xml_string)
+    if not input_schema:
+        return fingerprint
+    return _sha256(json.dumps([fingerprint, input_schema], sort_keys=True))
+
+@functools.lru_cache(maxsize=4096)
+def canonical_fragment(xml_snippet: str) -> str:
+    """
+    Canonical form of one tool's XML snippet without its ToolID, as embedded in model prompts: identical
+    tools then produce identical prompts, and share snippet cache entries across workflows.
+    Returns the snippet unchanged if it does not parse on its own.
+    """
+    try:
+        element = ET.fromstring(xml_snippet)
+    except ET.ParseError:
+        return xml_snippet
+    return canonical_element(element, frozenset({"ToolID"}))
+
+def snippet_fingerprint(xml_snippet: str) -> str:
+    """Fingerprint of one tool's XML snippet, ignoring its ToolID and presentation-only content."""
+    return _sha256(canonical_fragment(xml_snippet))
@@ -0,0 +1,158 @@
+# circuit_breaker.py - Fast-fail guard around the Vertex AI client
+#
+# The breaker watches the outcome and latency of recent model calls. When too many of them
+# fail or are slow it opens, and calls fail immediately with CircuitOpenError instead of
+# waiting on a degraded upstream. After a cool-down it lets a few probe calls through
+# (half-open) and closes again once they succeed.
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the model while the circuit is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Vertex AI is unavailable; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Value for an HTTP Retry-After header (whole seconds, at least 1)."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+class CircuitBreaker:
+    def __init__(self, window_seconds: float = 30.0, min_calls: int = 10, failure_rate_threshold: float = 0.5,
+                 slow_call_seconds: float = 20.0, slow_rate_threshold: float = 0.8, open_seconds: float = 30.0,
+                 half_open_probes: int = 2):
+        """
+        Args:
+            window_seconds: How far back call outcomes are considered.
+            min_calls: Calls needed in the window before the breaker may open.
+            failure_rate_threshold: Fraction of failed calls in the window that opens the breaker.
+            slow_call_seconds: Calls taking longer than this count as slow.
+            slow_rate_threshold: Fraction of slow calls in the window that opens the breaker.
+            open_seconds: Cool-down before probe calls are let through.
+            half_open_probes: Successful probes needed to close again; also the number allowed in flight.
+        """
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._lock = threading.Lock()
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()  # (finished_at, failed, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        """Builds a breaker configured by the VERTEX_BREAKER_* environment variables."""
+        return cls(
+            window_seconds=float(os.environ.get('VERTEX_BREAKER_WINDOW_SECONDS', 30)),
+            min_calls=int(os.environ.get('VERTEX_BREAKER_MIN_CALLS', 10)),
+            failure_rate_threshold=float(os.environ.get('VERTEX_BREAKER_FAILURE_RATE', 0.5)),
+            slow_call_seconds=float(os.environ.get('VERTEX_BREAKER_SLOW_CALL_SECONDS', 20)),
+            open_seconds=float(os.environ.get('VERTEX_BREAKER_OPEN_SECONDS', 30)),
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def check(self) -> None:
+        """Raises CircuitOpenError while the circuit is open. Cheap pre-check before queueing a call."""
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            if self._state == OPEN:
+                self.rejected += 1
+                raise CircuitOpenError(self._opened_at + self.open_seconds - now)
+
+    def before_call(self) -> None:
+        """
+        Admits a call that is about to be sent, or raises CircuitOpenError.
+        Every admitted call must be followed by record().
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return
+            self.rejected += 1
+            # Half-open with all probe slots taken: the probes will decide shortly
+            retry_after = self._opened_at + self.open_seconds - now if self._state == OPEN else 1.0
+            raise CircuitOpenError(retry_after)
+
+    def record(self, failed: bool, latency: float) -> None:
+        """Reports the outcome of an admitted call."""
+        now = time.monotonic()
+        slow = latency > self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_probes:
+                        logging.info("Vertex AI circuit closed; model calls resume")
+                        self._state = CLOSED
+                        self._calls.clear()
+                return
+            if self._state == OPEN:
+                return  # A straggler admitted before the breaker opened
+            self._calls.append((now, failed, slow))
+            self._prune(now)
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slow_calls = sum(1 for _, _, s in self._calls if s)
+            if failures / total >= self.failure_rate_threshold or slow_calls / total >= self.slow_rate_threshold:
+                logging.warning(f"Vertex AI circuit opened: {failures}/{total} failed and {slow_calls}/{total} slow calls in the last {self.window_seconds:.0f}s")
+                self._open(now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return {"state": self._state, "times_opened": self.times_opened, "rejected": self.rejected,
+                    "recent_calls": len(self._calls)}
+
+    def _open(self, now: float) -> None:
+        # Caller holds the lock
+        if self._state != OPEN:
+            self.times_opened += 1
+        self._state = OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _refresh(self, now: float) -> None:
+        # Caller holds the lock
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+
+    def _prune(self, now: float) -> None:
+        # Caller holds the lock
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
@@ -0,0 +1,251 @@
+# jobs.py - Asynchronous conversion jobs: pluggable queues and a worker pool
+#
+# A job is a JSON payload (the /convert request body) plus a status record. Workers take queued
+# jobs, run the handler and store its result, so HTTP requests return as soon as the job is queued.
+
+import abc
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+class JobQueueFullError(RuntimeError):
+    """Raised when the queue already holds its maximum number of pending jobs."""
+
+class JobQueue(abc.ABC):
+    """
+    Interface of a job queue. put() enqueues, take() claims the oldest queued job for a worker,
+    finish() stores the outcome and get() returns a job's status record.
+    """
+
+    @abc.abstractmethod
+    def put(self, job_id: str, payload: Dict[str, Any]) -> None:
+        """Queues a job. Raises JobQueueFullError when max_pending jobs are already waiting."""
+
+    @abc.abstractmethod
+    def take(self, timeout: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Returns (job_id, payload) of a job now marked running, or None if none arrived within timeout."""
+
+    @abc.abstractmethod
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        """Stores the outcome of a running job: its result, or the error it failed with."""
+
+    @abc.abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns a job's status record, or None for an unknown or expired job."""
+
+    @abc.abstractmethod
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+
+def _record(job_id: str, status: str, created_at: float, started_at: Optional[float] = None, finished_at: Optional[float] = None,
+            result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> Dict[str, Any]:
+    record = {"job_id": job_id, "status": status, "created_at": created_at, "started_at": started_at, "finished_at": finished_at}
+    if result is not None:
+        record["result"] = result
+    if error is not None:
+        record["error"] = error
+    return record
+
+class InMemoryJobQueue(JobQueue):
+    """Process-local queue. Fast, but queued and finished jobs are lost on restart."""
+
+    def __init__(self, max_pending: int = 10000, retention_seconds: float = 24 * 3600):
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._pending: "queue.Queue[str]" = queue.Queue()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # job_id -> record, in submission order
+        self._payloads: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, job_id: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._pending.qsize() >= self.max_pending:
+                raise JobQueueFullError(f"Job queue is full ({self.max_pending} jobs pending)")
+            self._expire(time.time())
+            self._jobs[job_id] = _record(job_id, QUEUED, time.time())
+            self._payloads[job_id] = payload
+        self._pending.put(job_id)
+
+    def take(self, timeout: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+        try:
+            job_id = self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            self._jobs[job_id].update(status=RUNNING, started_at=time.time())
+            return job_id, self._payloads.pop(job_id)
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is not None:
+                self._jobs[job_id] = _record(job_id, FAILED if error is not None else SUCCEEDED, record["created_at"],
+                                             record["started_at"], time.time(), result, error)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return dict(record) if record is not None else None
+
+    def depth(self) -> int:
+        return self._pending.qsize()
+
+    def _expire(self, now: float) -> None:
+        # Caller holds the lock. Records are in submission order, so expired ones are at the front.
+        for job_id in list(self._jobs):
+            record = self._jobs[job_id]
+            if now - record["created_at"] <= self.retention_seconds:
+                break
+            if record["status"] in (SUCCEEDED, FAILED):
+                del self._jobs[job_id]
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Queue persisted in a SQLite file. Queued jobs survive a restart, and jobs that were running
+    when the process died are queued again on startup.
+    """
+
+    def __init__(self, path: str, max_pending: int = 10000, retention_seconds: float = 24 * 3600, poll_seconds: float = 0.5):
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._job_added = threading.Condition(self._lock)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT, result TEXT, error TEXT,
+            created_at REAL NOT NULL, started_at REAL, finished_at REAL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at)")
+        requeued = self._db.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING)).rowcount
+        self._db.commit()
+        if requeued:
+            logging.warning(f"Requeued {requeued} job(s) interrupted by a restart")
+        logging.info(f"Job queue persisted to {path}")
+
+    def put(self, job_id: str, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            if self._depth() >= self.max_pending:
+                raise JobQueueFullError(f"Job queue is full ({self.max_pending} jobs pending)")
+            self._db.execute("DELETE FROM jobs WHERE status IN (?, ?) AND created_at < ?", (SUCCEEDED, FAILED, now - self.retention_seconds))
+            self._db.execute("INSERT INTO jobs (job_id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+                             (job_id, QUEUED, json.dumps(payload), now))
+            self._db.commit()
+            self._job_added.notify()
+
+    def take(self, timeout: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+        ends = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                row = self._db.execute("SELECT job_id, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)).fetchone()
+                if row is not None:
+                    # Claim it only if it is still queued: another process sharing the file may have taken it first
+                    claimed = self._db.execute("UPDATE jobs SET status = ?, started_at = ? WHERE job_id = ? AND status = ?",
+                                               (RUNNING, time.time(), row[0], QUEUED)).rowcount
+                    self._db.commit()
+                    if claimed:
+                        return row[0], json.loads(row[1])
+                    continue
+                remaining = ends - time.monotonic()
+                if remaining <= 0:
+                    return None
+                # Poll as well, in case another process shares the file
+                self._job_added.wait(min(remaining, self.poll_seconds))
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, payload = NULL WHERE job_id = ?",
+                             (FAILED if error is not None else SUCCEEDED, json.dumps(result) if result is not None else None,
+                              error, time.time(), job_id))
+            self._db.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT status, created_at, started_at, finished_at, result, error FROM jobs WHERE job_id = ?",
+                                   (job_id,)).fetchone()
+        if row is None:
+            return None
+        status, created_at, started_at, finished_at, result, error = row
+        return _record(job_id, status, created_at, started_at, finished_at, json.loads(result) if result else None, error)
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._depth()
+
+    def _depth(self) -> int:
+        # Caller holds the lock
+        return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+def job_queue_from_env() -> JobQueue:
+    """Builds the queue selected by JOB_QUEUE_BACKEND ('memory' or 'sqlite', stored at JOB_QUEUE_PATH)."""
+    backend = os.environ.get('JOB_QUEUE_BACKEND', 'memory').lower()
+    max_pending = int(os.environ.get('JOB_QUEUE_MAX_PENDING', 10000))
+    if backend == 'sqlite':
+        return SQLiteJobQueue(os.environ.get('JOB_QUEUE_PATH', 'jobs.db'), max_pending=max_pending)
+    if backend != 'memory':
+        raise ValueError(f"JOB_QUEUE_BACKEND must be 'memory' or 'sqlite', got '{backend}'")
+    return InMemoryJobQueue(max_pending=max_pending)
+
+class JobWorkerPool:
+    """Runs queued jobs on a fixed number of worker threads."""
+
+    def __init__(self, job_queue: JobQueue, handler: Callable[[Dict[str, Any]], Dict[str, Any]], workers: int = 2):
+        """
+        Args:
+            job_queue: Where jobs are queued and their outcomes stored.
+            handler: Runs one job's payload and returns its JSON-serializable result.
+            workers: Number of jobs processed at the same time.
+        """
+        self.queue = job_queue
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "JobWorkerPool":
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"Started {self.workers} job worker(s)")
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops taking new jobs and waits for running ones to finish."""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        """Queues a job and returns its id. Raises JobQueueFullError when the queue is full."""
+        job_id = uuid.uuid4().hex
+        self.queue.put(job_id, payload)
+        return job_id
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            job = self.queue.take(timeout=1.0)
+            if job is None:
+                continue
+            job_id, payload = job
+            started = time.monotonic()
+            try:
+                result = self.handler(payload)
+            except Exception as e:
+                logging.error(f"Job {job_id} failed: {e}", exc_info=True)
+                self.queue.finish(job_id, error=str(e))
+            else:
+                logging.info(f"Job {job_id} finished in {time.monotonic() - started:.1f}s")
+                self.queue.finish(job_id, result=result)
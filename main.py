@@ -1,13 +1,20 @@
 # main.py
 
 import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
-from agent import parse_alteryx_workflow, build_prompt
-from vertexai.preview.language_models import ChatModel
-import vertexai
+from pydantic import BaseModel
+
+from agent import CONVERTER_VERSION, parse_alteryx_workflow, build_prompt
+from canonical_xml import workflow_fingerprint
+from prompts import PromptTooLargeError
+from sql_cache import SnippetCache, etag_for, etag_matches
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
@@ -15,8 +22,183 @@ templates = Jinja2Templates(directory="templates")
 PROJECT_ID = os.getenv("PROJECT_ID")
 LOCATION = os.getenv("LOCATION", "us-central1")
 
-vertexai.init(project=PROJECT_ID, location=LOCATION)
-chat_model = ChatModel.from_pretrained("chat-bison")
+# Maximum number of conversions allowed to wait on the model at the same time.
+# Requests beyond this cap queue on the semaphore instead of piling onto Vertex AI.
+MAX_CONCURRENT_CONVERSIONS = int(os.getenv("MAX_CONCURRENT_CONVERSIONS", "32"))
+
+CHAT_MODEL_NAME = "chat-bison"
+
+# Largest prompt (in estimated tokens) sent to the model; bigger workflows are rejected up front.
+# chat-bison accepts 8192 input tokens. 0 disables the check.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+
+# Complete conversion results by result_key(); RESULT_CACHE_PATH persists them across restarts
+_result_cache = SnippetCache(max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024")),
+                             disk_path=os.getenv("RESULT_CACHE_PATH") or None)
+
+# Set WARM_UP_MODEL=1 to load the model in the background once the server is up
+WARM_UP_MODEL = os.getenv("WARM_UP_MODEL", "").lower() in ("1", "true", "yes")
+
+# Worker pool for SDK versions that only offer a blocking send_message
+_model_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CONVERSIONS, thread_name_prefix="vertex-chat")
+_conversion_slots = None
+
+# The Vertex AI SDK is imported and the chat model built on first use, not at import:
+# the SDK import dominates cold start, and GET / and health checks never need it
+_chat_model = None
+_chat_model_lock = threading.Lock()
+
+def _get_chat_model():
+    """Returns the chat model, initializing Vertex AI exactly once even when called from several threads."""
+    global _chat_model
+    if _chat_model is None:
+        with _chat_model_lock:
+            if _chat_model is None:
+                import vertexai
+                from vertexai.preview.language_models import ChatModel
+                vertexai.init(project=PROJECT_ID, location=LOCATION)
+                _chat_model = ChatModel.from_pretrained(CHAT_MODEL_NAME)
+    return _chat_model
+
+async def _start_chat():
+    # The first call blocks on the SDK import, so keep it off the event loop
+    chat_model = _chat_model or await asyncio.get_running_loop().run_in_executor(_model_executor, _get_chat_model)
+    return chat_model.start_chat()
+
+def _warm_up_chat_model():
+    try:
+        _get_chat_model()
+    except Exception as e:
+        logging.error(f"Model warm-up failed; it will be retried on first use: {e}")
+
+@app.on_event("startup")
+async def warm_up_model():
+    if WARM_UP_MODEL:
+        # Not awaited: the server starts accepting requests while the model loads
+        asyncio.get_running_loop().run_in_executor(_model_executor, _warm_up_chat_model)
+
+def _get_conversion_slots():
+    # Created lazily so the semaphore binds to the running event loop
+    global _conversion_slots
+    if _conversion_slots is None:
+        _conversion_slots = asyncio.Semaphore(MAX_CONCURRENT_CONVERSIONS)
+    return _conversion_slots
+
+def _send_prompt_blocking(chat, prompt):
+    return chat.send_message(prompt).text
+
+async def convert_workflow(xml_input: str) -> str:
+    """Parses the workflow and asks the chat model for SQL without blocking the event loop."""
+    parsed = parse_alteryx_workflow(xml_input)
+    prompt = build_prompt(parsed, PROMPT_TOKEN_BUDGET)
+
+    async with _get_conversion_slots():
+        chat = await _start_chat()
+        send_message_async = getattr(chat, "send_message_async", None)
+        if send_message_async is not None:
+            response = await send_message_async(prompt)
+            return response.text
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_model_executor, _send_prompt_blocking, chat, prompt)
+
+def _stream_prompt_blocking(chat, prompt, loop, chunks, cancelled):
+    """Runs the SDK's blocking token stream on a worker thread, handing each chunk to the event loop."""
+    stream = chat.send_message_streaming(prompt)
+    try:
+        for chunk in stream:
+            if cancelled.is_set():
+                break
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk.text)
+    except Exception as e:
+        loop.call_soon_threadsafe(chunks.put_nowait, e)
+    finally:
+        # Closing the generator early tears down the model's response stream
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+        loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+async def stream_workflow(xml_input: str, request: Request):
+    """
+    Yields the model's SQL as it is generated. Generation stops as soon as the client disconnects,
+    instead of running to completion for nobody.
+    """
+    try:
+        parsed = parse_alteryx_workflow(xml_input)
+        prompt = build_prompt(parsed, PROMPT_TOKEN_BUDGET)
+    except Exception as e:
+        yield f"Error: {str(e)}"
+        return
+
+    async with _get_conversion_slots():
+        chat = await _start_chat()
+        stream_async = getattr(chat, "send_message_streaming_async", None)
+        if stream_async is not None:
+            stream = stream_async(prompt)
+            try:
+                async for chunk in stream:
+                    if await request.is_disconnected():
+                        break
+                    yield chunk.text
+            except Exception as e:
+                yield f"\nError: {str(e)}"
+            finally:
+                await stream.aclose()
+            return
+
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        cancelled = threading.Event()
+        producer = loop.run_in_executor(_model_executor, _stream_prompt_blocking, chat, prompt, loop, chunks, cancelled)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    yield f"\nError: {str(chunk)}"
+                    break
+                if await request.is_disconnected():
+                    break
+                yield chunk
+        finally:
+            # Also reached when the server cancels the response because the client went away
+            cancelled.set()
+        await producer
+
+def result_key(xml_input: str) -> str:
+    """Identifies a conversion result: the canonical workflow's fingerprint and the converter version, hashed."""
+    return SnippetCache.make_key(CHAT_MODEL_NAME, workflow_fingerprint(xml_input), {"converter_version": CONVERTER_VERSION})
+
+async def convert_workflow_cached(xml_input: str, key: str) -> str:
+    sql = _result_cache.get(key)
+    if sql is None:
+        sql = await convert_workflow(xml_input)
+        _result_cache.set(key, sql)
+    return sql
+
+class ConvertRequest(BaseModel):
+    alteryx_xml: str
+
+@app.post("/convert")
+async def convert_json(body: ConvertRequest, request: Request):
+    # Clients re-checking an unchanged workflow send back the ETag and get a 304 for the price of fingerprinting it
+    key = result_key(body.alteryx_xml)
+    etag = etag_for(key)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        sql = await convert_workflow_cached(body.alteryx_xml, key)
+    except PromptTooLargeError as e:
+        return JSONResponse({"message": f"Error: {str(e)}"}, status_code=413)
+    except Exception as e:
+        return JSONResponse({"message": f"Error: {str(e)}"}, status_code=500)
+    return JSONResponse({"sql": sql}, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.get("/healthz")
+async def health():
+    return {"status": "ok", "model_loaded": _chat_model is not None}
 
 @app.get("/", response_class=HTMLResponse)
 async def form_get(request: Request):
@@ -25,13 +207,14 @@ async def form_get(request: Request):
 @app.post("/", response_class=HTMLResponse)
 async def form_post(request: Request, xml_input: str = Form(...)):
     try:
-        parsed = parse_alteryx_workflow(xml_input)
-        prompt = build_prompt(parsed)
-
-        chat = chat_model.start_chat()
-        response = chat.send_message(prompt)
-        sql_output = response.text
+        sql_output = await convert_workflow_cached(xml_input, result_key(xml_input))
     except Exception as e:
         sql_output = f"Error: {str(e)}"
 
     return templates.TemplateResponse("index.html", {"request": request, "sql": sql_output, "xml_input": xml_input})
+
+@app.post("/convert/stream")
+async def convert_stream(request: Request, xml_input: str = Form(...)):
+    # Plain-text token stream of the generated SQL, consumed incrementally by templates/index.html
+    return StreamingResponse(stream_workflow(xml_input, request), media_type="text/plain; charset=utf-8",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,9 +1,15 @@
 # main.py - Flask Web Server for Alteryx to BigQuery SQL Conversion
 
 import os
+import json
 import logging
-from agent import AlteryxToBigQueryAgent # Import the class from agent.py
-from flask import Flask, request, jsonify # Import Flask and related utilities
+import time
+from agent2 import AlteryxToBigQueryAgent # Import the class from agent2.py
+from circuit_breaker import CircuitOpenError
+from jobs import JobQueueFullError, JobWorkerPool, job_queue_from_env
+from sql_cache import etag_for, etag_matches
+from model_scheduler import CallContext, PRIORITY_BATCH, PRIORITY_INTERACTIVE, QueueFullError
+from flask import Flask, Response, request, jsonify, stream_with_context # Import Flask and related utilities
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,40 +25,167 @@ if not PROJECT_ID or not LOCATION:
     LOCATION = "us-central1" # Placeholder
 
 # Initialize the AlteryxToBigQueryAgent instance
-# It's good practice to initialize this once globally for a Flask app
+# It's good practice to initialize this once globally for a Flask app.
+# This is cheap: the Vertex AI SDK is imported and the model built on the first conversion.
 try:
-    alteryx_converter_instance = AlteryxToBigQueryAgent(PROJECT_ID, LOCATION)
+    alteryx_converter_instance = AlteryxToBigQueryAgent(
+        PROJECT_ID, LOCATION,
+        batch_token_budget=int(os.environ.get('GEMINI_BATCH_TOKEN_BUDGET', 0)) # 0 = one request per tool
+    )
 except Exception as e:
     logging.error(f"Failed to initialize AlteryxToBigQueryAgent: {e}")
     # Depending on your error handling strategy, you might want to exit or raise
     # For now, we'll let the app start but conversion calls will fail.
 
+# Optionally load the model in the background right away, so the first conversion does not wait for it
+if os.environ.get('WARM_UP_MODEL', '').lower() in ('1', 'true', 'yes'):
+    alteryx_converter_instance.warm_up()
+
+# Asynchronous jobs for workflows that take longer than the load balancer's request timeout
+def run_conversion_job(payload):
+    """Runs one queued conversion. Waits out overload and model outages instead of failing the job."""
+    context = CallContext(PRIORITY_BATCH, payload.get('caller') or "jobs")
+    for attempt in range(int(os.environ.get('JOB_MAX_ATTEMPTS', 5))):
+        try:
+            return alteryx_converter_instance.convert_alteryx_to_sql(payload['alteryx_xml'], payload.get('input_schema'), context,
+                                                                     payload.get('workflow_id'))
+        except (QueueFullError, CircuitOpenError) as e:
+            delay = getattr(e, 'retry_after', 5)
+            logging.warning(f"Conversion job postponed for {delay:.0f}s: {e}")
+            time.sleep(delay)
+    return alteryx_converter_instance.convert_alteryx_to_sql(payload['alteryx_xml'], payload.get('input_schema'), context,
+                                                             payload.get('workflow_id'))
+
+job_workers = JobWorkerPool(job_queue_from_env(), run_conversion_job, workers=int(os.environ.get('JOB_WORKERS', 2))).start()
+
 # Create the Flask app
 app = Flask(__name__)
 
-# Define the API endpoint for conversion
-@app.route('/convert', methods=['POST'])
-def convert_xml_to_sql_endpoint():
+def read_conversion_request():
+    """
+    Validates a conversion request body.
+    Returns (alteryx_xml, input_schema, workflow_id, None) or (None, None, None, error_response).
+    """
     # Ensure the request body is JSON
     if not request.is_json:
-        return jsonify({"message": "Request must be JSON"}), 400
+        return None, None, None, (jsonify({"message": "Request must be JSON"}), 400)
 
     data = request.get_json()
     alteryx_xml = data.get('alteryx_xml')
 
     # Validate input XML
     if not alteryx_xml:
-        return jsonify({"message": "Missing 'alteryx_xml' in request body."}), 400
+        return None, None, None, (jsonify({"message": "Missing 'alteryx_xml' in request body."}), 400)
+
+    # Optional column name -> type mapping describing the workflow's input data
+    input_schema = data.get('input_schema')
+    if input_schema is not None and not (isinstance(input_schema, dict) and all(isinstance(t, str) for t in input_schema.values())):
+        return None, None, None, (jsonify({"message": "'input_schema' must be an object mapping column names to type names."}), 400)
+
+    # Optional stable identity of the workflow across edits; resubmissions then only re-translate changed tools
+    workflow_id = data.get('workflow_id')
+    if workflow_id is not None and not isinstance(workflow_id, str):
+        return None, None, None, (jsonify({"message": "'workflow_id' must be a string."}), 400)
+    return alteryx_xml, input_schema, workflow_id, None
+
+def interactive_call_context() -> CallContext:
+    # Interactive requests are scheduled ahead of batch work; model quota is shared fairly between clients
+    return CallContext(PRIORITY_INTERACTIVE, request.headers.get('X-Client-Id') or request.remote_addr or "anonymous")
+
+# Define the API endpoint for conversion
+@app.route('/convert', methods=['POST'])
+def convert_xml_to_sql_endpoint():
+    alteryx_xml, input_schema, workflow_id, error_response = read_conversion_request()
+    if error_response:
+        return error_response
+    context = interactive_call_context()
+
+    # The ETag identifies the result (workflow, input schema and converter version), so a client that
+    # already holds it gets a 304 for the price of one hash, without any conversion or cache lookup.
+    etag = etag_for(alteryx_converter_instance.result_key(alteryx_xml, input_schema))
+    if etag_matches(request.headers.get('If-None-Match', ''), etag):
+        return "", 304, {"ETag": etag}
 
     try:
         # Call the conversion method from your agent instance
-        result = alteryx_converter_instance.convert_alteryx_to_sql(alteryx_xml)
-        return jsonify(result), 200
+        result = alteryx_converter_instance.convert_alteryx_to_sql(alteryx_xml, input_schema, context, workflow_id)
+        if not alteryx_converter_instance.is_cacheable(result):
+            return jsonify(result), 200 # Failed or degraded results are not advertised for revalidation
+        return jsonify(result), 200, {"ETag": etag, "Cache-Control": "no-cache"}
+    except QueueFullError as e:
+        logging.warning(f"Rejecting conversion request: {e}")
+        return jsonify({"message": "The converter is busy. Please try again shortly."}), 503, {"Retry-After": "5"}
+    except CircuitOpenError as e:
+        # Vertex AI is failing: answer immediately instead of tying up a worker until the SDK times out
+        logging.warning(f"Rejecting conversion request: {e}")
+        return jsonify({"message": "The SQL generation model is temporarily unavailable. Please try again shortly."}), 503, {"Retry-After": e.retry_after_header}
     except Exception as e:
         # Catch any errors during the conversion process
         logging.error(f"Error during Alteryx to BigQuery SQL conversion: {e}", exc_info=True)
         return jsonify({"message": f"An internal server error occurred during conversion: {str(e)}"}), 500
 
+# Streaming variant of /convert: newline-delimited JSON events (see
+# AlteryxToBigQueryAgent.convert_alteryx_to_sql_events), each tool's SQL sent as soon as it is ready
+@app.route('/convert/stream', methods=['POST'])
+def convert_xml_to_sql_stream_endpoint():
+    alteryx_xml, input_schema, workflow_id, error_response = read_conversion_request()
+    if error_response:
+        return error_response
+    events = alteryx_converter_instance.convert_alteryx_to_sql_events(alteryx_xml, input_schema, interactive_call_context(), workflow_id)
+
+    def generate():
+        for event in events:
+            yield json.dumps(event) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}) # Keep proxies from buffering the stream
+
+# Queue a conversion and return immediately; poll GET /jobs/<job_id> for the result
+@app.route('/jobs', methods=['POST'])
+def create_job_endpoint():
+    alteryx_xml, input_schema, workflow_id, error_response = read_conversion_request()
+    if error_response:
+        return error_response
+    payload = {"alteryx_xml": alteryx_xml, "input_schema": input_schema, "workflow_id": workflow_id,
+               "caller": interactive_call_context().caller}
+    try:
+        job_id = job_workers.submit(payload)
+    except JobQueueFullError as e:
+        logging.warning(f"Rejecting job: {e}")
+        return jsonify({"message": "Too many conversions are queued. Please try again later."}), 503, {"Retry-After": "30"}
+    return jsonify({"job_id": job_id, "status": "queued"}), 202, {"Location": f"/jobs/{job_id}"}
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_endpoint(job_id):
+    job = job_workers.queue.get(job_id)
+    if job is None:
+        return jsonify({"message": f"Unknown job '{job_id}'."}), 404
+    return jsonify(job), 200
+
+# Liveness: answers without touching the model, so health checks never pay for SDK start-up
+@app.route('/healthz', methods=['GET'])
+def health_endpoint():
+    return jsonify({"status": "ok"}), 200
+
+# Readiness: whether the model is loaded (conversions work either way; the first one just takes longer)
+@app.route('/readyz', methods=['GET'])
+def readiness_endpoint():
+    return jsonify({"status": "ok", "model_loaded": alteryx_converter_instance.model_loaded}), 200
+
+# Expose snippet cache hit/miss and request coalescing counters for monitoring
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats_endpoint():
+    stats = alteryx_converter_instance.cache.stats()
+    stats["results"] = alteryx_converter_instance.result_cache.stats()
+    stats["conversion_store"] = alteryx_converter_instance.conversion_store.stats()
+    stats["coalesced"] = alteryx_converter_instance.coalescing_stats()
+    stats["scheduler"] = alteryx_converter_instance.scheduler.stats()
+    stats["resilience"] = alteryx_converter_instance.resilience.stats()
+    stats["circuit_breaker"] = alteryx_converter_instance.breaker.stats()
+    stats["routing"] = alteryx_converter_instance.router.stats()
+    stats["jobs_pending"] = job_workers.queue.depth()
+    return jsonify(stats), 200
+
 # Get port from environment variable, default to 8080 for local development
 PORT = int(os.environ.get("PORT", 8080))
 
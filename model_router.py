@@ -0,0 +1,152 @@
+# model_router.py - Routes each tool to a fast or a strong Gemini model by its complexity
+#
+# Most tools that reach the model are small: a comparison filter, a handful of renames. A fast model
+# answers those as well as a strong one, in a fraction of the time. Tools are scored from their
+# parsed configuration; answers from the fast tier are validated, and escalated to the strong tier
+# when they do not look like the SQL that was asked for.
+
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from alteryx_expr import Call, Conditional, UnsupportedExpressionError, iter_nodes, parse_expression, referenced_fields
+from workflow_ir import FilterTool, SelectTool, Tool
+
+FAST = "fast"
+STRONG = "strong"
+
+# Score of anything the router cannot assess (unparseable expressions, unknown tool kinds)
+UNSCORED_COMPLEXITY = 1000
+
+# Extra weight of AST nodes that take the model more than a token-for-token rewrite
+_CALL_WEIGHT = 3
+_CONDITIONAL_WEIGHT = 5
+_TYPE_CHANGE_WEIGHT = 2
+
+_LEADING_KEYWORD = {"Select": "SELECT", "Filter": "WHERE"}
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`")
+_FROM_CLAUSE = re.compile(r"\bFROM\b", re.IGNORECASE)
+
+def complexity_score(tool: Tool) -> int:
+    """
+    Estimates how hard a tool is to translate. A Filter scores one point per expression AST node plus
+    extra for function calls and IF/THEN chains, and one per field it reads; a Select scores one point
+    per kept field plus extra for type changes.
+    """
+    if isinstance(tool, FilterTool) and tool.expression:
+        try:
+            ast = parse_expression(tool.expression)
+            fields = referenced_fields(tool.expression)
+        except UnsupportedExpressionError:
+            return UNSCORED_COMPLEXITY
+        score = len(fields)
+        for node in iter_nodes(ast):
+            score += 1
+            if isinstance(node, Call):
+                score += _CALL_WEIGHT
+            elif isinstance(node, Conditional):
+                score += _CONDITIONAL_WEIGHT
+        return score
+    if isinstance(tool, SelectTool):
+        kept = [field for field in tool.fields if field.selected]
+        return len(kept) + _TYPE_CHANGE_WEIGHT * sum(1 for field in kept if field.type)
+    return UNSCORED_COMPLEXITY
+
+def _without_literals(sql: str) -> str:
+    return _STRING_LITERAL.sub("''", sql)
+
+def validate_snippet(tool: Tool, snippet: str, output_columns: Iterable[str] = ()) -> Optional[str]:
+    """
+    Cheap structural checks of a generated snippet. Returns what is wrong with it, or None if it looks right.
+    Args:
+        tool: The tool the snippet translates.
+        snippet: The model's answer.
+        output_columns: For a Select, the columns its output must contain.
+    """
+    keyword = _LEADING_KEYWORD.get(tool.kind)
+    if not snippet.strip():
+        return "the answer is empty"
+    if keyword and not snippet.lstrip().upper().startswith(keyword):
+        return f"the answer does not start with {keyword}"
+    code = _without_literals(snippet)
+    if code.count("(") != code.count(")"):
+        return "the parentheses are unbalanced"
+    if code.count("'") % 2 or code.count('"') % 2:
+        return "a string literal is not terminated"
+    if tool.kind == "Select" and _FROM_CLAUSE.search(code):
+        return "the answer includes a FROM clause"
+    lowered = snippet.lower()
+    if tool.kind == "Select":
+        missing = [name for name in output_columns if name.lower() not in lowered]
+        if missing:
+            return f"output column(s) {', '.join(missing)} are missing"
+    elif isinstance(tool, FilterTool) and tool.expression:
+        try:
+            missing = [name for name in referenced_fields(tool.expression) if name.lower() not in lowered]
+        except UnsupportedExpressionError:
+            missing = []
+        if missing:
+            return f"field(s) {', '.join(missing)} of the expression are not used"
+    return None
+
+class ModelRouter:
+    """
+    Picks the model tier for each tool. Without a fast model every tool goes to the strong model,
+    which is the same as not routing at all.
+    """
+
+    def __init__(self, strong_model: str, fast_model: Optional[str] = None, complexity_threshold: int = 12):
+        """
+        Args:
+            strong_model: Model for complex tools, and for escalations from the fast tier.
+            fast_model: Model for tools scoring at most complexity_threshold. None disables routing.
+            complexity_threshold: Highest complexity_score() sent to the fast model.
+        """
+        self.strong_model = strong_model
+        self.fast_model = fast_model if fast_model and fast_model != strong_model else None
+        self.complexity_threshold = complexity_threshold
+        self._lock = threading.Lock()
+        self._routed = {FAST: 0, STRONG: 0}
+        self._escalations = 0
+
+    @classmethod
+    def from_env(cls, strong_model: str) -> "ModelRouter":
+        """Builds a router for strong_model configured by GEMINI_FAST_MODEL and GEMINI_ROUTING_THRESHOLD."""
+        return cls(
+            strong_model=strong_model,
+            fast_model=os.environ.get('GEMINI_FAST_MODEL') or None,
+            complexity_threshold=int(os.environ.get('GEMINI_ROUTING_THRESHOLD', 12)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.fast_model is not None
+
+    def models(self) -> List[str]:
+        return [self.strong_model] + ([self.fast_model] if self.fast_model else [])
+
+    def settings(self) -> Dict[str, Any]:
+        """What the routing decisions depend on; part of result cache keys."""
+        return {"fast_model": self.fast_model, "complexity_threshold": self.complexity_threshold} if self.enabled else {}
+
+    def route(self, tool: Tool) -> str:
+        """Returns the model that should translate the tool."""
+        tier = FAST if self.enabled and complexity_score(tool) <= self.complexity_threshold else STRONG
+        with self._lock:
+            self._routed[tier] += 1
+        return self.fast_model if tier == FAST else self.strong_model
+
+    def record_escalation(self) -> None:
+        with self._lock:
+            self._escalations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "fast_model": self.fast_model,
+                "strong_model": self.strong_model,
+                "routed_fast": self._routed[FAST],
+                "routed_strong": self._routed[STRONG],
+                "escalations": self._escalations,
+            }
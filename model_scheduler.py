@@ -0,0 +1,239 @@
+# model_scheduler.py - Client-side quota management for Vertex AI calls
+#
+# Every model call goes through a ModelCallScheduler. It holds two token buckets (requests/min
+# and tokens/min) sized to the project's quota. A bounded priority queue puts interactive
+# requests ahead of batch work and round-robins between callers within a priority. Quota
+# errors that slip through drain the buckets and requeue the call instead of failing it.
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+class QueueFullError(RuntimeError):
+    """Raised when the scheduler's queue is at capacity; callers should shed load."""
+
+@dataclass(frozen=True)
+class CallContext:
+    """Who a model call is for: its priority class and the caller it is fair-shared against."""
+    priority: int = PRIORITY_INTERACTIVE
+    caller: str = "default"
+
+def is_quota_error(error: BaseException) -> bool:
+    """True for Vertex AI 429 / RESOURCE_EXHAUSTED style errors."""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    text = str(error).lower()
+    return "429" in text or "quota" in text or "resource exhausted" in text
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_minute. Not thread-safe on its own."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are available now)."""
+        self._refill(time.monotonic())
+        amount = min(amount, self.capacity)  # A single oversized call must still be able to run
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate_per_second
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self) -> None:
+        """Empties the bucket, e.g. after the server reported the quota as exhausted."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0)
+
+class ScheduledFuture(Future):
+    """Future of a scheduled call. `started` is set once the call leaves the queue and begins executing."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.abandoned = False
+
+    def abandon(self) -> None:
+        """
+        Tells the scheduler the caller no longer wants the result. A queued call is dropped, including one
+        requeued after a quota error, whose future is already running and so cannot simply be cancelled.
+        """
+        self.abandoned = True
+        self.cancel()
+
+class _Job:
+    __slots__ = ("fn", "tokens", "context", "future", "attempts")
+
+    def __init__(self, fn, tokens, context, future):
+        self.fn = fn
+        self.tokens = tokens
+        self.context = context
+        self.future = future
+        self.attempts = 0
+
+class ModelCallScheduler:
+    """Rate-limited, prioritized and fair dispatcher for model calls."""
+
+    def __init__(self, requests_per_minute: float = 300, tokens_per_minute: float = 1_000_000,
+                 max_queue_size: int = 1000, max_workers: int = 16, max_quota_retries: int = 3):
+        """
+        Args:
+            requests_per_minute: Request quota to stay under.
+            tokens_per_minute: Input + output token quota to stay under.
+            max_queue_size: Calls allowed to wait; submit() raises QueueFullError beyond this.
+            max_workers: Maximum number of calls executing at the same time.
+            max_quota_retries: Times a call is requeued after a quota error before it fails.
+        """
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_queue_size = max_queue_size
+        self.max_quota_retries = max_quota_retries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vertex-call")
+        self._condition = threading.Condition()
+        # priority -> caller -> queued jobs; the callers deque gives round-robin order within a priority
+        self._queues: Dict[int, Dict[str, Deque[_Job]]] = {}
+        self._callers: Dict[int, Deque[str]] = {}
+        self._queued = 0
+        self._dispatcher = None
+        self.dispatched = 0
+        self.quota_retries = 0
+
+    @classmethod
+    def from_env(cls) -> "ModelCallScheduler":
+        """Builds a scheduler configured by the VERTEX_* quota environment variables."""
+        return cls(
+            requests_per_minute=float(os.environ.get('VERTEX_REQUESTS_PER_MINUTE', 300)),
+            tokens_per_minute=float(os.environ.get('VERTEX_TOKENS_PER_MINUTE', 1_000_000)),
+            max_queue_size=int(os.environ.get('VERTEX_MAX_QUEUED_CALLS', 1000)),
+            max_workers=int(os.environ.get('VERTEX_MAX_CONCURRENT_CALLS', 16)),
+        )
+
+    def submit(self, fn: Callable[[], Any], estimated_tokens: int, context: Optional[CallContext] = None) -> ScheduledFuture:
+        """Queues fn() for execution once quota allows. Returns a future of its result."""
+        job = _Job(fn, estimated_tokens, context or CallContext(), ScheduledFuture())
+        with self._condition:
+            if self._queued >= self.max_queue_size:
+                raise QueueFullError(f"Model call queue is full ({self.max_queue_size} calls waiting)")
+            self._enqueue(job)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="vertex-scheduler", daemon=True)
+                self._dispatcher.start()
+            self._condition.notify()
+        return job.future
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int, context: Optional[CallContext] = None) -> Any:
+        """Blocking variant of submit()."""
+        return self.submit(fn, estimated_tokens, context).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "queued": self._queued,
+                "dispatched": self.dispatched,
+                "quota_retries": self.quota_retries,
+                "request_tokens_available": round(self.request_bucket.tokens, 1),
+                "model_tokens_available": round(self.token_bucket.tokens),
+            }
+
+    def _enqueue(self, job: _Job, front: bool = False) -> None:
+        # Caller holds the condition
+        priority, caller = job.context.priority, job.context.caller
+        by_caller = self._queues.setdefault(priority, {})
+        if caller not in by_caller:
+            by_caller[caller] = deque()
+            self._callers.setdefault(priority, deque()).append(caller)
+        if front:
+            by_caller[caller].appendleft(job)
+        else:
+            by_caller[caller].append(job)
+        self._queued += 1
+
+    def _next_caller(self) -> Optional[List]:
+        # Caller holds the condition. Returns [priority, caller] for the next job, without removing it.
+        for priority in sorted(self._callers):
+            if self._callers[priority]:
+                return [priority, self._callers[priority][0]]
+        return None
+
+    def _pop(self, priority: int, caller: str) -> _Job:
+        # Caller holds the condition. Rotates the caller to the back so callers take turns.
+        jobs = self._queues[priority][caller]
+        job = jobs.popleft()
+        self._callers[priority].rotate(-1)
+        if not jobs:
+            del self._queues[priority][caller]
+            self._callers[priority].remove(caller)
+        self._queued -= 1
+        return job
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._condition:
+                head = self._next_caller()
+                if head is None:
+                    self._condition.wait()
+                    continue
+                priority, caller = head
+                job = self._queues[priority][caller][0]
+                if job.future.cancelled() or job.future.abandoned:
+                    # Its caller gave up (a timed-out attempt, a lost hedge): don't spend quota on it
+                    self._pop(priority, caller)
+                    if not job.future.done():
+                        job.future.set_exception(CancelledError("Model call abandoned by its caller"))
+                    continue
+                wait = max(self.request_bucket.time_until(1), self.token_bucket.time_until(job.tokens))
+                if wait > 0:
+                    # Wake early if a higher-priority call arrives; otherwise retry once quota has refilled
+                    self._condition.wait(timeout=wait)
+                    continue
+                self.request_bucket.consume(1)
+                self.token_bucket.consume(job.tokens)
+                job = self._pop(priority, caller)
+                self.dispatched += 1
+            try:
+                self._executor.submit(self._run, job)
+            except RuntimeError:
+                # The interpreter is exiting while calls abandoned by their callers are still queued
+                logging.info("Model call scheduler stopped: the worker pool has shut down")
+                return
+
+    def _run(self, job: _Job) -> None:
+        # A requeued job's future is already running
+        if job.attempts == 0:
+            if not job.future.set_running_or_notify_cancel():
+                return
+            job.future.started.set()
+        try:
+            result = job.fn()
+        except BaseException as e:
+            if is_quota_error(e) and job.attempts < self.max_quota_retries and not job.future.abandoned:
+                job.attempts += 1
+                logging.warning(f"Vertex AI quota exceeded; requeueing call (attempt {job.attempts}): {e}")
+                with self._condition:
+                    # Our estimate of the remaining quota was too optimistic: start refilling from empty
+                    self.request_bucket.drain()
+                    self.token_bucket.drain()
+                    self.quota_retries += 1
+                    self._enqueue(job, front=True)
+                    self._condition.notify()
+                return
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
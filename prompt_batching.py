@@ -0,0 +1,76 @@
+# prompt_batching.py - Packing several tool translations into one Gemini request
+
+import json
+import logging
+import re
+from typing import Dict, List, Sequence
+
+# Rough characters-per-token ratio for English text and XML; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+BATCH_PREAMBLE = """
+You are an expert Alteryx to BigQuery SQL converter.
+Translate each Alteryx tool below into BigQuery SQL.
+- For a Select tool, return only the SQL SELECT statement (no FROM clause).
+- For a Filter tool, return only the SQL WHERE clause, including the 'WHERE' keyword.
+Respond with a single JSON object and nothing else. Its keys are the ToolIDs (as strings) and its
+values are the SQL text for that tool, e.g. {"3": "SELECT\\n    a,\\n    b", "4": "WHERE a > 1"}.
+"""
+
+_CODE_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def batch_item_section(tool_id: str, kind: str, input_cte: str, schema_text: str, config_text: str) -> str:
+    """One tool's part of a batched prompt. The schema and configuration are passed pre-serialized (see prompts.py)."""
+    return f"""
+### ToolID {tool_id} ({kind} tool)
+Input CTE: `{input_cte}`
+Input columns: {schema_text}
+Configuration:
+{config_text}
+"""
+
+def pack_batches(sections: Sequence[str], token_budget: int, max_items: int) -> List[List[int]]:
+    """
+    Greedily groups prompt sections into batches whose estimated size (including the shared
+    preamble) stays within token_budget. Returns lists of indexes into `sections`.
+    A section larger than the budget on its own still gets a batch of one.
+    """
+    available = token_budget - estimate_tokens(BATCH_PREAMBLE)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index, section in enumerate(sections):
+        tokens = estimate_tokens(section)
+        if current and (current_tokens + tokens > available or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def build_batch_prompt(sections: Sequence[str]) -> str:
+    return BATCH_PREAMBLE + "".join(sections)
+
+def parse_batch_response(text: str, tool_ids: Sequence[str]) -> Dict[str, str]:
+    """
+    Extracts the per-tool SQL from a batched answer. Tools that are missing, empty or not
+    strings are left out, so the caller can re-ask for just those.
+    """
+    try:
+        answer = json.loads(_CODE_FENCE.sub("", text.strip()))
+    except ValueError as e:
+        logging.warning(f"Batched Gemini answer was not valid JSON: {e}")
+        return {}
+    if not isinstance(answer, dict):
+        return {}
+    results = {}
+    for tool_id in tool_ids:
+        sql = answer.get(tool_id)
+        if isinstance(sql, str) and sql.strip():
+            results[tool_id] = sql.strip()
+    return results
@@ -0,0 +1,114 @@
+# prompts.py - Compact per-tool prompts for Gemini
+#
+# Input tokens are paid for in latency, quota and cost, so prompts carry only what a translation
+# depends on: the tool's semantic configuration (not its layout, captions or output metadata) and
+# the input columns the tool actually reads, in a one-line schema instead of indented JSON.
+
+import logging
+import xml.etree.ElementTree as ET
+from typing import List, Optional
+
+from alteryx_expr import UnsupportedExpressionError, referenced_fields
+from canonical_xml import canonical_element
+from prompt_batching import batch_item_section, estimate_tokens
+from schema import Schema, select_output_columns
+from sql_rules import quote_identifier
+from workflow_ir import FilterTool, SelectTool, Tool
+
+class PromptTooLargeError(ValueError):
+    """Raised when a prompt does not fit the per-call token budget even after compaction."""
+
+def compact_schema(schema: Schema, columns: Optional[List[str]] = None) -> str:
+    """
+    Serializes a schema as `name TYPE` pairs on one line, e.g. "order_id INT64, `Order Date` DATE".
+    Args:
+        schema: The input schema.
+        columns: Only these columns, in schema order. None includes every column.
+    """
+    wanted = None if columns is None else set(columns)
+    return ", ".join(f"{quote_identifier(name)} {column_type}" for name, column_type in schema.items()
+                     if wanted is None or name in wanted)
+
+def referenced_columns(tool: Tool, input_schema: Schema) -> Optional[List[str]]:
+    """
+    Input columns a tool reads, or None when that cannot be determined (every column is then relevant).
+    A Select reads the fields it keeps, all of them if it keeps '*Unknown'; a Filter reads its expression's fields.
+    """
+    if isinstance(tool, SelectTool):
+        return [source for source, _, _ in select_output_columns(tool.fields, input_schema)]
+    if isinstance(tool, FilterTool) and tool.expression:
+        try:
+            return referenced_fields(tool.expression)
+        except UnsupportedExpressionError:
+            return None  # Not something our parser reads; let the model see every column
+    return None
+
+def relevant_config(tool: Tool) -> str:
+    """
+    The part of a tool's configuration a translation depends on. Select and Filter tools are described
+    from the parsed IR; other tools fall back to their canonical <Configuration> element.
+    """
+    if isinstance(tool, SelectTool) and tool.fields:
+        # '*Unknown' stands for every input column the Select does not list
+        rows = [f"{field.name} | {field.selected} | {field.rename or ''} | {field.type or ''}" for field in tool.fields]
+        return "Field | Selected | Rename | Type\n" + "\n".join(rows)
+    if isinstance(tool, FilterTool) and tool.expression:
+        return f"Expression: {tool.expression.strip()}"
+    try:
+        node = ET.fromstring(tool.xml_snippet)
+    except ET.ParseError:
+        return tool.xml_snippet
+    config = node.find("Configuration")
+    if config is None:
+        config = node.find("Properties/Configuration")
+    return canonical_element(config if config is not None else node, frozenset({"ToolID"}))
+
+def _schema_text(tool: Tool, input_schema: Schema) -> str:
+    return compact_schema(input_schema, referenced_columns(tool, input_schema)) or "(none referenced)"
+
+def _prompt_text(tool: Tool, input_cte: str, schema_text: str, config_text: str) -> str:
+    if tool.kind == 'Select':
+        return f"""
+You are an expert Alteryx to BigQuery SQL converter.
+Translate the following Alteryx Select tool logic into a BigQuery SQL SELECT statement.
+The input data comes from a CTE named `{input_cte}` with these columns: {schema_text}
+
+Alteryx Select Tool Configuration:
+{config_text}
+
+Generate only the BigQuery SQL SELECT statement. Do not include any explanations or extra text.
+Ensure all selected columns are present in the output.
+"""
+    return f"""
+You are an expert Alteryx to BigQuery SQL converter.
+Translate the following Alteryx Filter tool logic into a BigQuery SQL WHERE clause.
+The input data comes from a CTE named `{input_cte}` with these columns: {schema_text}
+
+Alteryx Filter Tool Configuration:
+{config_text}
+
+Generate only the BigQuery SQL WHERE clause, including the 'WHERE' keyword. Do not include any explanations or extra text.
+"""
+
+def build_tool_prompt(tool: Tool, input_cte: str, input_schema: Schema, token_budget: int = 0) -> str:
+    """
+    Builds the prompt translating one tool that reads from `input_cte`.
+    Args:
+        tool: A Select or Filter tool.
+        input_cte: Name of the CTE holding the tool's input.
+        input_schema: Schema of that input; only the columns the tool reads are sent.
+        token_budget: Maximum estimated input tokens. 0 disables the check.
+    Raises:
+        PromptTooLargeError: The compacted prompt is still larger than token_budget.
+    """
+    prompt = _prompt_text(tool, input_cte, _schema_text(tool, input_schema), relevant_config(tool))
+    tokens = estimate_tokens(prompt)
+    if token_budget > 0 and tokens > token_budget:
+        logging.warning(f"Prompt for ToolID {tool.tool_id} needs ~{tokens} tokens, over the budget of {token_budget}")
+        raise PromptTooLargeError(f"The prompt for ToolID {tool.tool_id} needs about {tokens} tokens, more than the "
+                                  f"per-call budget of {token_budget}.")
+    return prompt
+
+def tool_batch_section(tool: Tool, input_cte: str, input_schema: Schema) -> str:
+    """The same content as build_tool_prompt, as one section of a batched prompt."""
+    return batch_item_section(tool.tool_id, tool.kind, input_cte, _schema_text(tool, input_schema), relevant_config(tool))
@@ -0,0 +1,207 @@
+# resilience.py - Retries, deadlines and hedged requests for model calls
+#
+# ResilientCaller runs one logical call as a series of attempts. Each attempt is started by a
+# callable that returns a Future, e.g. ModelCallScheduler.submit, so retries and hedges are
+# rate-limited like any other call.
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Optional
+
+from model_scheduler import QueueFullError, is_quota_error
+
+class CallTimeoutError(TimeoutError):
+    """An attempt, or the call as a whole, ran past its deadline."""
+
+# Exception class names of transient Google API errors (google.api_core.exceptions)
+_TRANSIENT_ERROR_NAMES = {
+    "ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+    "BadGateway", "Aborted", "RetryError",
+}
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Classifies a failed attempt. Transient server and network errors are retried; invalid requests,
+    permission problems and blocked responses are not, since repeating them cannot help. Neither are quota
+    errors: ModelCallScheduler already requeued the call until its max_quota_retries ran out.
+    """
+    if isinstance(error, QueueFullError):
+        return False  # We are overloaded ourselves; retrying would only add load
+    if is_quota_error(error):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in _TRANSIENT_ERROR_NAMES:
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code >= 500
+
+def _discard(future: Future) -> None:
+    # ScheduledFuture.abandon() also drops a call the scheduler has requeued after a quota error
+    getattr(future, "abandon", future.cancel)()
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 4
+    base_delay: float = 0.5        # Backoff before the second attempt; doubles with every attempt
+    max_delay: float = 8.0
+    attempt_timeout: float = 30.0  # Deadline of a single attempt, hedge included
+    deadline: float = 90.0         # Deadline of the call across all attempts and backoff
+    queue_timeout: float = 600.0   # Longest wait for quota before the first attempt starts
+    hedge_percentile: float = 0.0  # Send a duplicate after this latency percentile (e.g. 0.95); 0 disables hedging
+    hedge_min_delay: float = 0.5
+    hedge_min_samples: int = 20    # Latency samples needed before the percentile is trusted
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Builds a policy from the GEMINI_* retry environment variables."""
+        return cls(
+            max_attempts=int(os.environ.get('GEMINI_MAX_ATTEMPTS', 4)),
+            attempt_timeout=float(os.environ.get('GEMINI_ATTEMPT_TIMEOUT_SECONDS', 30)),
+            deadline=float(os.environ.get('GEMINI_CALL_DEADLINE_SECONDS', 90)),
+            queue_timeout=float(os.environ.get('GEMINI_QUEUE_TIMEOUT_SECONDS', 600)),
+            hedge_percentile=float(os.environ.get('GEMINI_HEDGE_PERCENTILE', 0)),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """'Full jitter' backoff after the given (0-based) failed attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """Returns the q-th (0..1) latency percentile, or None with fewer than min_samples samples."""
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class ResilientCaller:
+    """Runs calls with classified retries, exponential backoff with jitter, deadlines and optional hedging."""
+
+    def __init__(self, policy: Optional[RetryPolicy] = None, latency: Optional[LatencyTracker] = None):
+        self.policy = policy or RetryPolicy()
+        self.latency = latency or LatencyTracker()
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def call(self, start_attempt: Callable[[], Future], hedge: bool = True) -> Any:
+        """
+        Returns the first successful result of start_attempt()'s futures.
+        The attempt timeout runs from when an attempt starts executing, and the overall deadline from when
+        the first one does: time spent queued for quota is not model latency (see _wait_until_started).
+        Args:
+            start_attempt: Starts one attempt and returns its future. Called again for retries and hedges.
+            hedge: Set to False for attempts with side effects that must not overlap, e.g. streamed output.
+        Raises:
+            The last attempt's error when it is not retryable or attempts are exhausted,
+            or CallTimeoutError when the overall deadline passes.
+        """
+        policy = self.policy
+        deadline = None
+        for attempt in range(policy.max_attempts):
+            primary = start_attempt()
+            if not self._wait_until_started(primary, deadline):
+                # Never left the queue: another attempt would only queue behind it
+                _discard(primary)
+                raise CallTimeoutError("Model call was still waiting for quota at its deadline")
+            if deadline is None:
+                deadline = time.monotonic() + policy.deadline
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _discard(primary)
+                raise CallTimeoutError(f"Model call did not succeed within {policy.deadline:.0f}s")
+            try:
+                return self._attempt(start_attempt, primary, min(policy.attempt_timeout, remaining), hedge)
+            except Exception as e:
+                if attempt + 1 >= policy.max_attempts or not is_retryable(e):
+                    raise
+                delay = policy.backoff(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                logging.warning(f"Model call attempt {attempt + 1} failed ({type(e).__name__}: {e}); retrying in {delay:.2f}s")
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+
+    def _wait_until_started(self, future: Future, deadline: Optional[float]) -> bool:
+        """
+        Waits for an attempt to leave the scheduler's queue (ModelCallScheduler futures set `started`).
+        The first attempt may wait up to queue_timeout; later ones no longer than the call's deadline.
+        Returns False if it is still queued by then.
+        """
+        started = getattr(future, "started", None)
+        if started is None:
+            return True
+        timeout = self.policy.queue_timeout if deadline is None else max(0.0, deadline - time.monotonic())
+        return started.wait(timeout)
+
+    def _hedge_delay(self) -> Optional[float]:
+        policy = self.policy
+        if policy.hedge_percentile <= 0:
+            return None
+        observed = self.latency.percentile(policy.hedge_percentile, policy.hedge_min_samples)
+        return None if observed is None else max(policy.hedge_min_delay, observed)
+
+    def _attempt(self, start_attempt: Callable[[], Future], primary: Future, timeout: float, hedge: bool = True) -> Any:
+        # The primary has just started executing; timeout and hedge delay are measured from here
+        started = time.monotonic()
+        ends = started + timeout
+        pending = {primary}
+
+        hedge_delay = self._hedge_delay() if hedge else None
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                # The primary is slower than usual: race a duplicate against it
+                try:
+                    pending.add(start_attempt())
+                except Exception as e:
+                    logging.info(f"Not hedging slow model call: {e}")
+                else:
+                    with self._lock:
+                        self.hedges += 1
+
+        first_error = None
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, ends - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise CallTimeoutError(f"Model call attempt took longer than {timeout:.1f}s")
+                for future in done:
+                    if future.exception() is None:
+                        self.latency.record(time.monotonic() - started)
+                        if future is not primary:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return future.result()
+                    first_error = first_error or future.exception()
+            raise first_error
+        finally:
+            # Drop whatever lost the race; calls already on the wire finish in the background
+            for future in pending:
+                _discard(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {"retries": self.retries, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+        stats["p95_seconds"] = self.latency.percentile(0.95)
+        return stats
@@ -0,0 +1,147 @@
+# schema.py - Schema resolution and propagation through workflow tools
+
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from workflow_ir import SelectField, Tool
+
+# Alteryx's placeholder for "any column not listed in this Select"
+UNKNOWN_FIELD = "*Unknown"
+
+# Alteryx field types -> BigQuery column types
+ALTERYX_TO_BIGQUERY_TYPES = {
+    "bool": "BOOL", "byte": "INT64", "int16": "INT64", "int32": "INT64", "int64": "INT64",
+    "fixeddecimal": "NUMERIC", "float": "FLOAT64", "double": "FLOAT64",
+    "string": "STRING", "wstring": "STRING", "v_string": "STRING", "v_wstring": "STRING",
+    "date": "DATE", "time": "TIME", "datetime": "DATETIME", "blob": "BYTES", "spatialobj": "GEOGRAPHY",
+}
+
+# Used when neither the request, the workflow nor the catalog describes the input
+DEFAULT_SOURCE_COLUMNS = (
+    ("OrderID", "STRING"),
+    ("CustomerName", "STRING"),
+    ("ProductCategory", "STRING"),
+    ("SalesAmount", "FLOAT"),
+)
+
+def bigquery_type(alteryx_type: Optional[str]) -> str:
+    """Maps an Alteryx type name to BigQuery; BigQuery type names pass through unchanged."""
+    if not alteryx_type:
+        return "UNKNOWN"
+    return ALTERYX_TO_BIGQUERY_TYPES.get(alteryx_type.lower(), alteryx_type.upper())
+
+class Schema:
+    """
+    Immutable, ordered column -> type mapping.
+    Tools that leave columns untouched return their input Schema object itself instead of a copy,
+    so per-step schemas cost nothing unless a tool actually changes the columns.
+    """
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns: Sequence[Tuple[str, str]] = ()):
+        self._columns = tuple(columns)
+        self._index = None  # Built on first lookup
+
+    @classmethod
+    def from_mapping(cls, mapping: Dict[str, str]) -> "Schema":
+        return cls(tuple((name, bigquery_type(column_type)) for name, column_type in mapping.items()))
+
+    def _lookup(self) -> Dict[str, str]:
+        if self._index is None:
+            self._index = dict(self._columns)
+        return self._index
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self._lookup().get(name, default)
+
+    def keys(self):
+        return [name for name, _ in self._columns]
+
+    def items(self) -> Tuple[Tuple[str, str], ...]:
+        return self._columns
+
+    def to_dict(self) -> Dict[str, str]:
+        return dict(self._columns)
+
+    def project(self, columns: Sequence[Tuple[str, str, Optional[str]]]) -> "Schema":
+        """
+        Derives the schema of a projection given (source, output, new_type_or_None) triples.
+        Returns self when the projection keeps every column unchanged.
+        """
+        projected = tuple((output, new_type or self.get(source, "UNKNOWN")) for source, output, new_type in columns)
+        return self if projected == self._columns else Schema(projected)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._lookup()
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name, _ in self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Schema) and self._columns == other._columns
+
+    def __hash__(self) -> int:
+        return hash(self._columns)
+
+    def __repr__(self) -> str:
+        return f"Schema({dict(self._columns)!r})"
+
+DEFAULT_SOURCE_SCHEMA = Schema(DEFAULT_SOURCE_COLUMNS)
+
+def select_output_columns(fields: Sequence[SelectField], input_schema: Schema) -> List[Tuple[str, str, Optional[str]]]:
+    """
+    Resolves a Select tool's field list against its input schema.
+    Returns (source_column, output_column, new_bigquery_type_or_None) triples in output order.
+    A selected '*Unknown' entry expands to every input column the Select does not mention explicitly.
+    """
+    listed = {f.name for f in fields}
+    columns = []
+    for f in fields:
+        if not f.selected:
+            continue
+        if f.name == UNKNOWN_FIELD:
+            columns.extend((name, name, None) for name in input_schema if name not in listed)
+        else:
+            columns.append((f.name, f.rename or f.name, bigquery_type(f.type) if f.type else None))
+    return columns
+
+def propagate_schema(tool: Tool, input_schema: Schema) -> Schema:
+    """Returns the schema a tool produces from `input_schema`."""
+    if tool.kind == "Select":
+        return input_schema.project(select_output_columns(tool.fields, input_schema))
+    return input_schema  # Row-level tools such as Filter keep their input columns
+
+class SchemaCatalog:
+    """
+    Local catalog of known input schemas, stored as JSON:
+        {"orders.csv": {"OrderID": "STRING", "SalesAmount": "FLOAT64"}, ...}
+    Keys are matched against an Input tool's file/table name, first exactly, then by base name.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, Dict[str, str]]] = None):
+        self.entries = {name: Schema.from_mapping(columns) for name, columns in (entries or {}).items()}
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> "SchemaCatalog":
+        if not path:
+            return cls()
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not load schema catalog {path}: {e}")
+            return cls()
+
+    def lookup(self, table: Optional[str]) -> Optional[Schema]:
+        if not table:
+            return None
+        if table in self.entries:
+            return self.entries[table]
+        # Input paths often carry a directory and an Alteryx option suffix, e.g. C:\\data\\orders.csv|||Sheet1
+        base_name = os.path.basename(table.replace("\\", "/")).split("|||")[0]
+        return self.entries.get(base_name)
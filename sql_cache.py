@@ -0,0 +1,170 @@
+# sql_cache.py - Content-addressed cache for generated SQL snippets
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Minimum time between two prunes of the disk tier; pruning scans the table, so it is not done on every write
+_DISK_PRUNE_INTERVAL_SECONDS = 60.0
+
+def etag_for(key: str) -> str:
+    """
+    HTTP ETag for a result stored under a content address. It is weak: a regenerated model answer
+    for the same key is equivalent, but not necessarily byte-for-byte identical.
+    """
+    return f'W/"{key}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of an If-None-Match header (a list of ETags) against an ETag. `*` never matches:
+    our ETags name the content of a result, and `*` says nothing about which result the client holds.
+    """
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any((candidate[2:] if candidate.startswith("W/") else candidate) == opaque for candidate in candidates)
+
+class SnippetCache:
+    """
+    Two-tier cache for model output keyed by a hash of the request that produced it.
+    The memory tier is an LRU with TTL and entry/byte limits. The optional disk tier is a
+    SQLite file, so answers survive a restart and can be shared by several processes.
+    """
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 32 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = 24 * 3600, disk_path: Optional[str] = None,
+                 max_disk_entries: Optional[int] = 100_000):
+        """
+        Args:
+            max_entries: Maximum number of entries kept in memory.
+            max_bytes: Maximum total size (UTF-8 bytes of the values) kept in memory.
+            ttl_seconds: Entry lifetime in both tiers. None keeps entries until evicted.
+            disk_path: Path of the SQLite file backing the disk tier. None disables it.
+            max_disk_entries: Maximum number of rows kept on disk; the oldest written are pruned first. None is unbounded.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self._next_disk_prune = 0.0
+        self._entries = OrderedDict()  # key -> (stored_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS snippets (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS snippets_by_age ON snippets (stored_at)")
+            self._db.commit()
+            logging.info(f"SQL snippet cache persisted to {disk_path}")
+
+    @classmethod
+    def from_env(cls) -> "SnippetCache":
+        """Builds a cache configured by the SQL_CACHE_* environment variables."""
+        ttl = os.environ.get('SQL_CACHE_TTL_SECONDS')
+        return cls(
+            max_entries=int(os.environ.get('SQL_CACHE_MAX_ENTRIES', 2048)),
+            max_bytes=int(os.environ.get('SQL_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+            ttl_seconds=float(ttl) if ttl else 24 * 3600,
+            disk_path=os.environ.get('SQL_CACHE_PATH') or None,
+            max_disk_entries=int(os.environ.get('SQL_CACHE_MAX_DISK_ENTRIES', 100_000)),
+        )
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> str:
+        """Returns the content address for a model request."""
+        payload = json.dumps([model_name, prompt, generation_config or {}], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, stored_at FROM snippets WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO snippets (key, value, stored_at) VALUES (?, ?, ?)", (key, value, now))
+                if now >= self._next_disk_prune:
+                    self._prune_disk(now)
+                    self._next_disk_prune = now + _DISK_PRUNE_INTERVAL_SECONDS
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM snippets")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _prune_disk(self, now: float) -> None:
+        # Caller holds the lock. Deletes expired rows, then the oldest rows beyond max_disk_entries.
+        if self.ttl_seconds is not None:
+            self._db.execute("DELETE FROM snippets WHERE stored_at < ?", (now - self.ttl_seconds,))
+        if self.max_disk_entries is not None:
+            excess = self._db.execute("SELECT COUNT(*) FROM snippets").fetchone()[0] - self.max_disk_entries
+            if excess > 0:
+                self._db.execute("DELETE FROM snippets WHERE key IN (SELECT key FROM snippets ORDER BY stored_at LIMIT ?)", (excess,))
+
+    def _store(self, key: str, value: str, stored_at: float) -> None:
+        # Caller holds the lock
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return  # Never evict the whole memory tier for one oversized value
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (stored_at, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    def _remove(self, key: str) -> None:
+        # Caller holds the lock
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
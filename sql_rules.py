@@ -0,0 +1,52 @@
+# sql_rules.py - Deterministic (LLM-free) SQL generation for mechanical Alteryx tools
+
+import re
+from typing import Optional, Sequence
+
+from schema import Schema, select_output_columns
+from workflow_ir import SelectField
+
+_PLAIN_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# BigQuery reserved keywords that must be backtick-quoted when used as column names
+_RESERVED_WORDS = {
+    "ALL", "AND", "ANY", "ARRAY", "AS", "ASC", "ASSERT_ROWS_MODIFIED", "AT", "BETWEEN", "BY", "CASE", "CAST",
+    "COLLATE", "CONTAINS", "CREATE", "CROSS", "CUBE", "CURRENT", "DEFAULT", "DEFINE", "DESC", "DISTINCT", "ELSE",
+    "END", "ENUM", "ESCAPE", "EXCEPT", "EXCLUDE", "EXISTS", "EXTRACT", "FALSE", "FETCH", "FOLLOWING", "FOR",
+    "FROM", "FULL", "GROUP", "GROUPING", "GROUPS", "HASH", "HAVING", "IF", "IGNORE", "IN", "INNER", "INTERSECT",
+    "INTERVAL", "INTO", "IS", "JOIN", "LATERAL", "LEFT", "LIKE", "LIMIT", "LOOKUP", "MERGE", "NATURAL", "NEW", "NO",
+    "NOT", "NULL", "NULLS", "OF", "ON", "OR", "ORDER", "OUTER", "OVER", "PARTITION", "PRECEDING", "PROTO",
+    "QUALIFY", "RANGE", "RECURSIVE", "RESPECT", "RIGHT", "ROLLUP", "ROWS", "SELECT", "SET", "SOME", "STRUCT",
+    "TABLESAMPLE", "THEN", "TO", "TREAT", "TRUE", "UNBOUNDED", "UNION", "UNNEST", "USING", "WHEN", "WHERE",
+    "WINDOW", "WITH", "WITHIN",
+}
+
+def quote_identifier(name: str) -> str:
+    """Returns a BigQuery-safe column reference, backtick-quoting it only when required."""
+    if _PLAIN_IDENTIFIER.match(name) and name.upper() not in _RESERVED_WORDS:
+        return name
+    return "`" + name.replace("\\", "\\\\").replace("`", "\\`") + "`"
+
+def translate_select(fields: Sequence[SelectField], input_schema: Schema) -> Optional[str]:
+    """
+    Builds the SELECT projection for an Alteryx Select tool (without the FROM clause).
+    Returns None when the configuration cannot be translated mechanically.
+    """
+    columns = select_output_columns(fields, input_schema)
+    if not columns:
+        return None  # BigQuery has no empty projection; leave it to the model to explain
+
+    output_names = [output.lower() for _, output, _ in columns]
+    if len(set(output_names)) != len(output_names):
+        return None  # Duplicate output names (BigQuery is case-insensitive) need a human decision
+
+    projections = []
+    for source, output, new_type in columns:
+        expression = quote_identifier(source)
+        if new_type and new_type != input_schema.get(source):
+            expression = f"CAST({expression} AS {new_type})"
+        if expression == quote_identifier(output):
+            projections.append(expression)
+        else:
+            projections.append(f"{expression} AS {quote_identifier(output)}")
+    return "SELECT\n    " + ",\n    ".join(projections)
@@ -0,0 +1,94 @@
+# test_alteryx_expr.py - Tokenizer, parser and BigQuery emitter of the Alteryx expression transpiler
+#
+# Run from the repository root: python -m unittest discover tests
+
+import unittest
+
+from alteryx_expr import (Binary, FieldRef, Literal, UnsupportedExpressionError, iter_nodes, parse_expression,
+                          referenced_fields, tokenize, transpile_expression)
+
+class TokenizeTest(unittest.TestCase):
+    def test_token_kinds(self):
+        tokens = tokenize('[Order Date] >= "2024" AND 1.5e3')
+        self.assertEqual([(t.kind, t.value) for t in tokens],
+                         [('FIELD', '[Order Date]'), ('OP', '>='), ('STRING', '"2024"'), ('IDENT', 'AND'),
+                          ('NUMBER', '1.5e3'), ('EOF', '')])
+
+    def test_comments_are_skipped(self):
+        tokens = tokenize('[a] // trailing\n= /* inline */ 1')
+        self.assertEqual([t.value for t in tokens], ['[a]', '=', '1', ''])
+
+    def test_unexpected_character(self):
+        with self.assertRaises(UnsupportedExpressionError):
+            tokenize('[x] # 1')
+
+class ParserTest(unittest.TestCase):
+    def test_precedence(self):
+        ast = parse_expression('[a] = 1 OR [b] = 2 AND [c] = 3')
+        self.assertIsInstance(ast, Binary)
+        self.assertEqual(ast.op, 'OR')
+        self.assertEqual(ast.right.op, 'AND')
+
+    def test_literals_and_fields(self):
+        ast = parse_expression('[x] > 10')
+        self.assertEqual(ast.left, FieldRef('x'))
+        self.assertEqual(ast.right, Literal('10', 'number'))
+
+    def test_incomplete_expression(self):
+        with self.assertRaises(UnsupportedExpressionError):
+            parse_expression('[x] ==')
+
+    def test_deep_nesting_is_unsupported(self):
+        with self.assertRaises(UnsupportedExpressionError):
+            parse_expression('(' * 3000 + '1' + ')' * 3000)
+
+    def test_referenced_fields_in_first_use_order(self):
+        self.assertEqual(referenced_fields('[b] = 1 OR [a] = [b]'), ['b', 'a'])
+
+    def test_iter_nodes_handles_long_chains(self):
+        expression = ' OR '.join(['[x] = 1'] * 1000)
+        self.assertEqual(sum(1 for _ in iter_nodes(parse_expression(expression))), 999 + 1000 * 3)
+        self.assertEqual(referenced_fields(expression), ['x'])
+
+class EmitterTest(unittest.TestCase):
+    def test_boolean_logic(self):
+        self.assertEqual(transpile_expression('[Name] = "A" AND !IsNull([Age])'), "Name = 'A' AND NOT (Age IS NULL)")
+
+    def test_conditional(self):
+        self.assertEqual(transpile_expression('IF [x] > 1 THEN "big" ELSEIF [x] = 1 THEN "one" ELSE "small" ENDIF'),
+                         "CASE WHEN x > 1 THEN 'big' WHEN x = 1 THEN 'one' ELSE 'small' END")
+
+    def test_in_list(self):
+        self.assertEqual(transpile_expression('[Region] IN ("N", "S")'), "Region IN ('N', 'S')")
+
+    def test_string_addition_uses_schema(self):
+        self.assertEqual(transpile_expression('[A] + [B]', {'A': 'V_String', 'B': 'V_String'}), "CONCAT(A, B)")
+        self.assertEqual(transpile_expression('[a] + [b] * 2'), "a + b * 2")
+
+    def test_tostring_precision(self):
+        self.assertEqual(transpile_expression('ToString([x], 2)'), "FORMAT('%.2f', x)")
+
+    def test_tostring_with_non_numeric_argument_is_unsupported(self):
+        with self.assertRaises(UnsupportedExpressionError):
+            transpile_expression('ToString([x], True)')
+
+    def test_round_to_multiple_keeps_operand_grouping(self):
+        self.assertEqual(transpile_expression('Round([a] + [b], 5)'), "(ROUND((a + b) / (5)) * (5))")
+
+    def test_round_to_multiple_inside_division(self):
+        self.assertEqual(transpile_expression('[a] / Round([x], 2)'), "a / (ROUND((x) / (2)) * (2))")
+
+    def test_substring_offsets(self):
+        self.assertEqual(transpile_expression('Substring([s], 2, 3)'), "SUBSTR(s, 3, 3)")
+        self.assertEqual(transpile_expression('Substring([s], [i] OR 1)'), "SUBSTR(s, (i OR 1) + 1)")
+
+    def test_unknown_function_is_unsupported(self):
+        with self.assertRaises(UnsupportedExpressionError):
+            transpile_expression('Foo([x])')
+
+    def test_long_or_chain_is_unsupported_not_a_crash(self):
+        with self.assertRaises(UnsupportedExpressionError):
+            transpile_expression(' OR '.join(['[x] = 1'] * 1000))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# test_circuit_breaker.py - State transitions of the Vertex AI circuit breaker
+#
+# Run from the repository root: python -m unittest discover tests
+
+import time
+import unittest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    options = dict(window_seconds=30, min_calls=4, failure_rate_threshold=0.5, slow_call_seconds=1.0,
+                   slow_rate_threshold=0.8, open_seconds=0.05, half_open_probes=2)
+    options.update(kwargs)
+    return CircuitBreaker(**options)
+
+def call(breaker: CircuitBreaker, failed: bool = False, latency: float = 0.01) -> None:
+    breaker.before_call()
+    breaker.record(failed=failed, latency=latency)
+
+def trip(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.min_calls):
+        call(breaker, failed=True)
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_stays_closed_below_min_calls(self):
+        breaker = make_breaker()
+        for _ in range(3):
+            call(breaker, failed=True)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_stays_closed_below_failure_rate(self):
+        breaker = make_breaker()
+        for failed in (True, False, False, False, True, False):
+            call(breaker, failed=failed)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_opens_on_failure_rate_and_rejects(self):
+        breaker = make_breaker(open_seconds=60)
+        trip(breaker)
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError) as raised:
+            breaker.before_call()
+        self.assertGreater(raised.exception.retry_after, 50)
+        self.assertEqual(raised.exception.retry_after_header, "60")
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+        self.assertEqual(breaker.stats()["rejected"], 2)
+        self.assertEqual(breaker.stats()["times_opened"], 1)
+
+    def test_opens_on_slow_calls(self):
+        breaker = make_breaker()
+        for _ in range(4):
+            call(breaker, latency=5.0)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_half_open_after_cool_down(self):
+        breaker = make_breaker()
+        trip(breaker)
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        breaker.check()  # Does not raise once probes are allowed
+
+    def test_half_open_limits_probes_in_flight(self):
+        breaker = make_breaker()
+        trip(breaker)
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_successful_probes_close(self):
+        breaker = make_breaker()
+        trip(breaker)
+        time.sleep(0.06)
+        call(breaker)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        call(breaker)
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.stats()["recent_calls"], 0)
+
+    def test_failed_probe_reopens(self):
+        breaker = make_breaker()
+        trip(breaker)
+        time.sleep(0.06)
+        call(breaker, failed=True)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.stats()["times_opened"], 2)
+
+    def test_slow_probe_reopens(self):
+        breaker = make_breaker()
+        trip(breaker)
+        time.sleep(0.06)
+        call(breaker, latency=5.0)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_straggler_while_open_is_ignored(self):
+        breaker = make_breaker(open_seconds=60)
+        breaker.before_call()  # Admitted while closed
+        trip(breaker)
+        breaker.record(failed=False, latency=0.01)
+        self.assertEqual(breaker.state, OPEN)
+
+if __name__ == "__main__":
+    unittest.main()
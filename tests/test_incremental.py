@@ -0,0 +1,91 @@
+# test_incremental.py - Reuse of unchanged tools' SQL between conversions of the same workflow_id
+#
+# Run from the repository root: python -m unittest discover tests
+#
+# The agent's _send_prompt is replaced, so no Vertex AI SDK or credentials are needed.
+
+import unittest
+
+from agent2 import AlteryxToBigQueryAgent
+from sql_cache import SnippetCache
+
+def workflow(filter3: str = "[Amount] > 10", filter5: str = "[Amount] > 50", rename: str = "OrderID") -> str:
+    """Input 1 -> Select 2 -> Filter 3 -> Filter 4, with a second branch Select 2 -> Filter 5."""
+    return f'''<AlteryxDocument><Nodes>
+<Node ToolID="1"><GuiSettings Plugin="AlteryxBasePluginsGui.DbFileInput.DbFileInput"/><Properties><Configuration><File>orders.csv</File></Configuration><MetaInfo connection="Output"><RecordInfo><Field name="Order ID" type="Int32"/><Field name="Amount" type="Double"/></RecordInfo></MetaInfo></Properties></Node>
+<Node ToolID="2"><GuiSettings Plugin="AlteryxBasePluginsGui.AlteryxSelect.AlteryxSelect"/><Properties><Configuration><SelectFields><SelectField field="Order ID" selected="True" rename="{rename}"/><SelectField field="*Unknown" selected="True"/></SelectFields></Configuration></Properties></Node>
+<Node ToolID="3"><GuiSettings Plugin="AlteryxBasePluginsGui.Filter.Filter"/><Properties><Configuration><Expression>{filter3}</Expression></Configuration></Properties></Node>
+<Node ToolID="4"><GuiSettings Plugin="AlteryxBasePluginsGui.Filter.Filter"/><Properties><Configuration><Expression>[Amount] &lt; 1000</Expression></Configuration></Properties></Node>
+<Node ToolID="5"><GuiSettings Plugin="AlteryxBasePluginsGui.Filter.Filter"/><Properties><Configuration><Expression>{filter5}</Expression></Configuration></Properties></Node>
+</Nodes><Connections>
+<Connection><Origin ToolID="1" Connection="Output"/><Destination ToolID="2" Connection="Input"/></Connection>
+<Connection><Origin ToolID="2" Connection="Output"/><Destination ToolID="3" Connection="Input"/></Connection>
+<Connection><Origin ToolID="3" Connection="Output"/><Destination ToolID="4" Connection="Input"/></Connection>
+<Connection><Origin ToolID="2" Connection="Output"/><Destination ToolID="5" Connection="Input"/></Connection>
+</Connections></AlteryxDocument>'''
+
+class IncrementalConversionTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = AlteryxToBigQueryAgent(
+            "project", "us-central1", translation_mode="llm", cache=SnippetCache(max_entries=0, max_bytes=0),
+            result_cache=SnippetCache(), conversion_store=SnippetCache())
+        self.prompts = []
+        self.agent._send_prompt = self.fake_send_prompt
+
+    def fake_send_prompt(self, prompt, on_text=None, model_name=None):
+        self.prompts.append(prompt)
+        if "Filter" in prompt:
+            return "WHERE Amount > 1"
+        return "SELECT\n    *"
+
+    def convert(self, xml: str, workflow_id: str = "orders"):
+        """Returns the conversion result and the number of prompts it sent."""
+        sent = len(self.prompts)
+        result = self.agent.convert_alteryx_to_sql(xml, workflow_id=workflow_id)
+        self.assertTrue(result["sql"], result["message"])
+        return result, len(self.prompts) - sent
+
+    def tool_sources(self, xml: str, workflow_id: str = "orders"):
+        events = self.agent.convert_alteryx_to_sql_events(xml, workflow_id=workflow_id)
+        return {event["tool_id"]: event["source"] for event in events if event["event"] == "tool"}
+
+    def test_first_conversion_translates_every_tool(self):
+        _, sent = self.convert(workflow())
+        self.assertEqual(sent, 4)
+
+    def test_unchanged_tools_are_reused(self):
+        self.convert(workflow())
+        _, sent = self.convert(workflow(filter5="[Amount] > 60"))
+        self.assertEqual(sent, 1)
+
+    def test_edited_tool_and_its_descendants_are_retranslated(self):
+        self.convert(workflow())
+        sources = self.tool_sources(workflow(filter3="[Amount] > 20"))
+        self.assertEqual(sources, {"2": "previous", "3": "model", "4": "model", "5": "previous"})
+
+    def test_schema_change_upstream_invalidates_downstream_tools(self):
+        self.convert(workflow())
+        _, sent = self.convert(workflow(rename="OrderNumber"))
+        self.assertEqual(sent, 4)
+
+    def test_other_workflow_ids_do_not_reuse(self):
+        self.convert(workflow())
+        _, sent = self.convert(workflow(filter5="[Amount] > 60"), workflow_id="other")
+        self.assertEqual(sent, 4)
+
+    def test_reused_sql_matches_a_fresh_conversion(self):
+        self.convert(workflow())
+        edited = workflow(filter3="[Amount] > 20")
+        incremental, _ = self.convert(edited)
+        fresh, _ = self.convert(edited, workflow_id="fresh")
+        self.assertEqual(incremental["sql"], fresh["sql"])
+
+    def test_result_cache_hit_still_records_the_conversion(self):
+        self.convert(workflow(), workflow_id="first")
+        _, sent = self.convert(workflow(), workflow_id="second")
+        self.assertEqual(sent, 0)
+        _, sent = self.convert(workflow(filter5="[Amount] > 60"), workflow_id="second")
+        self.assertEqual(sent, 1)
+
+if __name__ == "__main__":
+    unittest.main()
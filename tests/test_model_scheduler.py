@@ -0,0 +1,167 @@
+# test_model_scheduler.py - Token buckets, priorities, fair sharing and quota requeueing of model calls
+#
+# Run from the repository root: python -m unittest discover tests
+#
+# Tests start from drained buckets, so every call queues and the dispatcher releases one per refilled
+# request token, in scheduling order; a single worker then runs them in that order.
+
+import threading
+import time
+import unittest
+from concurrent.futures import CancelledError
+
+from model_scheduler import (PRIORITY_BATCH, PRIORITY_INTERACTIVE, CallContext, ModelCallScheduler, QueueFullError,
+                             TokenBucket, is_quota_error)
+
+class QuotaExceeded(Exception):
+    """Stands in for google.api_core's 429 error."""
+
+    def __init__(self):
+        super().__init__("429 Quota exceeded for aiplatform.googleapis.com")
+
+def make_scheduler(**kwargs) -> ModelCallScheduler:
+    options = dict(requests_per_minute=1200, tokens_per_minute=1_000_000, max_workers=1)
+    options.update(kwargs)
+    scheduler = ModelCallScheduler(**options)
+    scheduler.request_bucket.drain()
+    return scheduler
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the scheduler")
+        time.sleep(0.01)
+
+class TokenBucketTest(unittest.TestCase):
+    def test_starts_full_and_consumes(self):
+        bucket = TokenBucket(rate_per_minute=60)
+        self.assertEqual(bucket.time_until(60), 0.0)
+        bucket.consume(60)
+        self.assertAlmostEqual(bucket.time_until(1), 1.0, delta=0.05)
+
+    def test_drain_empties_the_bucket(self):
+        bucket = TokenBucket(rate_per_minute=600)
+        bucket.drain()
+        self.assertAlmostEqual(bucket.time_until(10), 1.0, delta=0.05)
+
+    def test_oversized_request_waits_for_a_full_bucket_only(self):
+        bucket = TokenBucket(rate_per_minute=60)
+        self.assertEqual(bucket.time_until(1000), 0.0)
+        bucket.consume(1000)
+        self.assertGreaterEqual(bucket.tokens, 0.0)
+
+class IsQuotaErrorTest(unittest.TestCase):
+    def test_classification(self):
+        self.assertTrue(is_quota_error(QuotaExceeded()))
+        self.assertTrue(is_quota_error(type("ResourceExhausted", (Exception,), {})("")))
+        self.assertFalse(is_quota_error(ValueError("invalid argument")))
+
+class ModelCallSchedulerTest(unittest.TestCase):
+    def test_interactive_calls_run_before_batch_calls(self):
+        scheduler = make_scheduler()
+        order = []
+        futures = [scheduler.submit(lambda n=n: order.append(n), 10, CallContext(PRIORITY_BATCH, "bulk")) for n in ("b1", "b2")]
+        futures.append(scheduler.submit(lambda: order.append("i1"), 10, CallContext(PRIORITY_INTERACTIVE, "user")))
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(order, ["i1", "b1", "b2"])
+
+    def test_callers_take_turns_within_a_priority(self):
+        scheduler = make_scheduler()
+        order = []
+        futures = []
+        for caller in ("a", "b"):
+            for n in range(3):
+                futures.append(scheduler.submit(lambda name=f"{caller}{n}": order.append(name), 10, CallContext(PRIORITY_BATCH, caller)))
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(order, ["a0", "b0", "a1", "b1", "a2", "b2"])
+
+    def test_token_quota_delays_large_calls(self):
+        scheduler = ModelCallScheduler(requests_per_minute=6000, tokens_per_minute=6000, max_workers=1)
+        started = time.monotonic()
+        scheduler.call(lambda: None, 6000)
+        scheduler.call(lambda: None, 600)  # Needs 0.1s of refill
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_queue_full(self):
+        scheduler = make_scheduler(requests_per_minute=60, max_queue_size=2)
+        scheduler.submit(lambda: None, 10)
+        scheduler.submit(lambda: None, 10)
+        with self.assertRaises(QueueFullError):
+            scheduler.submit(lambda: None, 10)
+
+    def test_cancelled_call_is_dropped_without_spending_quota(self):
+        scheduler = make_scheduler()
+        ran = []
+        cancelled = scheduler.submit(lambda: ran.append("cancelled"), 10)
+        kept = scheduler.submit(lambda: ran.append("kept"), 10)
+        self.assertTrue(cancelled.cancel())
+        kept.result(timeout=5)
+        self.assertEqual(ran, ["kept"])
+        self.assertEqual(scheduler.stats()["dispatched"], 1)
+
+    def test_started_is_set_when_the_call_runs(self):
+        scheduler = make_scheduler(requests_per_minute=120)
+        release = threading.Event()
+        future = scheduler.submit(release.wait, 10)
+        self.assertFalse(future.started.is_set())
+        self.assertTrue(future.started.wait(5))
+        release.set()
+        future.result(timeout=5)
+
+    def test_quota_error_requeues_the_call(self):
+        scheduler = make_scheduler()
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise QuotaExceeded()
+            return "ok"
+        self.assertEqual(scheduler.submit(flaky, 10).result(timeout=5), "ok")
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(scheduler.stats()["quota_retries"], 1)
+
+    def test_quota_error_fails_once_retries_are_exhausted(self):
+        scheduler = make_scheduler(max_quota_retries=1)
+        attempts = []
+
+        def exhausted():
+            attempts.append(1)
+            raise QuotaExceeded()
+        with self.assertRaises(QuotaExceeded):
+            scheduler.submit(exhausted, 10).result(timeout=5)
+        self.assertEqual(len(attempts), 2)
+
+    def test_abandoned_requeued_call_is_dropped(self):
+        scheduler = make_scheduler(requests_per_minute=120)  # A requeued call waits 0.5s for quota
+        attempts = []
+
+        def exhausted():
+            attempts.append(1)
+            raise QuotaExceeded()
+        future = scheduler.submit(exhausted, 10)
+        wait_for(lambda: scheduler.stats()["quota_retries"] == 1)
+        self.assertTrue(future.running())  # Requeued: too late for Future.cancel()
+        future.abandon()
+        with self.assertRaises(CancelledError):
+            future.result(timeout=5)
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(scheduler.stats()["queued"], 0)
+
+    def test_call_abandoned_while_running_is_not_requeued(self):
+        scheduler = make_scheduler()
+        holder = {}
+
+        def exhausted():
+            holder["future"].abandon()  # Its caller timed out while the call was on the wire
+            raise QuotaExceeded()
+        holder["future"] = future = scheduler.submit(exhausted, 10)
+        with self.assertRaises(QuotaExceeded):
+            future.result(timeout=5)
+        self.assertEqual(scheduler.stats()["quota_retries"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+# test_resilience.py - Retry classification, deadlines and hedging of ResilientCaller
+#
+# Run from the repository root: python -m unittest discover tests
+
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from model_scheduler import ModelCallScheduler, QueueFullError
+from resilience import CallTimeoutError, LatencyTracker, ResilientCaller, RetryPolicy, is_retryable
+
+class QuotaExceeded(Exception):
+    def __init__(self):
+        super().__init__("429 Quota exceeded for aiplatform.googleapis.com")
+
+class ServerError(Exception):
+    code = 503
+
+def fast_policy(**kwargs) -> RetryPolicy:
+    options = dict(max_attempts=3, base_delay=0.01, max_delay=0.02, attempt_timeout=2.0, deadline=5.0)
+    options.update(kwargs)
+    return RetryPolicy(**options)
+
+class IsRetryableTest(unittest.TestCase):
+    def test_transient_errors_are_retried(self):
+        self.assertTrue(is_retryable(ConnectionError("reset")))
+        self.assertTrue(is_retryable(CallTimeoutError("slow")))
+        self.assertTrue(is_retryable(ServerError()))
+        self.assertTrue(is_retryable(type("ServiceUnavailable", (Exception,), {})("")))
+
+    def test_permanent_errors_are_not_retried(self):
+        self.assertFalse(is_retryable(ValueError("invalid argument")))
+        self.assertFalse(is_retryable(QueueFullError("full")))
+
+    def test_quota_errors_are_left_to_the_scheduler(self):
+        self.assertFalse(is_retryable(QuotaExceeded()))
+        self.assertFalse(is_retryable(type("ResourceExhausted", (Exception,), {})("")))
+
+class LatencyTrackerTest(unittest.TestCase):
+    def test_percentile_needs_min_samples(self):
+        tracker = LatencyTracker()
+        for seconds in (0.1, 0.2, 0.3, 0.4):
+            tracker.record(seconds)
+        self.assertIsNone(tracker.percentile(0.5, min_samples=5))
+        self.assertEqual(tracker.percentile(0.5), 0.3)
+        self.assertEqual(tracker.percentile(0.99), 0.4)
+
+class ResilientCallerTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.release = threading.Event()  # Lets deliberately slow attempts finish at tearDown
+        self.attempts = 0
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown(wait=True)
+
+    def start(self, outcomes):
+        """Returns a start_attempt whose n-th attempt runs outcomes[n]: a value, an exception, or a callable."""
+        def start_attempt():
+            outcome = outcomes[min(self.attempts, len(outcomes) - 1)]
+            self.attempts += 1
+
+            def run():
+                if isinstance(outcome, BaseException):
+                    raise outcome
+                return outcome() if callable(outcome) else outcome
+            return self.executor.submit(run)
+        return start_attempt
+
+    def slow(self, result="slow"):
+        def run():
+            self.release.wait(5)
+            return result
+        return run
+
+    def test_first_success_is_returned(self):
+        caller = ResilientCaller(fast_policy())
+        self.assertEqual(caller.call(self.start(["ok"])), "ok")
+        self.assertEqual(caller.stats()["retries"], 0)
+
+    def test_transient_errors_are_retried(self):
+        caller = ResilientCaller(fast_policy())
+        self.assertEqual(caller.call(self.start([ConnectionError("reset"), ServerError(), "ok"])), "ok")
+        self.assertEqual(self.attempts, 3)
+        self.assertEqual(caller.stats()["retries"], 2)
+
+    def test_last_error_is_raised_when_attempts_run_out(self):
+        caller = ResilientCaller(fast_policy())
+        with self.assertRaises(ConnectionError):
+            caller.call(self.start([ConnectionError("reset")]))
+        self.assertEqual(self.attempts, 3)
+
+    def test_permanent_error_is_not_retried(self):
+        caller = ResilientCaller(fast_policy())
+        with self.assertRaises(ValueError):
+            caller.call(self.start([ValueError("invalid argument"), "ok"]))
+        self.assertEqual(self.attempts, 1)
+
+    def test_quota_error_is_not_retried(self):
+        caller = ResilientCaller(fast_policy())
+        with self.assertRaises(QuotaExceeded):
+            caller.call(self.start([QuotaExceeded(), "ok"]))
+        self.assertEqual(self.attempts, 1)
+
+    def test_slow_attempt_times_out_and_is_retried(self):
+        caller = ResilientCaller(fast_policy(attempt_timeout=0.1))
+        self.assertEqual(caller.call(self.start([self.slow(), "ok"])), "ok")
+        self.assertEqual(self.attempts, 2)
+
+    def test_overall_deadline(self):
+        caller = ResilientCaller(fast_policy(max_attempts=10, attempt_timeout=0.1, deadline=0.25))
+        started = time.monotonic()
+        with self.assertRaises(CallTimeoutError):
+            caller.call(self.start([self.slow()]))
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertLess(self.attempts, 10)
+
+    def test_hedge_wins_against_a_slow_primary(self):
+        latency = LatencyTracker()
+        for _ in range(5):
+            latency.record(0.01)
+        caller = ResilientCaller(fast_policy(hedge_percentile=0.95, hedge_min_delay=0.05, hedge_min_samples=5), latency)
+        self.assertEqual(caller.call(self.start([self.slow(), "hedged"])), "hedged")
+        self.assertEqual(caller.stats()["hedges"], 1)
+        self.assertEqual(caller.stats()["hedge_wins"], 1)
+
+    def test_no_hedge_without_enough_samples_or_when_disabled(self):
+        latency = LatencyTracker()
+        for _ in range(5):
+            latency.record(0.01)
+        policy = fast_policy(attempt_timeout=0.3, hedge_percentile=0.95, hedge_min_delay=0.05, hedge_min_samples=5)
+        caller = ResilientCaller(policy, latency)
+        self.assertEqual(caller.call(self.start([self.slow(), "ok"]), hedge=False), "ok")
+        self.assertEqual(caller.stats()["hedges"], 0)
+        untrained = ResilientCaller(policy)
+        self.assertEqual(untrained.call(self.start([self.slow(), "ok"])), "ok")
+        self.assertEqual(untrained.stats()["hedges"], 0)
+
+class QueuedAttemptTest(unittest.TestCase):
+    def test_time_queued_for_quota_does_not_count_against_the_attempt(self):
+        scheduler = ModelCallScheduler(requests_per_minute=120, max_workers=1)
+        scheduler.request_bucket.drain()  # The call waits 0.5s for quota
+        caller = ResilientCaller(fast_policy(attempt_timeout=0.2, deadline=0.3))
+        self.assertEqual(caller.call(lambda: scheduler.submit(lambda: "ok", 10)), "ok")
+        self.assertEqual(caller.stats()["retries"], 0)
+
+    def test_call_still_queued_at_the_queue_timeout_is_not_retried(self):
+        scheduler = ModelCallScheduler(requests_per_minute=6, max_workers=1)
+        scheduler.request_bucket.drain()  # The call would wait 10s for quota
+        caller = ResilientCaller(fast_policy(queue_timeout=0.1))
+        futures = []
+
+        def start_attempt():
+            futures.append(scheduler.submit(lambda: "ok", 10))
+            return futures[-1]
+        with self.assertRaisesRegex(CallTimeoutError, "waiting for quota"):
+            caller.call(start_attempt)
+        self.assertEqual(len(futures), 1)
+        self.assertTrue(futures[0].cancelled())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+# workflow_graph.py - Workflow DAG built from Alteryx <Connections>
+
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+from workflow_ir import Connection, tool_id_sort_key
+
+class WorkflowCycleError(ValueError):
+    """Raised when the workflow connections do not form a DAG."""
+
+class WorkflowGraph:
+    """
+    Directed acyclic graph of a workflow's tools.
+    Edges are (origin_tool, origin_anchor) -> (destination_tool, destination_anchor), matching
+    Alteryx's Connection elements, e.g. a Filter's 'True'/'False' outputs feeding two tools.
+    """
+
+    def __init__(self, tool_ids: Iterable[str], connections: Iterable[Connection]):
+        """
+        Args:
+            tool_ids: Every tool in the workflow. Tools only mentioned by connections are added too.
+            connections: The workflow's Connection records.
+        """
+        self.tool_ids = []
+        self.outgoing: Dict[str, List[Tuple[str, str, str]]] = {}  # tool -> [(origin_anchor, destination, destination_anchor)]
+        self.incoming: Dict[str, List[Tuple[str, str, str]]] = {}  # tool -> [(origin, origin_anchor, destination_anchor)]
+        self.in_degree: Dict[str, int] = {}
+        for tool_id in tool_ids:
+            self._add_tool(tool_id)
+        for connection in connections:
+            origin, destination = connection.origin, connection.destination
+            self._add_tool(origin)
+            self._add_tool(destination)
+            self.outgoing[origin].append((connection.origin_anchor, destination, connection.destination_anchor))
+            self.incoming[destination].append((origin, connection.origin_anchor, connection.destination_anchor))
+            self.in_degree[destination] += 1
+
+    @classmethod
+    def linear_chain(cls, tool_ids: List[str]) -> "WorkflowGraph":
+        """Builds the implicit chain used when a workflow carries no connections: each tool feeds the next."""
+        connections = [Connection(origin=a, destination=b) for a, b in zip(tool_ids, tool_ids[1:])]
+        return cls(tool_ids, connections)
+
+    def _add_tool(self, tool_id: str) -> None:
+        if tool_id not in self.in_degree:
+            self.tool_ids.append(tool_id)
+            self.outgoing[tool_id] = []
+            self.incoming[tool_id] = []
+            self.in_degree[tool_id] = 0
+
+    _sort_key = staticmethod(tool_id_sort_key)
+
+    def topological_order(self) -> List[str]:
+        """Kahn's algorithm in O(V + E). Ties are broken by ToolID so the order is deterministic."""
+        remaining = dict(self.in_degree)
+        ready = deque(sorted((t for t, degree in remaining.items() if degree == 0), key=self._sort_key))
+        order = []
+        while ready:
+            tool_id = ready.popleft()
+            order.append(tool_id)
+            for _, destination, _ in self.outgoing[tool_id]:
+                remaining[destination] -= 1
+                if remaining[destination] == 0:
+                    ready.append(destination)
+        if len(order) != len(remaining):
+            cyclic = sorted((t for t, degree in remaining.items() if degree > 0), key=self._sort_key)
+            raise WorkflowCycleError(f"Workflow connections contain a cycle through ToolIDs {', '.join(cyclic)}")
+        return order
+
+    def levels(self) -> List[List[str]]:
+        """Groups tools into generations; tools in the same generation do not depend on each other."""
+        depth = {}
+        for tool_id in self.topological_order():
+            depth[tool_id] = max((depth[origin] + 1 for origin, _, _ in self.incoming[tool_id]), default=0)
+        generations: List[List[str]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+        for tool_id in sorted(depth, key=self._sort_key):
+            generations[depth[tool_id]].append(tool_id)
+        return generations
+
+    def independent_branches(self) -> List[List[str]]:
+        """Weakly connected components, each in topological order. Branches share no tools."""
+        component = {}
+        for tool_id in self.tool_ids:
+            if tool_id in component:
+                continue
+            stack = [tool_id]
+            component[tool_id] = tool_id
+            while stack:
+                current = stack.pop()
+                neighbours = [d for _, d, _ in self.outgoing[current]] + [o for o, _, _ in self.incoming[current]]
+                for neighbour in neighbours:
+                    if neighbour not in component:
+                        component[neighbour] = tool_id
+                        stack.append(neighbour)
+        branches: Dict[str, List[str]] = {}
+        for tool_id in self.topological_order():
+            branches.setdefault(component[tool_id], []).append(tool_id)
+        return list(branches.values())
@@ -0,0 +1,81 @@
+# workflow_ir.py - Typed intermediate representation shared by parsing, planning, caching and SQL generation
+
+import functools
+import sys
+from dataclasses import dataclass, field
+from typing import ClassVar, Optional, Tuple
+
+def tool_id_sort_key(tool_id: str) -> tuple:
+    """Orders ToolIDs numerically, with any non-numeric IDs after the numeric ones."""
+    return (0, int(tool_id), "") if tool_id.isdigit() else (1, 0, tool_id)
+
+@dataclass(frozen=True, slots=True)
+class SourceSpan:
+    """Byte range of a tool inside the workflow source; the XML text is only decoded when asked for."""
+    source: bytes = field(repr=False)
+    start: int
+    end: int
+
+    def text(self) -> str:
+        return self.source[self.start:self.end].decode("utf-8")
+
+@dataclass(frozen=True, slots=True)
+class Tool:
+    """
+    Base class for parsed tools. Instances are immutable and hashable on their semantic content;
+    the raw XML span is excluded from equality, so two identical tools compare equal wherever they came from.
+    """
+    kind: ClassVar[str] = ""
+    tool_id: str
+    span: Optional[SourceSpan] = field(default=None, compare=False, repr=False)
+
+    @property
+    def xml_snippet(self) -> str:
+        return self.span.text() if self.span is not None else ""
+
+@dataclass(frozen=True, slots=True)
+class SelectField:
+    name: str
+    selected: bool
+    rename: Optional[str] = None
+    type: Optional[str] = None  # Alteryx type the Select converts the field to, if any
+
+    @staticmethod
+    def create(name: str, selected: bool, rename: Optional[str] = None, type: Optional[str] = None) -> "SelectField":
+        """Returns a shared instance; identical fields recur across tools and workflows."""
+        return _shared_select_field(name, selected, rename or None, type or None)
+
+@functools.lru_cache(maxsize=65536)
+def _shared_select_field(name: str, selected: bool, rename: Optional[str], type: Optional[str]) -> SelectField:
+    return SelectField(sys.intern(name), selected, sys.intern(rename) if rename else None, type)
+
+@dataclass(frozen=True, slots=True)
+class SelectTool(Tool):
+    kind: ClassVar[str] = "Select"
+    fields: Tuple[SelectField, ...] = ()
+
+@dataclass(frozen=True, slots=True)
+class FilterTool(Tool):
+    kind: ClassVar[str] = "Filter"
+    expression: Optional[str] = None
+
+@dataclass(frozen=True, slots=True)
+class InputTool(Tool):
+    """A data source. Its columns come from the workflow's MetaInfo, when the designer saved it."""
+    kind: ClassVar[str] = "Input"
+    table: Optional[str] = None
+    fields: Tuple[Tuple[str, str], ...] = ()  # (name, Alteryx type) pairs
+
+@dataclass(frozen=True, slots=True)
+class GenericTool(Tool):
+    """A tool kept only as its raw configuration, as used by the single-prompt converter in agent.py."""
+    kind: ClassVar[str] = "Generic"
+    tool_name: Optional[str] = None
+    config_xml: Optional[str] = None
+
+@dataclass(frozen=True, slots=True)
+class Connection:
+    origin: str
+    destination: str
+    origin_anchor: str = "Output"
+    destination_anchor: str = "Input"
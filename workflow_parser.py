@@ -0,0 +1,160 @@
+# workflow_parser.py - Single-pass structural parser for Alteryx workflow XML
+
+import logging
+import re
+import sys
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from workflow_ir import Connection, FilterTool, InputTool, SelectField, SelectTool, SourceSpan, Tool, tool_id_sort_key
+
+# Tool kind -> (IR class, extractor(node, configuration) returning the kind-specific constructor arguments)
+TOOL_EXTRACTORS: Dict[str, Tuple[Type[Tool], Callable[[ET.Element, Optional[ET.Element]], dict]]] = {}
+
+# GuiSettings plugins of real .yxmd files, mapped to the tool type names used by the extractors
+PLUGIN_TOOL_TYPES = {
+    "AlteryxBasePluginsGui.AlteryxSelect.AlteryxSelect": "Select",
+    "AlteryxBasePluginsGui.Filter.Filter": "Filter",
+    "AlteryxBasePluginsGui.DbFileInput.DbFileInput": "Input",
+}
+
+WORKFLOW_ROOT_TAGS = ("AlteryxWorkflow", "AlteryxDocument")
+
+_NODE_END_TAG = re.compile(rb"</Node\s*>")
+
+class _NotAWorkflow(Exception):
+    """Aborts parsing as soon as the root element turns out not to be a workflow."""
+
+def register_tool_extractor(tool_class: Type[Tool]):
+    """
+    Decorator registering the extractor for one IR tool class under its kind.
+    The extractor returns the class's type-specific constructor arguments. Adding a type never adds a document scan.
+    """
+    def decorator(extractor):
+        TOOL_EXTRACTORS[tool_class.kind] = (tool_class, extractor)
+        return extractor
+    return decorator
+
+def node_tool_type(node: ET.Element) -> Optional[str]:
+    """Returns the tool type from the simplified Type attribute or from the .yxmd GuiSettings plugin."""
+    tool_type = node.get("Type")
+    if tool_type:
+        return tool_type
+    gui_settings = node.find("GuiSettings")
+    if gui_settings is not None:
+        return PLUGIN_TOOL_TYPES.get(gui_settings.get("Plugin"))
+    return None
+
+def _node_configuration(node: ET.Element) -> Optional[ET.Element]:
+    config = node.find("Configuration")
+    return config if config is not None else node.find("Properties/Configuration")
+
+@register_tool_extractor(SelectTool)
+def _extract_select(node: ET.Element, config: Optional[ET.Element]) -> dict:
+    fields = []
+    if config is not None:
+        # Simplified format: <Field Name= Selected= Rename= />
+        for field in config.iter("Field"):
+            if field.get("Name") is None:
+                continue
+            fields.append(SelectField.create(field.get("Name"), field.get("Selected") == 'True', field.get("Rename"), field.get("Type")))
+        # .yxmd format: <SelectField field= selected= rename= />
+        for field in config.iter("SelectField"):
+            fields.append(SelectField.create(field.get("field"), field.get("selected") == 'True', field.get("rename"), field.get("type")))
+    return {'fields': tuple(fields)}
+
+@register_tool_extractor(FilterTool)
+def _extract_filter(node: ET.Element, config: Optional[ET.Element]) -> dict:
+    expression = config.findtext("Expression") if config is not None else None
+    return {'expression': expression}
+
+@register_tool_extractor(InputTool)
+def _extract_input(node: ET.Element, config: Optional[ET.Element]) -> dict:
+    table = None
+    if config is not None:
+        table = (config.findtext("File") or config.findtext("Table") or "").strip() or None
+    record_info = node.find(".//MetaInfo/RecordInfo")
+    fields = ()
+    if record_info is not None:
+        fields = tuple((sys.intern(f.get("name")), f.get("type")) for f in record_info.iter("Field") if f.get("name"))
+    return {'table': table, 'fields': fields}
+
+def _connection_record(connection: ET.Element) -> Optional[Connection]:
+    origin = connection.find("Origin")
+    destination = connection.find("Destination")
+    if origin is None or destination is None or not origin.get("ToolID") or not destination.get("ToolID"):
+        return None
+    return Connection(
+        origin=origin.get("ToolID"),
+        destination=destination.get("ToolID"),
+        origin_anchor=origin.get("Connection", "Output"),
+        destination_anchor=destination.get("Connection", "Input"),
+    )
+
+def parse_workflow(xml_string: str) -> Tuple[List[Tool], List[Connection], str]:
+    """
+    Parses an Alteryx workflow in one structural pass, dispatching each Node to the extractor
+    registered for its type as soon as the Node closes. Nodes of unregistered types, or without a ToolID, are skipped.
+    Tools only keep the byte span of their XML; the snippet is decoded when something asks for it.
+    Returns:
+        The IR tools sorted by ToolID, the workflow's connections and a status message for the user.
+    """
+    source = xml_string.strip().encode("utf-8")
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    builder = ET.TreeBuilder()
+    open_nodes = []  # Byte offset of each open <Node> start tag
+    tools = []
+    connections = []
+    seen_root = []
+
+    def start_element(tag, attributes):
+        if not seen_root:
+            seen_root.append(tag)
+            if tag not in WORKFLOW_ROOT_TAGS:
+                raise _NotAWorkflow()
+        builder.start(tag, attributes)
+        if tag == "Node":
+            open_nodes.append(parser.CurrentByteIndex)
+
+    def end_element(tag):
+        node = builder.end(tag)
+        if tag == "Connection":
+            connection = _connection_record(node)
+            if connection is not None:
+                connections.append(connection)
+            return
+        if tag != "Node":
+            return
+        start = open_nodes.pop()
+        registered = TOOL_EXTRACTORS.get(node_tool_type(node))
+        if registered is None or not node.get("ToolID"):
+            return
+        tool_class, extractor = registered
+        # The end event points at </Node>, or just past the tag for an empty <Node ... />
+        end = parser.CurrentByteIndex
+        end_tag = _NODE_END_TAG.match(source, end)
+        if end_tag:
+            end = end_tag.end()
+        tools.append(tool_class(tool_id=node.get("ToolID"), span=SourceSpan(source, start, end),
+                                **extractor(node, _node_configuration(node))))
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = builder.data
+    try:
+        parser.Parse(source, True)
+    except expat.ExpatError as e:
+        logging.info(f"Workflow XML could not be parsed: {e}")
+        return [], [], f"Error: Invalid Alteryx Workflow XML structure ({e}). Please ensure it's wrapped in <AlteryxWorkflow> tags."
+    except _NotAWorkflow:
+        return [], [], "Error: Invalid Alteryx Workflow XML structure. Please ensure it's wrapped in <AlteryxWorkflow> tags."
+
+    # Sort tools by ToolID to maintain workflow order
+    tools.sort(key=lambda tool: tool_id_sort_key(tool.tool_id))
+
+    if not any(not isinstance(tool, InputTool) for tool in tools):
+        return [], connections, "No recognizable 'Select' or 'Filter' tools found in the provided XML. I can only process these for now."
+
+    return tools, connections, "XML parsed successfully. Beginning conversion..."